@@ -9,7 +9,7 @@ function zapper {
     while [[ -f ${_filename:="$_tmpdir/bash.$$.$RANDOM"} ]] ; do
         unset _filename
     done
-    env ZAPPER_TARGET_TRANSLATOR="bash:${_filename}" PYTHONPATH="${PYTHONPATH}:${ZAPPER_HOME_DIR}/lib/python" ${ZAPPER_HOME_DIR}/bin/zapper "$@"
+    env ZAPPER_SHELL_PID="$$" ZAPPER_TARGET_TRANSLATOR="bash:${_filename}" PYTHONPATH="${PYTHONPATH}:${ZAPPER_HOME_DIR}/lib/python" ${ZAPPER_HOME_DIR}/bin/zapper "$@"
     if [[ -f ${_filename} ]] ; then
         #echo "---> $_filename"
         #cat "$_filename"
@@ -33,3 +33,46 @@ test_path_remove = Product('test_path_remove', '')
 test_path_remove_1 = Package(test_path_remove, '1')
 test_path_remove_1.path_remove("TEST_PATH_REMOVE", "TEST_PATH_REMOVE_ITEM")
 
+
+test_req_base = Product('test_req_base', '')
+test_req_base_1 = Package(test_req_base, '1')
+test_req_base_1.var_set("TEST_REQ_BASE", "TEST_REQ_BASE_VALUE")
+
+test_req_top = Product('test_req_top', '')
+test_req_top_1 = Package(test_req_top, '1')
+test_req_top_1.requires(NAME == 'test_req_base')
+test_req_top_1.var_set("TEST_REQ_TOP", "TEST_REQ_TOP_VALUE")
+
+# wide catalog: only the lowest version of test_wide_lib has its requirement
+test_wide_base = Product('test_wide_base', '')
+test_wide_base_1 = Package(test_wide_base, '1')
+
+test_wide_lib = Product('test_wide_lib', '')
+for version in range(1, 101):
+    test_wide_lib_n = Package(test_wide_lib, str(version))
+    test_wide_lib_n.requires((NAME == 'test_wide_base') & (VERSION == str(version)))
+
+test_wide_aux = Product('test_wide_aux', '')
+for version in range(1, 101):
+    test_wide_aux_n = Package(test_wide_aux, str(version))
+
+test_wide_app = Product('test_wide_app', '')
+test_wide_app_1 = Package(test_wide_app, '1')
+test_wide_app_1.requires(NAME == 'test_wide_lib')
+test_wide_app_1.requires(NAME == 'test_wide_aux')
+test_wide_app_1.var_set("TEST_WIDE_APP", "TEST_WIDE_APP_VALUE")
+
+test_conflict_a = Product('test_conflict_a', '')
+test_conflict_a_1 = Package(test_conflict_a, '1')
+test_conflict_a_1.conflicts(NAME == 'test_conflict_b')
+test_conflict_a_1.var_set("TEST_CONFLICT_A", "TEST_CONFLICT_A_VALUE")
+
+test_conflict_b = Product('test_conflict_b', '')
+test_conflict_b_1 = Package(test_conflict_b, '1')
+test_conflict_b_1.var_set("TEST_CONFLICT_B", "TEST_CONFLICT_B_VALUE")
+
+test_conflict_c = Product('test_conflict_c', '')
+test_conflict_c_1 = Package(test_conflict_c, '1')
+test_conflict_c_1.add_conflicting_tag('test-conflict-tag')
+test_conflict_c_2 = Package(test_conflict_c, '2')
+test_conflict_c_2.add_conflicting_tag('test-conflict-tag')
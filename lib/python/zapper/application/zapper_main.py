@@ -44,6 +44,7 @@ import collections
 
 from .helper import Helper
 from ..manager import Manager
+from ..session import Session
 from ..errors import SessionConfigError
 from ..utils.debug import set_quiet, set_verbose, set_debug, LOGGER
 from ..utils.trace import set_trace, trace
@@ -51,8 +52,9 @@ from ..utils.install_data import set_home_dir, set_admin_user, set_version, get_
 from ..utils.argparse_autocomplete import autocomplete_monkey_patch
 from ..utils.strings import string_to_bool
 
-_ZAPPER_COMPLETE_FUNCTION = string_to_bool(os.environ.get("ZAPPER_COMPLETE_FUNCTION", "False"))
-_ZAPPER_QUIET_MODE = string_to_bool(os.environ.get("ZAPPER_QUIET_MODE", "False"))
+def _get_env_flag(varname):
+    # read at each call, since the daemon executes many commands
+    return string_to_bool(os.environ.get(varname, "False"))
 
 def _set_global_flags(enable_complete_function, *, quiet, verbose, debug, trace):
     if enable_complete_function:
@@ -81,7 +83,7 @@ def create_manager():
         sys.exit(1)
 
     _set_global_flags(
-        _ZAPPER_COMPLETE_FUNCTION or _ZAPPER_QUIET_MODE,
+        _get_env_flag("ZAPPER_COMPLETE_FUNCTION") or _get_env_flag("ZAPPER_QUIET_MODE"),
         quiet=manager.get_config_key('quiet'),
         verbose=manager.get_config_key('verbose'),
         debug=manager.get_config_key('debug'),
@@ -98,9 +100,6 @@ def create_manager():
             LOGGER.critical("Session is corrupted. Unset environment variable ZAPPER_SESSION and try again with a new session.")
         sys.exit(1)
 
-    if manager.translation_name is None:
-        LOGGER.critical("Translation is not defined. Zapper environment is not complete. Try sourcing {!r}".format(get_zapper_profile()))
-        sys.exit(2)
     return manager
 
 def create_top_level_parser(manager):
@@ -452,6 +451,31 @@ Change the current session""",
         help="copy sessions")
     parser_session_copy.set_defaults(function=manager.copy_sessions)
 
+    parser_session_migrate = session_subparsers.add_parser("migrate",
+        parents=[common_parser],
+        formatter_class=Formatter,
+        help="migrate all the sessions to another session store")
+    parser_session_migrate.set_defaults(function=manager.migrate_sessions)
+    parser_session_migrate.add_argument("session_store",
+        choices=Session.SESSION_STORES,
+        help="target session store")
+    parser_session_migrate.add_argument("--remove",
+        dest="remove",
+        action="store_true",
+        default=False,
+        help="remove the migrated sessions from the current session store")
+
+    parser_session_gc = session_subparsers.add_parser("gc",
+        parents=[common_parser],
+        formatter_class=Formatter,
+        help="delete the temporary sessions of dead shells")
+    parser_session_gc.set_defaults(function=manager.gc_sessions)
+    parser_session_gc.add_argument("--simulate",
+        dest="simulate",
+        action="store_true",
+        default=False,
+        help="show only the number of sessions to delete")
+
     for subparser in (parser_session_load, ):
         subparser.add_argument("session_name",
             type=manager.SessionName,
@@ -520,6 +544,37 @@ Change the current session""",
             help="sync current session")
         parser_sync.set_defaults(function=manager.sync_session)
 
+    ### Daemon subparser
+    parser_daemon = top_level_subparsers.add_parser("daemon",
+        aliases=[],
+        parents=[common_parser],
+        formatter_class=Formatter,
+        help="resident zapper daemon")
+
+    daemon_subparsers = parser_daemon.add_subparsers(
+        description="Daemon subcommand.")
+
+    parser_daemon_start = daemon_subparsers.add_parser("start",
+        aliases=[],
+        parents=[common_parser],
+        formatter_class=Formatter,
+        help="start the daemon")
+    parser_daemon_start.set_defaults(function=manager.start_daemon)
+
+    parser_daemon_stop = daemon_subparsers.add_parser("stop",
+        aliases=[],
+        parents=[common_parser],
+        formatter_class=Formatter,
+        help="stop the daemon")
+    parser_daemon_stop.set_defaults(function=manager.stop_daemon)
+
+    parser_daemon_status = daemon_subparsers.add_parser("status",
+        aliases=[],
+        parents=[common_parser],
+        formatter_class=Formatter,
+        help="show the daemon status")
+    parser_daemon_status.set_defaults(function=manager.show_daemon_status)
+
     for option in package_options:
         parser_package_option_show = {}
         for subparsers in package_option_subparsers[option], host_package_option_subparsers[option], user_package_option_subparsers[option], session_package_option_subparsers[option]:
@@ -728,8 +783,18 @@ Change the current session""",
 [Resolution aggressivity level]:
   > 0: missing requirements are searched in available packages
   > 1: missing requirements are searched in defined packages
+
+[Resolver]:
+  greedy:       the highest version of each missing requirement is loaded
+  backtracking: candidate versions are searched with backtracking,
+                and ranked by preferences and version defaults
 """)
     parser_package_load.set_defaults(function=manager.load_package_labels)
+    parser_package_load.add_argument("--resolver",
+        dest="resolver",
+        choices=Session.RESOLVERS,
+        default=None,
+        help="resolver used to search missing requirements")
 
     parser_package_unload = top_level_subparsers.add_parser("unload",
         aliases=[],
@@ -749,12 +814,38 @@ Change the current session""",
         help="unload all loaded packages from current session")
     parser_package_clear.set_defaults(function=manager.clear_packages)
 
+    parser_package_run = top_level_subparsers.add_parser("run",
+        parents=[common_parser],
+        formatter_class=Formatter,
+        help="run a command with packages loaded",
+        epilog="""\
+The packages are loaded in memory on top of the current session, then
+the command is executed in the resulting environment; the session is not
+changed.
+""")
+    parser_package_run.set_defaults(function=manager.run_command, volatile=True)
+    parser_package_run.add_argument("--package", "-p",
+        dest="package_labels",
+        action="append",
+        default=[],
+        help="package name (can be repeated)")
+    parser_package_run.add_argument("--resolver",
+        dest="resolver",
+        choices=Session.RESOLVERS,
+        default=None,
+        help="resolver used to search missing requirements")
+    parser_package_run.add_argument("command",
+        nargs=argparse.REMAINDER,
+        help="command and arguments")
+
     for key, subparser in ('load', parser_package_load), ('unload', parser_package_unload):
         subparser.add_argument("package_labels",
             type=str,
             nargs='+',
             default=None,
             help="package name")
+
+    for key, subparser in ('load', parser_package_load), ('unload', parser_package_unload), ('run', parser_package_run):
         subparser.add_argument("--resolve", "-r",
             dest="resolution_level",
             action="count",
@@ -779,7 +870,7 @@ Change the current session""",
             default=False,
             help="{0} sticky packages".format(subparser_name))
 
-    for parser in (parser_package_load, parser_package_show_package, parser_package_show_available_packages):
+    for parser in (parser_package_load, parser_package_run, parser_package_show_package, parser_package_show_available_packages):
         parser.set_defaults(complete_function=manager.complete_available_packages, complete_add_arguments=['dummy'])
 
     for parser in (parser_package_unload, ):
@@ -802,12 +893,17 @@ def zapper_main():
     args = top_level_parser.parse_args()
 
     _set_global_flags(
-        _ZAPPER_COMPLETE_FUNCTION,
+        _get_env_flag("ZAPPER_COMPLETE_FUNCTION"),
         quiet=args.quiet,
         verbose=args.verbose,
         debug=args.debug,
         trace=args.trace,
     )
+    volatile = getattr(args, 'volatile', False)
+    if manager.translation_name is None and not volatile:
+        LOGGER.critical("Translation is not defined. Zapper environment is not complete. Try sourcing {!r}".format(get_zapper_profile()))
+        sys.exit(2)
+
     manager.set_dry_run(args.dry_run)
     manager.set_force(args.force)
     manager.set_show_header(args.show_header, args.show_header_if_empty)
@@ -834,11 +930,11 @@ def zapper_main():
                 'dry_run', 'force', 'show_header', 'show_header_if_empty', 'show_translation',
                 'package_format', 'session_format', 'package_dir_format',
                 'package_sort_keys', 'package_dir_sort_keys', 'session_sort_keys',
-                'complete_function', 'complete_add_arguments'}:
+                'complete_function', 'complete_add_arguments', 'volatile'}:
         if key in n_args:
             del n_args[key]
 
-    manager.initialize()
+    manager.initialize(volatile=volatile)
 
     complete_function = getattr(args, 'complete_function', None)
     if complete_function and os.environ.get("ZAPPER_COMPLETE_FUNCTION", ""):
@@ -862,7 +958,8 @@ def zapper_main():
             LOGGER.critical("{0}: {1}".format(exc_type.__name__, exc_value))
             sys.exit(1)
         else:
-            manager.finalize()
+            if not volatile:
+                manager.finalize()
 
 if __name__ == "__main__":
     zapper_main()
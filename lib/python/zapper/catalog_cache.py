@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+#
+# Copyright 2013 Simone Campagna
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+__author__ = 'Simone Campagna'
+
+__all__ = ['CatalogCache', 'CATALOG_CACHE']
+
+import io
+import os
+import types
+import pickle
+import hashlib
+import tempfile
+import collections
+
+from .package import Package
+from .product import Product
+from .suite import Suite, ROOT
+from .utils.debug import LOGGER
+from .utils.trace import trace
+
+
+def _is_zapper_module(module_name):
+    return module_name in CatalogUnpickler.SAFE_MODULES or module_name == 'zapper' or module_name.startswith('zapper.')
+
+
+class CatalogPickler(pickle.Pickler):
+    """CatalogPickler(file, package_dirs)
+Products defined outside package_dirs are stored by name; foreign
+packages, functions and classes (for instance hooks defined in the
+package files) make the catalog not cacheable."""
+    def __init__(self, file, package_dirs):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self._package_dirs = set(package_dirs)
+
+    def persistent_id(self, obj):
+        if obj is ROOT:
+            return ('suite', ROOT.name)
+        elif isinstance(obj, Package):
+            if not obj.source_dir in self._package_dirs:
+                raise pickle.PicklingError("package {} is defined in {}".format(obj, obj.source_dir))
+        elif isinstance(obj, Product):
+            if not obj.source_dir in self._package_dirs:
+                return ('product', obj.name)
+        elif isinstance(obj, (type, types.FunctionType, types.BuiltinFunctionType)):
+            if not _is_zapper_module(obj.__module__):
+                raise pickle.PicklingError("{!r} is defined in module {}".format(obj, obj.__module__))
+        return None
+
+
+class CatalogUnpickler(pickle.Unpickler):
+    SAFE_MODULES = {'builtins', 'copyreg', 'collections'}
+
+    def persistent_load(self, pid):
+        kind, name = pid
+        if kind == 'suite':
+            return ROOT
+        elif kind == 'product':
+            product = Product.get_product(name)
+            if product is None:
+                raise pickle.UnpicklingError("undefined product {!r}".format(name))
+            return product
+        else:
+            raise pickle.UnpicklingError("invalid persistent id {!r}".format(pid))
+
+    def find_class(self, module_name, name):
+        if not _is_zapper_module(module_name):
+            raise pickle.UnpicklingError("forbidden global {}.{}".format(module_name, name))
+        return super().find_class(module_name, name)
+
+
+class CatalogCache(object):
+    """CatalogCache(cache_dir=None)
+Persistent cache of the packages defined in a package directory. Each
+cache file is keyed by a fingerprint of the paths, mtimes and sizes of the
+package files, so that an unchanged directory can be restored without
+executing any package file."""
+    CACHE_VERSION = 2
+    CACHE_SUFFIX = '.catalog'
+    def __init__(self, cache_dir=None):
+        self._cache_dir = cache_dir
+        self._not_cacheable = {}
+        self._resident = None
+
+    def set_cache_dir(self, cache_dir):
+        self._cache_dir = cache_dir
+
+    def set_resident(self, resident):
+        """set_resident(resident)
+When resident, the packages of the loaded package directories are kept
+registered in memory and reused while their fingerprint is unchanged"""
+        if resident:
+            if self._resident is None:
+                self._resident = collections.OrderedDict()
+        else:
+            self._resident = None
+
+    @property
+    def resident(self):
+        return self._resident is not None
+
+    def resident_package_dirs(self):
+        """resident_package_dirs() -> list of resident package directories"""
+        if self._resident is None:
+            return []
+        return list(self._resident.keys())
+
+    def get_resident(self, package_dir, fingerprint):
+        """get_resident(package_dir, fingerprint) -> package_dirs or None
+Returns the package directories of a resident package_dir; if package_dir
+has changed, its packages are unregistered"""
+        if self._resident is None or not package_dir in self._resident:
+            return None
+        resident_fingerprint, package_dirs = self._resident[package_dir]
+        if resident_fingerprint == fingerprint:
+            return package_dirs
+        LOGGER.info("package directory {} has changed".format(package_dir))
+        del self._resident[package_dir]
+        self.forget(package_dirs)
+        return None
+
+    def add_resident(self, package_dir, fingerprint, package_dirs):
+        """add_resident(package_dir, fingerprint, package_dirs)"""
+        if self._resident is not None:
+            self._resident[package_dir] = (fingerprint, tuple(package_dirs))
+
+    @classmethod
+    def forget(cls, package_dirs):
+        """forget(package_dirs)
+Unregisters all the packages and products defined in package_dirs"""
+        package_dirs = set(package_dirs)
+        package_registry = Package.registry('package_dir')
+        for p_dir in package_dirs:
+            if p_dir in package_registry:
+                del package_registry[p_dir]
+        product_registry = Product.registry('name')
+        for name, product in list(product_registry.items()):
+            if product.source_dir in package_dirs:
+                del product_registry[name]
+        suites = [ROOT]
+        for packages in package_registry.values():
+            suites.extend(package for package in packages if isinstance(package, Suite))
+        for suite in suites:
+            for package in list(suite.packages()):
+                if package.source_dir in package_dirs:
+                    suite.remove_package(package)
+
+    @property
+    def cache_dir(self):
+        return self._cache_dir
+
+    @property
+    def enabled(self):
+        return self._cache_dir is not None
+
+    @classmethod
+    def fingerprint(cls, package_dir, module_paths):
+        """fingerprint(package_dir, module_paths) -> fingerprint string"""
+        h = hashlib.sha1()
+        h.update("{}\0{}\0".format(cls.CACHE_VERSION, package_dir).encode('utf-8', 'surrogateescape'))
+        for module_path in module_paths:
+            st = os.stat(module_path)
+            h.update("{}\0{}\0{}\0".format(module_path, st.st_mtime_ns, st.st_size).encode('utf-8', 'surrogateescape'))
+        return h.hexdigest()
+
+    def cache_file(self, package_dir):
+        key = hashlib.sha1(package_dir.encode('utf-8', 'surrogateescape')).hexdigest()
+        return os.path.join(self._cache_dir, key + self.CACHE_SUFFIX)
+
+    def load(self, package_dir, fingerprint):
+        """load(package_dir, fingerprint) -> package_dirs or None
+Restores and registers the cached packages of package_dir"""
+        if not self.enabled:
+            return None
+        cache_file = self.cache_file(package_dir)
+        try:
+            with open(cache_file, "rb") as f_in:
+                header = pickle.load(f_in)
+                if header != (self.CACHE_VERSION, package_dir, fingerprint):
+                    LOGGER.debug("catalog cache {} is out of date".format(cache_file))
+                    return None
+                catalog = CatalogUnpickler(f_in).load()
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            trace()
+            LOGGER.debug("cannot load catalog cache {}: {}: {}".format(cache_file, e.__class__.__name__, e))
+            return None
+        if catalog is None:
+            # package_dir is known not to be cacheable
+            self._not_cacheable[package_dir] = fingerprint
+            return None
+        package_dirs = self._register_catalog(catalog)
+        LOGGER.info("loaded package directory {} from catalog cache".format(package_dir))
+        return package_dirs
+
+    @classmethod
+    def _make_catalog(cls, package_dirs):
+        products = [product for product in Product.registry('name').values() if product.source_dir in package_dirs]
+        package_dir_packages = [(p_dir, list(Package.registered_entry('package_dir', p_dir))) for p_dir in package_dirs]
+        return (package_dirs, products, package_dir_packages)
+
+    @classmethod
+    def _register_catalog(cls, catalog):
+        package_dirs, products, package_dir_packages = catalog
+        for p_dir, packages in package_dir_packages:
+            for package in packages:
+                package.register()
+                if package.suite is ROOT:
+                    ROOT.add_package(package)
+        return package_dirs
+
+    @classmethod
+    def dumps(cls, package_dirs):
+        """dumps(package_dirs) -> bytes
+Pickles the packages already registered for package_dirs; raises
+pickle.PicklingError if they cannot be pickled"""
+        f_out = io.BytesIO()
+        CatalogPickler(f_out, package_dirs).dump(cls._make_catalog(package_dirs))
+        return f_out.getvalue()
+
+    @classmethod
+    def loads(cls, data):
+        """loads(data) -> package_dirs
+Restores and registers packages pickled by dumps()"""
+        return cls._register_catalog(CatalogUnpickler(io.BytesIO(data)).load())
+
+    def store(self, package_dir, fingerprint, package_dirs):
+        """store(package_dir, fingerprint, package_dirs)
+Stores the packages already registered for package_dirs"""
+        if not self.enabled or self._not_cacheable.get(package_dir, None) == fingerprint:
+            return
+        catalog = self._make_catalog(package_dirs)
+        if not os.path.lexists(self._cache_dir):
+            os.makedirs(self._cache_dir)
+        cache_file = self.cache_file(package_dir)
+        fd, tmp_file = tempfile.mkstemp(dir=self._cache_dir, prefix='.', suffix=self.CACHE_SUFFIX)
+        try:
+            with os.fdopen(fd, "wb") as f_out:
+                pickle.dump((self.CACHE_VERSION, package_dir, fingerprint), f_out, protocol=pickle.HIGHEST_PROTOCOL)
+                try:
+                    CatalogPickler(f_out, package_dirs).dump(catalog)
+                except (pickle.PicklingError, TypeError, AttributeError) as e:
+                    LOGGER.info("package directory {} cannot be cached: {}".format(package_dir, e))
+                    f_out.seek(0)
+                    f_out.truncate()
+                    pickle.dump((self.CACHE_VERSION, package_dir, fingerprint), f_out, protocol=pickle.HIGHEST_PROTOCOL)
+                    pickle.dump(None, f_out, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_file, cache_file)
+        except Exception as e:
+            trace()
+            LOGGER.warning("cannot store catalog cache {}: {}: {}".format(cache_file, e.__class__.__name__, e))
+            if os.path.lexists(tmp_file):
+                os.remove(tmp_file)
+
+CATALOG_CACHE = CatalogCache()
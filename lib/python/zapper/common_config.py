@@ -34,6 +34,8 @@ COMMON_CONFIG = {
     'package_dir_sort_keys': '',
     'session_sort_keys': '',
     'resolution_level': '',
+    'resolver': '',
+    'translation_mode': '',
     'enable_default_version': '',
     'enable_relative_packages': '',
     'show_header': '',
@@ -48,6 +50,21 @@ USER_HOST_CONFIG['default_session'] = ''
 USER_HOST_CONFIG['default_packages'] = ''
 USER_HOST_CONFIG['persistent_sessions_dir'] = ''
 USER_HOST_CONFIG['temporary_sessions_dir'] = ''
+USER_HOST_CONFIG['session_store'] = ''
+USER_HOST_CONFIG['session_db_journal_mode'] = ''
+USER_HOST_CONFIG['session_gc'] = ''
+USER_HOST_CONFIG['session_gc_interval'] = ''
+USER_HOST_CONFIG['session_gc_min_age'] = ''
+USER_HOST_CONFIG['session_gc_max_age'] = ''
+USER_HOST_CONFIG['catalog_cache'] = ''
+USER_HOST_CONFIG['resolution_cache'] = ''
+USER_HOST_CONFIG['resolution_cache_size'] = ''
+USER_HOST_CONFIG['resolution_cache_shared_dir'] = ''
+USER_HOST_CONFIG['lazy_loading'] = ''
+USER_HOST_CONFIG['config_snapshot'] = ''
+USER_HOST_CONFIG['daemon_idle_timeout'] = ''
+USER_HOST_CONFIG['loader_processes'] = ''
+USER_HOST_CONFIG['undo_log'] = ''
 
 VERSION_DEFAULTS = {
 }
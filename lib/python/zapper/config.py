@@ -17,8 +17,11 @@
 
 __author__ = 'Simone Campagna'
 
+import io
 import os
+import stat
 import datetime
+import tempfile
 import configparser
 
 from .lock_file import Lock
@@ -29,9 +32,13 @@ class Config(configparser.ConfigParser):
     def __init__(self, filename=None):
         super().__init__()
         self.filename = filename
-        if self.filename and os.path.lexists(self.filename):
+        self._stored_data = None
+        if self.exists():
             self.load()
         self.set_defaults()
+        if self._stored_data is not None:
+            # missing defaults do not need to be stored
+            self._stored_data = self._dump()
 
     def set_defaults(self):
         lst = [(self, self.__defaults__)]
@@ -52,11 +59,69 @@ class Config(configparser.ConfigParser):
     def current_time(cls):
         return datetime.datetime.now().strftime("%Y%m%d %H:%M:%S")
 
+    def _dump(self):
+        stream = io.StringIO()
+        self.write(stream)
+        return stream.getvalue()
+
+    def is_dirty(self):
+        """is_dirty() -> True if the config has been changed since the last load/store"""
+        return self._dump() != self._stored_data
+
+    def copy_config(self, config):
+        """copy_config(config)
+Copies the raw content of config"""
+        self.read_string(config._dump())
+
+    def exists(self):
+        return bool(self.filename) and os.path.lexists(self.filename)
+
     def load(self):
-        with Lock(self.filename, "r") as f_in:
-            self.read_file(f_in, self.filename)
+        self.read_string(self._load_data(), self.filename)
+        self._stored_data = self._dump()
 
     def store(self):
-        with Lock(self.filename, "w") as f_out:
-            self.write(f_out)
+        """store()
+Writes the config, only if it has been changed"""
+        data = self._dump()
+        if data == self._stored_data:
+            return
+        self._store_data(data)
+        self._stored_data = data
+
+    def _load_data(self):
+        # no lock is needed: writers replace the file atomically
+        with open(self.filename, "r") as f_in:
+            return f_in.read()
+
+    @classmethod
+    def get_lock_filename(cls, filename):
+        """get_lock_filename(filename) -> the lock file of filename
+Writers cannot lock the file they replace: they lock a stable sidecar file"""
+        filename = os.path.realpath(filename)
+        return os.path.join(os.path.dirname(filename), '.' + os.path.basename(filename) + '.lock')
 
+    def _store_data(self, data):
+        # the file is replaced atomically, so that readers never see a
+        # partially written file
+        filename = os.path.realpath(self.filename)
+        dirname = os.path.dirname(filename)
+        with Lock(self.get_lock_filename(filename), "w"):
+            if os.path.lexists(filename):
+                with open(filename, "r") as f_in:
+                    if f_in.read() == data:
+                        return
+                file_mode = stat.S_IMODE(os.stat(filename).st_mode)
+            else:
+                umask = os.umask(0)
+                os.umask(umask)
+                file_mode = 0o666 & ~umask
+            fd, tmp_filename = tempfile.mkstemp(dir=dirname, prefix='.' + os.path.basename(filename) + '.', suffix='.tmp')
+            try:
+                with open(fd, "w") as f_out:
+                    f_out.write(data)
+                os.chmod(tmp_filename, file_mode)
+                os.replace(tmp_filename, filename)
+            except BaseException:
+                os.remove(tmp_filename)
+                raise
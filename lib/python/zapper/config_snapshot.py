@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+#
+# Copyright 2013 Simone Campagna
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+__author__ = 'Simone Campagna'
+
+__all__ = ['ConfigSnapshot']
+
+import os
+import json
+import tempfile
+
+from .utils.debug import LOGGER
+from .utils.trace import trace
+
+
+class ConfigSnapshot(object):
+    """ConfigSnapshot(snapshot_file)
+Snapshot of the effective config merged from the host and user config
+files; the snapshot is valid as long as the signature of the config files
+(inode, size and modification time) does not change."""
+    SNAPSHOT_VERSION = 1
+    def __init__(self, snapshot_file):
+        self.snapshot_file = snapshot_file
+
+    @classmethod
+    def get_signature(cls, filenames):
+        """get_signature(filenames) -> signature list
+Missing files (or None filenames) have signature None"""
+        signature = []
+        for filename in filenames:
+            file_signature = None
+            if filename:
+                try:
+                    st = os.stat(filename)
+                    file_signature = [st.st_ino, st.st_size, st.st_mtime_ns]
+                except OSError:
+                    pass
+            signature.append([filename, file_signature])
+        return signature
+
+    def load(self, signature):
+        """load(signature) -> snapshot data, or None if missing or out of date"""
+        try:
+            with open(self.snapshot_file, "r") as f_in:
+                snapshot = json.load(f_in)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            trace()
+            LOGGER.debug("cannot load config snapshot {}: {}: {}".format(self.snapshot_file, e.__class__.__name__, e))
+            return None
+        if snapshot.get('version', None) != self.SNAPSHOT_VERSION or snapshot.get('signature', None) != signature:
+            LOGGER.debug("config snapshot {} is out of date".format(self.snapshot_file))
+            return None
+        return snapshot['data']
+
+    def store(self, signature, data):
+        """store(signature, data)
+Writes the snapshot atomically"""
+        snapshot_dir = os.path.dirname(self.snapshot_file)
+        tmp_file = None
+        try:
+            if not os.path.lexists(snapshot_dir):
+                os.makedirs(snapshot_dir)
+            fd, tmp_file = tempfile.mkstemp(dir=snapshot_dir, prefix='.', suffix='.snapshot')
+            with os.fdopen(fd, "w") as f_out:
+                json.dump({'version': self.SNAPSHOT_VERSION, 'signature': signature, 'data': data}, f_out)
+            os.replace(tmp_file, self.snapshot_file)
+        except Exception as e:
+            trace()
+            LOGGER.debug("cannot store config snapshot {}: {}: {}".format(self.snapshot_file, e.__class__.__name__, e))
+            if tmp_file is not None and os.path.lexists(tmp_file):
+                os.remove(tmp_file)
+
+    def remove(self):
+        """remove()
+Removes the snapshot, if any"""
+        try:
+            os.remove(self.snapshot_file)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            LOGGER.debug("cannot remove config snapshot {}: {}: {}".format(self.snapshot_file, e.__class__.__name__, e))
+
+    def __repr__(self):
+        return "{c}({f!r})".format(c=self.__class__.__name__, f=self.snapshot_file)
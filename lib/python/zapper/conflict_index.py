@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+#
+# Copyright 2013 Simone Campagna
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+__author__ = 'Simone Campagna'
+
+__all__ = ['ConflictIndex']
+
+import collections
+
+from .package_expressions import cached_index_keys
+
+
+def _package_keys(package):
+    yield ('name', package.name)
+    yield ('absolute_name', package.absolute_name)
+    yield ('absolute_label', package.absolute_label)
+    for tag in package.tags:
+        yield ('tag', str(tag))
+
+
+class ConflictIndex(object):
+    """ConflictIndex(packages)
+Index of the conflicts of a fixed list of packages (usually the loaded
+ones). The conflict expressions of the packages (including the product
+self-conflicts and the conflicting tags) are indexed by the name,
+absolute name, absolute label or tag of the packages they can match; the
+packages are indexed by the same keys, so that the conflicts of a
+candidate package are found through set lookups. Expressions that cannot
+be indexed are evaluated on each candidate."""
+    def __init__(self, packages):
+        self._packages = list(packages)
+        self.labels = tuple(package.absolute_label for package in self._packages)
+        self._ordinals = {}
+        self._packages_index = collections.defaultdict(list)
+        self._conflicts_index = collections.defaultdict(list)
+        self._unindexed_conflicts = []
+        for ordinal, package in enumerate(self._packages):
+            self._ordinals[package.absolute_label] = ordinal
+            for key in _package_keys(package):
+                self._packages_index[key].append(package)
+            for expression_index, expression in enumerate(package.get_conflicts()):
+                entry = (ordinal, expression_index, package, expression)
+                keys = cached_index_keys(expression, tags=True)
+                if keys is None:
+                    self._unindexed_conflicts.append(entry)
+                else:
+                    for key in keys:
+                        self._conflicts_index[key].append(entry)
+
+    def _candidate_packages(self, expression):
+        keys = cached_index_keys(expression, tags=True)
+        if keys is None:
+            return self._packages
+        packages = {}
+        for key in keys:
+            for package in self._packages_index.get(key, ()):
+                packages[package.absolute_label] = package
+        return sorted(packages.values(), key=lambda package: self._ordinals[package.absolute_label])
+
+    def match_conflicts(self, package):
+        """match_conflicts(package) -> list of (pkg0, expression, pkg1)
+Same as package.match_conflicts(packages)"""
+        conflicts = []
+        for expression in package.get_conflicts():
+            function = expression.get_function()
+            for pkg in self._candidate_packages(expression):
+                if pkg is not package and function(pkg):
+                    conflicts.append((package, expression, pkg))
+        entries = {}
+        for key in _package_keys(package):
+            for entry in self._conflicts_index.get(key, ()):
+                entries[entry[:2]] = entry
+        for entry in self._unindexed_conflicts:
+            entries[entry[:2]] = entry
+        for ordinal, expression_index, pkg, expression in sorted(entries.values(), key=lambda entry: entry[:2]):
+            if pkg is not package and expression.get_function()(package):
+                conflicts.append((pkg, expression, package))
+        return conflicts
+
+    def is_conflicting(self, package):
+        """is_conflicting(package) -> bool"""
+        for expression in package.get_conflicts():
+            function = expression.get_function()
+            for pkg in self._candidate_packages(expression):
+                if pkg is not package and function(pkg):
+                    return True
+        for key in _package_keys(package):
+            for ordinal, expression_index, pkg, expression in self._conflicts_index.get(key, ()):
+                if pkg is not package and expression.get_function()(package):
+                    return True
+        for ordinal, expression_index, pkg, expression in self._unindexed_conflicts:
+            if pkg is not package and expression.get_function()(package):
+                return True
+        return False
@@ -0,0 +1,381 @@
+#!/usr/bin/env python3
+#
+# Copyright 2013 Simone Campagna
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+__author__ = 'Simone Campagna'
+
+__all__ = ['ZapperDaemon', 'start_daemon', 'stop_daemon', 'get_daemon_status']
+
+import os
+import sys
+import json
+import time
+import signal
+import select
+import socket
+import struct
+import argparse
+import importlib
+import subprocess
+
+from .daemon_client import DAEMON_PROTOCOL, get_daemon_socket, send_message, recv_message, daemon_request
+from .catalog_cache import CATALOG_CACHE
+from .session import Session
+from .session_gc import set_shell_pid
+from .category import Category
+from .utils.debug import LOGGER
+from .utils.trace import trace
+from .utils.install_data import set_home_dir, set_admin_user, set_version, get_home_dir, get_admin_user, get_version
+
+
+class ZapperDaemon(object):
+    """ZapperDaemon(socket_path, *, idle_timeout=None)
+Resident zapper server. The packages of the loaded package directories are
+kept registered in the server process; each command is executed in a
+forked child, so that it starts with an already populated catalog but
+cannot alter the server state. Package directories loaded by a child
+are then loaded in the server, in order to be available to the following
+commands; changed package directories are detected by fingerprint.
+Children are collected asynchronously, so that a slow command does not
+delay the following ones."""
+    def __init__(self, socket_path, *, idle_timeout=None):
+        self.socket_path = socket_path
+        if idle_timeout is not None and idle_timeout <= 0:
+            idle_timeout = None
+        self.idle_timeout = idle_timeout
+        self.start_time = time.time()
+        self.num_requests = 0
+        self._server_socket = None
+        self._stop = False
+        self._children = {} # pipe fd -> (pid, env, data chunks)
+        self._running = {} # pid -> [connection, status sent by the child]
+        self._wakeup_r_fd = None
+
+    def serve(self):
+        """serve()
+Serves requests until stopped or idle for idle_timeout seconds"""
+        CATALOG_CACHE.set_resident(True)
+        socket_dir = os.path.dirname(self.socket_path)
+        if not os.path.lexists(socket_dir):
+            os.makedirs(socket_dir, mode=0o700)
+        os.chmod(socket_dir, 0o700)
+        if os.path.lexists(self.socket_path):
+            os.remove(self.socket_path)
+        self._server_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self._server_socket.bind(self.socket_path)
+            socket_ino = os.stat(self.socket_path).st_ino
+            self._server_socket.listen(16)
+            # SIGCHLD wakes up select through the wakeup fd
+            self._wakeup_r_fd, wakeup_w_fd = os.pipe()
+            for fd in self._wakeup_r_fd, wakeup_w_fd:
+                os.set_blocking(fd, False)
+            signal.set_wakeup_fd(wakeup_w_fd)
+            signal.signal(signal.SIGCHLD, lambda signum, frame: None)
+            LOGGER.info("zapper daemon {} listening on {}".format(os.getpid(), self.socket_path))
+            last_request_time = time.monotonic()
+            while not self._stop:
+                if self._running or self.idle_timeout is None:
+                    timeout = None
+                else:
+                    timeout = last_request_time + self.idle_timeout - time.monotonic()
+                    if timeout <= 0:
+                        LOGGER.info("zapper daemon {} idle for {} seconds".format(os.getpid(), self.idle_timeout))
+                        break
+                readable, writable, exceptional = select.select([self._server_socket, self._wakeup_r_fd] + list(self._children), [], [], timeout)
+                for readable_object in readable:
+                    if readable_object == self._wakeup_r_fd:
+                        while True:
+                            try:
+                                if not os.read(self._wakeup_r_fd, 4096):
+                                    break
+                            except BlockingIOError:
+                                break
+                    elif readable_object is self._server_socket:
+                        conn, address = self._server_socket.accept()
+                        last_request_time = time.monotonic()
+                        with conn:
+                            try:
+                                self._handle(conn)
+                            except Exception as e:
+                                trace(True)
+                                LOGGER.error("cannot handle request: {}: {}".format(e.__class__.__name__, e))
+                    else:
+                        self._collect(readable_object)
+                self._reap()
+        finally:
+            self._server_socket.close()
+            for conn, status_sent in self._running.values():
+                conn.close()
+            try:
+                if os.stat(self.socket_path).st_ino == socket_ino:
+                    os.remove(self.socket_path)
+            except (OSError, UnboundLocalError):
+                pass
+
+    def _check_peer(self, conn):
+        so_peercred = getattr(socket, 'SO_PEERCRED', None)
+        if so_peercred is None:
+            # the socket directory is only accessible by the owner
+            return True
+        creds = conn.getsockopt(socket.SOL_SOCKET, so_peercred, struct.calcsize('3i'))
+        pid, uid, gid = struct.unpack('3i', creds)
+        return uid == os.getuid()
+
+    def _handle(self, conn):
+        conn.settimeout(None)
+        if not self._check_peer(conn):
+            LOGGER.warning("rejecting connection from another user")
+            return
+        message, fds = recv_message(conn, max_fds=3)
+        try:
+            command = message.get('command', None)
+            if command == 'run':
+                self._run(conn, message, fds)
+            elif command == 'status':
+                send_message(conn, self.status())
+            elif command == 'stop':
+                self._stop = True
+                send_message(conn, {'status': 0})
+            else:
+                send_message(conn, {'status': 1, 'error': "invalid command {!r}".format(command)})
+        finally:
+            for fd in fds:
+                os.close(fd)
+
+    def status(self):
+        """status() -> status dict"""
+        return {
+            'pid':           os.getpid(),
+            'version':       get_version(),
+            'socket':        self.socket_path,
+            'start_time':    self.start_time,
+            'idle_timeout':  self.idle_timeout,
+            'requests':      self.num_requests,
+            'running':       len(self._running),
+            'package_dirs':  CATALOG_CACHE.resident_package_dirs(),
+        }
+
+    def _run(self, conn, message, fds):
+        if message.get('protocol', None) != DAEMON_PROTOCOL or message.get('version', None) != get_version():
+            # the client is a different zapper installation
+            LOGGER.warning("client version {!r} does not match daemon version {!r}: stopping".format(message.get('version', None), get_version()))
+            self._stop = True
+            send_message(conn, {'fallback': True})
+            return
+        if len(fds) != 3:
+            send_message(conn, {'fallback': True})
+            return
+        self.num_requests += 1
+        r_fd, w_fd = os.pipe()
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid == 0:
+            # child
+            status = 1
+            try:
+                os.close(r_fd)
+                signal.set_wakeup_fd(-1)
+                signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+                for fd in [self._wakeup_r_fd] + list(self._children):
+                    os.close(fd)
+                self._server_socket.close()
+                status = self._execute(message, fds)
+            finally:
+                try:
+                    send_message(conn, {'status': status})
+                    with os.fdopen(w_fd, "w") as f_out:
+                        json.dump({
+                            'categories':   list(Category.categories()),
+                            'package_dirs': CATALOG_CACHE.resident_package_dirs(),
+                        }, f_out)
+                finally:
+                    os._exit(0)
+        os.close(w_fd)
+        # the connection is kept until the child is reaped: if the child
+        # execs a command ('zapper run'), the exit status is sent by the server
+        self._running[pid] = [conn.dup(), False]
+        self._children[r_fd] = (pid, message['env'], [])
+
+    def _collect(self, r_fd):
+        """_collect(r_fd)
+Reads the resident cache update sent by a child; when it is complete,
+makes the package directories loaded by the child resident"""
+        pid, environ, chunks = self._children[r_fd]
+        chunk = os.read(r_fd, 65536)
+        if chunk:
+            chunks.append(chunk)
+            return
+        del self._children[r_fd]
+        os.close(r_fd)
+        try:
+            loaded = json.loads(b''.join(chunks).decode('utf-8'))
+        except ValueError:
+            # the child did not complete the update (for instance it has
+            # been replaced by 'zapper run')
+            return
+        if pid in self._running:
+            # the update is sent after the exit status
+            self._running[pid][1] = True
+        # categories are defined by the host and user configs
+        Category.add_category(*loaded['categories'])
+        self._load_package_dirs(loaded['package_dirs'], environ)
+
+    def _reap(self):
+        """_reap()
+Reaps the exited children, without waiting for the running ones"""
+        for pid in list(self._running):
+            try:
+                reaped_pid, wait_status = os.waitpid(pid, os.WNOHANG)
+            except ChildProcessError:
+                reaped_pid, wait_status = pid, 0
+            if reaped_pid != pid:
+                continue
+            for r_fd in [r_fd for r_fd, child in self._children.items() if child[0] == pid]:
+                # the child has exited: its pipe can be drained
+                while r_fd in self._children:
+                    self._collect(r_fd)
+            conn, status_sent = self._running.pop(pid)
+            with conn:
+                if not status_sent:
+                    if os.WIFSIGNALED(wait_status):
+                        status = 128 + os.WTERMSIG(wait_status)
+                    else:
+                        status = os.WEXITSTATUS(wait_status)
+                    try:
+                        send_message(conn, {'status': status})
+                    except OSError:
+                        pass
+
+    def _execute(self, message, fds):
+        """_execute(message, fds) -> exit status
+Executes the command in the child process"""
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        for target_fd, fd in enumerate(fds):
+            os.dup2(fd, target_fd)
+        for stream in sys.stdout, sys.stderr:
+            try:
+                stream.reconfigure(line_buffering=stream.isatty())
+            except (AttributeError, OSError):
+                pass
+        os.environ.clear()
+        os.environ.update(message['env'])
+        sys.argv = list(message['argv'])
+        set_shell_pid(message.get('ppid', None))
+        try:
+            os.chdir(message['cwd'])
+            from .application.zapper_main import zapper_main
+            zapper_main()
+            status = 0
+        except SystemExit as e:
+            if e.code is None:
+                status = 0
+            elif isinstance(e.code, int):
+                status = e.code
+            else:
+                sys.stderr.write("{}\n".format(e.code))
+                status = 1
+        except BaseException as e:
+            trace(True)
+            LOGGER.critical("{0}: {1}".format(e.__class__.__name__, e))
+            status = 1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        return status
+
+    def _load_package_dirs(self, package_dirs, environ):
+        """_load_package_dirs(package_dirs, environ)
+Makes package_dirs resident in the server process"""
+        orig_environ = dict(os.environ)
+        os.environ.clear()
+        os.environ.update(environ)
+        try:
+            session = Session(None, load=False)
+            for package_dir in package_dirs:
+                try:
+                    session._load_package_dir(package_dir)
+                except Exception as e:
+                    trace(True)
+                    LOGGER.warning("cannot load package directory {}: {}: {}".format(package_dir, e.__class__.__name__, e))
+        finally:
+            os.environ.clear()
+            os.environ.update(orig_environ)
+
+
+def get_daemon_status(socket_path=None):
+    """get_daemon_status(socket_path=None) -> status dict or None"""
+    try:
+        return daemon_request({'command': 'status'}, socket_path=socket_path, timeout=5.0)
+    except (OSError, ValueError):
+        return None
+
+def start_daemon(socket_path, *, idle_timeout=None, log_file=None, wait=5.0):
+    """start_daemon(socket_path, *, idle_timeout=None, log_file=None, wait=5.0) -> status dict or None
+Starts the daemon in a new interpreter"""
+    zapper_lib_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = os.environ.copy()
+    python_path = env.get("PYTHONPATH", "")
+    env["PYTHONPATH"] = zapper_lib_dir + (":" + python_path if python_path else "")
+    args = [sys.executable, '-m', 'zapper.daemon', '--socket', socket_path]
+    if idle_timeout is not None:
+        args.extend(('--idle-timeout', str(idle_timeout)))
+    for option, value in ('--home-dir', get_home_dir()), ('--admin-user', get_admin_user()), ('--version', get_version()):
+        if value is not None:
+            args.extend((option, value))
+    socket_dir = os.path.dirname(socket_path)
+    if not os.path.lexists(socket_dir):
+        os.makedirs(socket_dir, mode=0o700)
+    if log_file is None:
+        log_file = os.devnull
+    with open(os.devnull, "r") as f_in, open(log_file, "a") as f_log:
+        subprocess.Popen(args, stdin=f_in, stdout=f_log, stderr=f_log, cwd='/', env=env, start_new_session=True)
+    deadline = time.time() + wait
+    while time.time() < deadline:
+        status = get_daemon_status(socket_path)
+        if status is not None:
+            return status
+        time.sleep(0.05)
+    return None
+
+def stop_daemon(socket_path=None):
+    """stop_daemon(socket_path=None) -> True if the daemon was running"""
+    try:
+        daemon_request({'command': 'stop'}, socket_path=socket_path, timeout=5.0)
+        return True
+    except (OSError, ValueError):
+        return False
+
+def daemon_main():
+    parser = argparse.ArgumentParser(description="zapper daemon")
+    parser.add_argument("--socket", default=get_daemon_socket(), help="socket path")
+    parser.add_argument("--idle-timeout", type=float, default=None, help="idle timeout in seconds")
+    parser.add_argument("--home-dir", default=None, help="zapper home dir")
+    parser.add_argument("--admin-user", default=None, help="zapper admin user")
+    parser.add_argument("--version", default=None, help="zapper version")
+    args = parser.parse_args()
+    set_home_dir(args.home_dir)
+    set_admin_user(args.admin_user)
+    set_version(args.version)
+    # the command modules are imported once, before forking the children
+    importlib.import_module(__package__ + '.application.zapper_main')
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    ZapperDaemon(args.socket, idle_timeout=args.idle_timeout).serve()
+
+if __name__ == "__main__":
+    daemon_main()
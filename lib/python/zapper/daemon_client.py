@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+#
+# Copyright 2013 Simone Campagna
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+__author__ = 'Simone Campagna'
+
+__all__ = ['get_daemon_socket', 'send_message', 'recv_message', 'daemon_request', 'forward_to_daemon']
+
+# This module is imported by bin/zapper before any other zapper module:
+# it must only depend on the standard library.
+
+import os
+import sys
+import json
+import socket
+import struct
+import getpass
+
+DAEMON_PROTOCOL = 1
+DAEMON_DIR_NAME = 'daemon'
+DAEMON_SOCKET_NAME = 'socket'
+MAX_MESSAGE_SIZE = 16 * 1024 * 1024
+_HEADER = struct.Struct("!I")
+
+def get_daemon_socket(user_temp_dir=None):
+    """get_daemon_socket(user_temp_dir=None) -> daemon socket path"""
+    if user_temp_dir is None:
+        user_temp_dir = os.path.join(os.environ.get("TMPDIR", "/tmp"), "zapper-{0}".format(getpass.getuser()))
+    return os.path.join(user_temp_dir, DAEMON_DIR_NAME, DAEMON_SOCKET_NAME)
+
+def _recv_exactly(sock, size):
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("connection closed by peer")
+        data += chunk
+    return data
+
+def send_message(sock, message, fds=()):
+    """send_message(sock, message, fds=())
+Sends a length-prefixed json message, optionally passing file descriptors"""
+    data = json.dumps(message).encode('utf-8')
+    data = _HEADER.pack(len(data)) + data
+    if fds:
+        num_sent = socket.send_fds(sock, [data], list(fds))
+        data = data[num_sent:]
+    if data:
+        sock.sendall(data)
+
+def recv_message(sock, max_fds=0):
+    """recv_message(sock, max_fds=0) -> message or (message, fds)"""
+    fds = []
+    if max_fds:
+        data, fds, flags, address = socket.recv_fds(sock, _HEADER.size, max_fds)
+        if not data:
+            raise ConnectionError("connection closed by peer")
+        if len(data) < _HEADER.size:
+            data += _recv_exactly(sock, _HEADER.size - len(data))
+    else:
+        data = _recv_exactly(sock, _HEADER.size)
+    size, = _HEADER.unpack(data)
+    if size > MAX_MESSAGE_SIZE:
+        raise ValueError("message too long ({} bytes)".format(size))
+    message = json.loads(_recv_exactly(sock, size).decode('utf-8'))
+    if max_fds:
+        return message, fds
+    else:
+        return message
+
+def daemon_request(message, *, socket_path=None, fds=(), timeout=None):
+    """daemon_request(message, *, socket_path=None, fds=(), timeout=None) -> reply
+Raises OSError if the daemon is not running"""
+    if socket_path is None:
+        socket_path = get_daemon_socket()
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(timeout)
+        sock.connect(socket_path)
+        send_message(sock, message, fds)
+        return recv_message(sock)
+    finally:
+        sock.close()
+
+def forward_to_daemon(version=None, argv=None):
+    """forward_to_daemon(version=None, argv=None) -> exit status or None
+Runs the zapper command through the resident daemon; returns None if the
+command must be executed in-process (daemon not running or unusable)"""
+    if os.environ.get("ZAPPER_DISABLE_DAEMON", "").title() == "True":
+        return None
+    if argv is None:
+        argv = sys.argv
+    if 'daemon' in argv[1:]:
+        # daemon management is always executed in-process
+        return None
+    socket_path = get_daemon_socket()
+    if not os.path.exists(socket_path):
+        return None
+    message = {
+        'command':  'run',
+        'protocol': DAEMON_PROTOCOL,
+        'version':  version,
+        'argv':     list(argv),
+        'env':      dict(os.environ),
+        'cwd':      os.getcwd(),
+        'ppid':     os.getppid(),
+    }
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        try:
+            sock.connect(socket_path)
+            sys.stdout.flush()
+            sys.stderr.flush()
+            send_message(sock, message, fds=(0, 1, 2))
+        except OSError:
+            # stale socket: the daemon is not running
+            return None
+        try:
+            reply = recv_message(sock)
+        except (OSError, ValueError) as e:
+            sys.stderr.write("ERROR: zapper daemon: {}: {}\n".format(e.__class__.__name__, e))
+            return 1
+    finally:
+        sock.close()
+    if reply.get('fallback', False):
+        return None
+    return reply.get('status', 1)
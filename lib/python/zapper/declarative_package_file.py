@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+#
+# Copyright 2013 Simone Campagna
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+__author__ = 'Simone Campagna'
+
+__all__ = ['DeclarativePackageFile']
+
+import re
+import shlex
+import configparser
+
+from .package import Package
+from .product import Product
+from .suite import Suite
+from .package_expressions import NAME, parse_expression
+from .errors import PackageFileError
+
+
+class DeclarativePackageFile(object):
+    """DeclarativePackageFile(filename)
+Package file in ini format; it is parsed, not executed. Sections are
+processed in order:
+
+  [product:<name>]
+  [suite:<suite_label>]
+  [package:<suite_label>/<name>-<version>]
+
+where <suite_label> (optional for packages and suites) is the label of a
+suite section defined before in the same file. Available keys:
+
+  product, suite, package:
+    short_description, long_description
+    requires, prefers, conflicts    one expression per line
+    transitions                     one per line, for instance
+                                      path_prepend PATH /opt/gcc/bin
+  product:
+    category
+  suite, package:
+    version                         default: from the section label
+    tags, conflicting_tags          whitespace separated
+  package:
+    product                         default: from the section label
+    category                        if the product is not defined yet
+    inherit                         true/false
+
+Values are interpolated, so that for instance '%(version)s' can be used."""
+    SUFFIX = '.zap'
+    PRODUCT_SECTION = 'product'
+    SUITE_SECTION = 'suite'
+    PACKAGE_SECTION = 'package'
+    TRANSITIONS = {'var_set', 'var_unset',
+                   'list_prepend', 'list_append', 'list_remove',
+                   'path_prepend', 'path_append', 'path_remove'}
+    RE_SPLIT = re.compile(r"[\s,]+")
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._suites = {}
+
+    def load(self):
+        """load() -> list of defined products, suites and packages"""
+        parser = configparser.ConfigParser()
+        try:
+            with open(self.filename, "r") as f_in:
+                parser.read_file(f_in, self.filename)
+        except configparser.Error as e:
+            raise PackageFileError("{}: {}".format(self.filename, e))
+        objs = []
+        for section_name in parser.sections():
+            section_type, sep, label = section_name.partition(':')
+            section_type = section_type.strip()
+            label = label.strip()
+            if not sep or not label:
+                raise PackageFileError("{}: invalid section [{}]".format(self.filename, section_name))
+            try:
+                if section_type == self.PRODUCT_SECTION:
+                    obj = self._make_product(label, parser[section_name])
+                elif section_type == self.SUITE_SECTION:
+                    obj = self._make_package(Suite, label, parser[section_name])
+                    self._suites[label] = obj
+                elif section_type == self.PACKAGE_SECTION:
+                    obj = self._make_package(Package, label, parser[section_name])
+                else:
+                    raise ValueError("invalid section type {!r}".format(section_type))
+            except (ValueError, KeyError, TypeError, configparser.Error) as e:
+                raise PackageFileError("{}: [{}]: {}: {}".format(self.filename, section_name, e.__class__.__name__, e))
+            objs.append(obj)
+        return objs
+
+    def _split_label(self, label):
+        suite_label, sep, package_label = label.rpartition(Package.SUITE_SEPARATOR)
+        name, sep, version = package_label.partition(Package.VERSION_SEPARATOR)
+        return suite_label, name, version
+
+    def _make_product(self, name, section):
+        product = Product(name, section.get('category', None),
+            short_description=section.get('short_description', None),
+            long_description=section.get('long_description', None))
+        self._set_common(product, section)
+        return product
+
+    def _make_package(self, factory, label, section):
+        suite_label, name, version = self._split_label(label)
+        # the label values can be used for interpolation
+        for key, value in ('name', name), ('version', version):
+            if not key in section:
+                section[key] = value
+        suite_label = section.get('suite', suite_label)
+        if suite_label:
+            if not suite_label in self._suites:
+                raise ValueError("undefined suite {!r}".format(suite_label))
+            suite = self._suites[suite_label]
+        else:
+            suite = None
+        n_args = dict(
+            short_description=section.get('short_description', None),
+            long_description=section.get('long_description', None),
+            suite=suite)
+        if factory is Suite:
+            product = section['name']
+        else:
+            product = section.get('product', section['name'])
+            if 'category' in section:
+                product = Product(product, section['category'])
+            if 'inherit' in section:
+                n_args['inherit'] = section.getboolean('inherit')
+        package = factory(product, section['version'], **n_args)
+        for tag in self._split(section.get('tags', '')):
+            package.add_tag(tag)
+        for tag in self._split(section.get('conflicting_tags', '')):
+            package.add_conflicting_tag(tag)
+        self._set_common(package, section)
+        return package
+
+    def _split(self, value):
+        return [item for item in self.RE_SPLIT.split(value) if item]
+
+    def _lines(self, value):
+        return [line.strip() for line in value.split('\n') if line.strip()]
+
+    def _set_common(self, obj, section):
+        for key, method in ('requires', obj.requires), ('prefers', obj.prefers), ('conflicts', obj.conflicts):
+            for line in self._lines(section.get(key, '')):
+                expressions = parse_expression(line)
+                if not isinstance(expressions, tuple):
+                    expressions = (expressions, )
+                # a string item is a product name
+                method(*[NAME == e if isinstance(e, str) else e for e in expressions])
+        for line in self._lines(section.get('transitions', '')):
+            args = shlex.split(line)
+            if not args[0] in self.TRANSITIONS:
+                raise ValueError("invalid transition {!r}".format(args[0]))
+            getattr(obj, args[0])(*args[1:])
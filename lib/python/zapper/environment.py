@@ -19,79 +19,153 @@ __author__ = 'Simone Campagna'
 
 import abc
 import os
+import functools
+
+@functools.lru_cache(maxsize=4096)
+def _normpath(var_value):
+    return os.path.normpath(os.path.expanduser(var_value))
+
+class _ParsedList(object):
+    """_ParsedList(transform, separator, items, value)
+The transformed, non-empty items of a list variable; value is the string
+the items were parsed from, or the last joined one. Only the item added by
+a list operation is deduplicated: the duplicated items of the original
+value are kept, so that removing the added items restores it"""
+    __slots__ = ('transform', 'separator', 'items', 'value', 'normalized')
+    def __init__(self, transform, separator, items, value):
+        self.transform = transform
+        self.separator = separator
+        self.items = items
+        self.value = value
+        # True if the joined items are the value of the variable, or its
+        # pending value
+        self.normalized = value == separator.join(items)
 
 class Environment(dict):
     def __init__(self, init=None):
         if init is None:
             init = os.environ
         self._changedkeys = set()
+        # the items changed by the list operations are joined only by
+        # var_get(), changeditems() and flush(): until then the dict
+        # interface sees the previous value
+        self._parsed_lists = {}
+        self._pending = {}
         super().__init__(init)
         
     def __setitem__(self, var_name, var_value):
-        #print("   SET: {0}={1!r}".format(var_name, var_value))
+        self._forget(var_name)
         cur_value = self.get(var_name, None)
         if cur_value is None or cur_value != var_value:
-            #print("++ SET: {0}={1!r}".format(var_name, var_value))
             self._changedkeys.add(var_name)
             super().__setitem__(var_name, var_value)
 
     def __delitem__(self, var_name):
-        #print("   DEL: {0}".format(var_name))
+        self._forget(var_name)
         cur_value = self.get(var_name, None)
         if cur_value is not None:
-            #print("++ DEL: {0}".format(var_name))
             self._changedkeys.add(var_name)
             super().__delitem__(var_name)
 
+    def _forget(self, var_name):
+        self._pending.pop(var_name, None)
+        self._parsed_lists.pop(var_name, None)
+
+    def _flush(self, var_name):
+        """_flush(var_name)
+Joins the pending items of list variable var_name"""
+        parsed_list = self._pending.pop(var_name, None)
+        # the pending items are dropped if the value has been changed
+        # through the dict interface (for instance by pop or update)
+        if parsed_list is not None and self.get(var_name, None) == parsed_list.value:
+            var_value = parsed_list.separator.join(parsed_list.items)
+            if var_value != parsed_list.value:
+                self._changedkeys.add(var_name)
+                super().__setitem__(var_name, var_value)
+            parsed_list.value = var_value
+
+    def flush(self):
+        """flush()
+Joins the pending items of all the list variables"""
+        for var_name in list(self._pending):
+            self._flush(var_name)
+
     def changedkeys(self):
+        self.flush()
         for key in self._changedkeys:
             yield key
 
     def changedvalues(self):
+        self.flush()
         for key in self._changedkeys:
             yield self.get(key, None)
 
     def changeditems(self):
+        self.flush()
         for key in self._changedkeys:
             yield key, self.get(key, None)
 
     def var_get(self, var_name):
+        self._flush(var_name)
         return self.get(var_name, None)
 
-    def _var_split(self, transform, var_name, separator):
-        for item in self.get(var_name, '').split(separator):
+    def _get_items(self, transform, var_name, separator):
+        """_get_items(transform, var_name, separator) -> list of items
+Returns the parsed items of var_name; the list must not be changed"""
+        parsed_list = self._parsed_lists.get(var_name, None)
+        if parsed_list is not None and parsed_list.transform == transform and parsed_list.separator == separator:
+            if parsed_list.value == self.get(var_name, ''):
+                return parsed_list.items
+        self._flush(var_name)
+        value = self.get(var_name, '')
+        items = []
+        for item in value.split(separator):
             item = transform(item)
             if item:
-                yield item
-
-    def _var_split_uniq(self, transform, var_name, var_value, separator):
-        for item in self._var_split(transform, var_name, separator):
-            if item != var_value:
-                yield item
+                items.append(item)
+        self._parsed_lists[var_name] = _ParsedList(transform, separator, items, value)
+        return items
+
+    def _set_items(self, var_name, items):
+        """_set_items(var_name, items)
+Sets the items of var_name, which have been returned by _get_items();
+they will be joined when the value is needed"""
+        parsed_list = self._parsed_lists[var_name]
+        if not items or '' in items or not var_name in self:
+            # the joined value can be parsed to different items (empty
+            # items are dropped, NORMPATH('') is '.'): it is set now, and
+            # parsed again by the next list operation
+            self[var_name] = parsed_list.separator.join(items)
+        else:
+            if items != parsed_list.items or not parsed_list.normalized:
+                self._changedkeys.add(var_name)
+            parsed_list.items = items
+            parsed_list.normalized = True
+            self._pending[var_name] = parsed_list
 
     def _list_prepend(self, transform, var_name, var_value, separator=None):
         if separator is None:
             separator = ':'
         var_value = transform(var_value)
-        l = list(self._var_split_uniq(transform, var_name, var_value, separator))
+        l = [item for item in self._get_items(transform, var_name, separator) if item != var_value]
         l.insert(0, var_value)
-        self[var_name] = separator.join(l)
+        self._set_items(var_name, l)
 
     def _list_append(self, transform, var_name, var_value, separator=':'):
         if separator is None:
             separator = ':'
         var_value = transform(var_value)
-        l = list(self._var_split_uniq(transform, var_name, var_value, separator))
+        l = [item for item in self._get_items(transform, var_name, separator) if item != var_value]
         l.append(var_value)
-        self[var_name] = separator.join(l)
+        self._set_items(var_name, l)
 
     def _list_insert(self, transform, var_name, var_value, var_template, separator=None):
         """_list_insert(var_name, var_value, var_template, separator=None) -> try to insert var_value in list var_name, in the same position as in var_template"""
         if separator is None:
             separator = ':'
         var_value = transform(var_value)
-        l = list(self._var_split_uniq(transform, var_name, var_value, separator))
-        c = list(self._var_split(transform, var_name, separator))
+        c = self._get_items(transform, var_name, separator)
+        l = [item for item in c if item != var_value]
         
         l_index = 0
         if var_value in c:
@@ -101,21 +175,24 @@ class Environment(dict):
             elif c_index < len(c) - 1 and c[c_index + 1] in l:
                 l_index = l.index(c[c_index + 1]) - 1
         l.insert(l_index, var_value)
-        self[var_name] = separator.join(l)
+        self._set_items(var_name, l)
 
     def _list_remove(self, transform, var_name, var_value, separator=':'):
-        l = list(self._var_split_uniq(transform, var_name, var_value, separator))
-        self[var_name] = separator.join(l)
+        if separator is None:
+            separator = ':'
+        l = [item for item in self._get_items(transform, var_name, separator) if item != var_value]
+        self._set_items(var_name, l)
   
     def _list_contains(self, transform, var_name, var_value, separator=':'):
-        l = list(self._var_split(transform, var_name, separator))
-        return transform(var_value) in l
+        if separator is None:
+            separator = ':'
+        return transform(var_value) in self._get_items(transform, var_name, separator)
   
     def IDENTITY(self, var_value):
         return var_value
 
     def NORMPATH(self, var_value):
-        return os.path.normpath(os.path.expanduser(var_value))
+        return _normpath(var_value)
 
     def var_set(self, var_name, var_value):
         assert isinstance(var_name, str), "{!r} of type {}".format(var_name, type(var_name))
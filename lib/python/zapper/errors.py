@@ -47,3 +47,15 @@ class PackageNotFoundError(SessionError):
 class AuthError(UxsError):
     pass
 
+
+class DaemonError(UxsError):
+    pass
+
+class PackageFileError(UxsError):
+    pass
+
+class LockError(UxsError):
+    pass
+
+class LockTimeoutError(LockError):
+    pass
@@ -18,8 +18,14 @@
 __author__ = 'Simone Campagna'
 
 import abc
+import operator
 
 class Expression(metaclass=abc.ABCMeta):
+    """Expression()
+Expressions can be evaluated on an instance in two ways:
+ * bind(instance), then get_value();
+ * get_function()(instance): the expression tree is compiled once to a
+   function, which does not change the expression state."""
     def __init__(self):
         pass
 
@@ -32,6 +38,27 @@ class Expression(metaclass=abc.ABCMeta):
     def bind(self, instance):
         pass
 
+    def compile(self):
+        """compile() -> function(instance) -> value"""
+        def function(instance):
+            self.bind(instance)
+            return self.get_value()
+        return function
+
+    def get_function(self):
+        """get_function() -> function(instance) -> value
+Returns the compiled expression; it is compiled only once"""
+        function = self.__dict__.get('_function', None)
+        if function is None:
+            function = self._function = self.compile()
+        return function
+
+    def __getstate__(self):
+        # compiled functions cannot be pickled
+        state = self.__dict__.copy()
+        state.pop('_function', None)
+        return state
+
     def __hash__(self):
         return hash(str(self))
 
@@ -147,6 +174,11 @@ class _Instance(Expression):
     def bind(self, instance):
         self.instance = instance
 
+    def __getstate__(self):
+        state = super().__getstate__()
+        state['instance'] = None
+        return state
+
     def __str__(self):
         return self.symbol
 
@@ -158,6 +190,9 @@ class AttributeGetter(_Instance):
     def get_value(self):
         return getattr(self.instance, self.attribute_name)
 
+    def compile(self):
+        return operator.attrgetter(self.attribute_name)
+
 class InstanceGetter(_Instance):
     def __init__(self, symbol=None):
         self.symbol = symbol
@@ -165,6 +200,9 @@ class InstanceGetter(_Instance):
     def get_value(self):
         return self.instance
 
+    def compile(self):
+        return lambda instance: instance
+
 class MethodCaller(_Instance):
     def __init__(self, method_name, method_p_args=None, method_n_args=None, symbol=None):
         super().__init__(symbol=symbol)
@@ -179,6 +217,9 @@ class MethodCaller(_Instance):
     def get_value(self):
         return getattr(self.instance, self.method_name)(*self.method_p_args, **self.method_n_args)
 
+    def compile(self):
+        return operator.methodcaller(self.method_name, *self.method_p_args, **self.method_n_args)
+
 class ConstExpression(Expression):
     def __init__(self, const_value):
         self.const_value = const_value
@@ -186,6 +227,10 @@ class ConstExpression(Expression):
     def get_value(self):
         return self.const_value
 
+    def compile(self):
+        const_value = self.const_value
+        return lambda instance: const_value
+
     def __str__(self):
         return str(self.const_value)
 
@@ -202,6 +247,16 @@ class BinaryOperator(Expression):
     def get_value(self):
         return self.compute(self.left_operand.get_value(), self.right_operand.get_value())
 
+    def compile(self):
+        compute = self.compute
+        l_function = self.left_operand.get_function()
+        if isinstance(self.right_operand, ConstExpression):
+            # most common case: NAME == 'x', VERSION >= '1.0', ...
+            r_value = self.right_operand.const_value
+            return lambda instance: compute(l_function(instance), r_value)
+        r_function = self.right_operand.get_function()
+        return lambda instance: compute(l_function(instance), r_function(instance))
+
     @abc.abstractmethod
     def compute(self, l, r):
         pass
@@ -220,6 +275,11 @@ class UnaryOperator(Expression):
     def get_value(self):
         return self.compute(self.operand.get_value())
 
+    def compile(self):
+        compute = self.compute
+        o_function = self.operand.get_function()
+        return lambda instance: compute(o_function(instance))
+
     @abc.abstractmethod
     def compute(self, o):
         pass
@@ -232,11 +292,21 @@ class And(BinaryOperator):
     def compute(self, l, r):
         return l and r
 
+    def compile(self):
+        l_function = self.left_operand.get_function()
+        r_function = self.right_operand.get_function()
+        return lambda instance: l_function(instance) and r_function(instance)
+
 class Or(BinaryOperator):
     __symbol__ = "|"
     def compute(self, l, r):
         return l or r
 
+    def compile(self):
+        l_function = self.left_operand.get_function()
+        r_function = self.right_operand.get_function()
+        return lambda instance: l_function(instance) or r_function(instance)
+
 class Add(BinaryOperator):
     __symbol__ = "+"
     def compute(self, l, r):
@@ -350,3 +420,7 @@ if __name__ == "__main__":
     print(e.get_value())
     e.bind(z)
     print(e.get_value())
+
+    f = e.get_function()
+    for instance in x, y, z:
+        print(f(instance))
@@ -17,41 +17,156 @@
 
 __author__ = 'Simone Campagna'
 
-import os
+__all__ = ['Lock', 'LockStats', 'LOCK_STATS']
+
 import time
 import errno
 import fcntl
+import signal
+import threading
 import contextlib
 
+from .errors import LockTimeoutError
+
+
+class LockStats(object):
+    """LockStats()
+Counters of the lock acquisitions of the current process"""
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.shared = 0
+        self.exclusive = 0
+        self.contended = 0
+        self.timeouts = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    def add(self, exclusive, contended, wait_time):
+        if exclusive:
+            self.exclusive += 1
+        else:
+            self.shared += 1
+        if contended:
+            self.contended += 1
+            self.wait_time += wait_time
+            self.max_wait_time = max(self.max_wait_time, wait_time)
+
+    def as_dict(self):
+        """as_dict() -> dict of counters"""
+        return {
+            'shared': self.shared,
+            'exclusive': self.exclusive,
+            'contended': self.contended,
+            'timeouts': self.timeouts,
+            'wait_time': self.wait_time,
+            'max_wait_time': self.max_wait_time,
+        }
+
+    def __str__(self):
+        return "shared={shared}, exclusive={exclusive}, contended={contended}, timeouts={timeouts}, wait_time={wait_time:.3f}s, max_wait_time={max_wait_time:.3f}s".format(**self.as_dict())
+
+LOCK_STATS = LockStats()
+
+
+class _Deadline(Exception):
+    pass
+
+def _raise_deadline(signum, frame):
+    raise _Deadline()
+
+def _try_lock(fd, lock_op):
+    try:
+        fcntl.flock(fd, lock_op | fcntl.LOCK_NB)
+    except OSError as e:
+        if e.errno in (errno.EACCES, errno.EAGAIN):
+            return False
+        raise
+    return True
+
+def _lock_until(fd, lock_op, deadline):
+    """_lock_until(fd, lock_op, deadline) -> True if locked
+Blocks until the lock is acquired or the deadline is reached"""
+    if deadline is None:
+        fcntl.flock(fd, lock_op)
+        return True
+    timeout = deadline - time.monotonic()
+    if timeout <= 0:
+        return False
+    if threading.current_thread() is not threading.main_thread():
+        # signals are delivered only to the main thread
+        interval = 0.001
+        while not _try_lock(fd, lock_op):
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                return False
+            time.sleep(min(interval, timeout))
+            interval = min(interval * 2, 0.1)
+        return True
+    # the blocking call is interrupted by SIGALRM at the deadline
+    t_start = time.monotonic()
+    old_handler = signal.signal(signal.SIGALRM, _raise_deadline)
+    old_delay, old_interval = signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        try:
+            fcntl.flock(fd, lock_op)
+        finally:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+    except _Deadline:
+        # also raised if the deadline is reached just after flock()
+        pass
+    finally:
+        signal.signal(signal.SIGALRM, old_handler)
+        if old_delay > 0:
+            signal.setitimer(signal.ITIMER_REAL, max(old_delay - (time.monotonic() - t_start), 0.001), old_interval)
+    # the timer is disarmed: the lock is held if flock() has returned, and
+    # it is acquired now if it has been released in the meantime
+    return _try_lock(fd, lock_op)
+
 @contextlib.contextmanager
-def Lock(filename, mode="r", blocking=True, timeout=10):
-    # enter
-    lock_op = fcntl.LOCK_EX
-    if not blocking:
-        lock_op += fcntl.LOCK_NB
-    count = 0
-    interval = 0.1
-    if timeout is not None:
-      count = int(round(timeout/interval, 0))
-    if count <= 0:
-      count = 1
+def Lock(filename, mode="r", blocking=True, timeout=10, *, exclusive=None):
+    """Lock(filename, mode="r", blocking=True, timeout=10, *, exclusive=None)
+Opens filename and locks it: read-only modes take a shared lock, other
+modes an exclusive lock. Files opened in 'w' mode are truncated only after
+the lock has been acquired. Raises LockTimeoutError if the lock cannot be
+acquired within timeout seconds (None: no timeout), or at once if not
+blocking."""
+    if exclusive is None:
+        exclusive = '+' in mode or not mode.startswith('r')
+    if exclusive:
+        lock_op = fcntl.LOCK_EX
+    else:
+        lock_op = fcntl.LOCK_SH
+    truncate = 'w' in mode
+    if truncate:
+        # the file is truncated only after locking
+        mode = mode.replace('w', 'a')
     with open(filename, mode) as f:
-        for i in range(count):
-            try:
-                #fcntl.fcntl(self.fileno(), lock_op, os.O_NDELAY)
-                fcntl.lockf(f.fileno(), lock_op)
-            except IOError as e:
-                if e.errno in (errno.EACCES, errno.EAGAIN):
-                    if timeout:
-                        time.sleep(interval)
-                    continue
-            except:
-                import traceback
-                traceback.print_exc()
-                time.sleep(interval)
-        yield f
-    #exit
-        fcntl.lockf(f.fileno(), fcntl.LOCK_UN)
+        fd = f.fileno()
+        t_start = time.monotonic()
+        contended = not _try_lock(fd, lock_op)
+        if contended:
+            if blocking:
+                if timeout is None:
+                    deadline = None
+                else:
+                    deadline = t_start + timeout
+                locked = _lock_until(fd, lock_op, deadline)
+            else:
+                locked = False
+            if not locked:
+                LOCK_STATS.timeouts += 1
+                raise LockTimeoutError("cannot lock {} ({}): lock is busy".format(filename, 'exclusive' if exclusive else 'shared'))
+        LOCK_STATS.add(exclusive, contended, time.monotonic() - t_start)
+        try:
+            if truncate:
+                f.seek(0)
+                f.truncate()
+            yield f
+        finally:
+            f.flush()
+            fcntl.flock(fd, fcntl.LOCK_UN)
 
 if __name__ == "__main__":
     import sys
@@ -63,6 +178,3 @@ if __name__ == "__main__":
         time.sleep(10)
         print("done.")
         f_out.write("finito!\n")
-
-    
-    
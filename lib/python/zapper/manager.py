@@ -20,7 +20,7 @@ __author__ = 'Simone Campagna'
 import os
 import re
 import sys
-import glob
+import time
 import shutil
 import getpass
 import tempfile
@@ -37,6 +37,15 @@ from .translators import *
 from .host_config import HOST_CONFIG, HostConfig
 from .user_config import USER_CONFIG, UserConfig
 from .session_config import SESSION_CONFIG
+from .session_store import FileSessionStore, SqliteSessionStore
+from .session_gc import is_session_stale
+from .catalog_cache import CATALOG_CACHE
+from .lock_file import LOCK_STATS
+from .resolution_cache import ResolutionCache, RESOLUTION_CACHE
+from .config_snapshot import ConfigSnapshot
+from .package_index import PACKAGE_INDEX
+from .daemon_client import get_daemon_socket
+from .daemon import start_daemon, stop_daemon, get_daemon_status
 from .expression import Expression
 from .utils.install_data import get_home_dir, get_admin_user
 from .utils.random_name import RandomNameSequence
@@ -44,7 +53,7 @@ from .utils.table import show_table, validate_format
 from .utils.debug import PRINT
 from .utils.trace import trace
 from .utils.sort_keys import SortKeys
-from .utils.strings import string_to_bool, bool_to_string, string_to_list, list_to_string, string_to_set, set_to_string
+from .utils.strings import plural_string, string_to_bool, bool_to_string, string_to_list, list_to_string, string_to_set, set_to_string
 
 def _expression(s):
     if s is None:
@@ -72,6 +81,12 @@ class Manager(object):
 
     SESSIONS_DIR_NAME = 'sessions'
     PACKAGES_DIR_NAME = 'packages'
+    CACHE_DIR_NAME = 'cache'
+    CATALOG_CACHE_DIR_NAME = 'catalog'
+    PACKAGE_INDEX_DIR_NAME = 'index'
+    RESOLUTION_CACHE_DIR_NAME = 'resolution'
+    DAEMON_SOCKET = get_daemon_socket(USER_TEMP_DIR)
+    DAEMON_LOG_FILE = os.path.join(os.path.dirname(DAEMON_SOCKET), 'daemon.log')
 
     PERSISTENT_SESSIONS_DIR = os.path.join(USER_RC_DIR, SESSIONS_DIR_NAME)
     TEMPORARY_SESSIONS_DIR = os.path.join(USER_TEMP_DIR, SESSIONS_DIR_NAME)
@@ -83,6 +98,9 @@ class Manager(object):
 
     LOADED_PACKAGES_VARNAME = "ZAPPER_LOADED_PACKAGES"
     USER_CONFIG_FILE = 'user.config'
+    CONFIG_SNAPSHOT_FILE = 'config.snapshot'
+    SESSION_DB_FILE = 'sessions.db'
+    SESSION_GC_STAMP_FILE = '.gc'
     DEFAULT_SESSION_FORMAT = '{__ordinal__:>3d}) {is_current} {type} {name} {description}'
     DEFAULT_SESSION_LAST = '<last>'
     DEFAULT_SESSION_NEW = '<new>'
@@ -108,6 +126,21 @@ class Manager(object):
         ('directories', ''),
         ('persistent_sessions_dir', PERSISTENT_SESSIONS_DIR),
         ('temporary_sessions_dir', TEMPORARY_SESSIONS_DIR),
+        ('session_store', Session.SESSION_STORE_FILE),
+        ('session_db_journal_mode', SqliteSessionStore.JOURNAL_MODE_DELETE),
+        ('session_gc', False),
+        ('session_gc_interval', 3600),
+        ('session_gc_min_age', 86400),
+        ('session_gc_max_age', 604800),
+        ('catalog_cache', False),
+        ('resolution_cache', False),
+        ('resolution_cache_size', ResolutionCache.DEFAULT_SIZE),
+        ('resolution_cache_shared_dir', ''),
+        ('lazy_loading', False),
+        ('config_snapshot', False),
+        ('daemon_idle_timeout', 900),
+        ('loader_processes', 0),
+        ('undo_log', False),
         ('available_package_format', Session.AVAILABLE_PACKAGE_FORMAT),
         ('loaded_package_format', Session.LOADED_PACKAGE_FORMAT),
         ('available_session_format', DEFAULT_SESSION_FORMAT),
@@ -119,6 +152,8 @@ class Manager(object):
         ('enable_relative_packages', True),
         ('restricted_keys', ''),
         ('resolution_level', 0),
+        ('resolver', Session.RESOLVER_GREEDY),
+        ('translation_mode', Session.TRANSLATION_MODE_FULL),
         ('filter_packages', None),
         ('show_header', True),
         ('show_header_if_empty', False),
@@ -137,6 +172,21 @@ class Manager(object):
         directories=_list,
         persistent_sessions_dir=str,
         temporary_sessions_dir=str,
+        session_store=Session.SessionStoreName,
+        session_db_journal_mode=Session.SessionDbJournalMode,
+        session_gc=_bool,
+        session_gc_interval=int,
+        session_gc_min_age=int,
+        session_gc_max_age=int,
+        catalog_cache=_bool,
+        resolution_cache=_bool,
+        resolution_cache_size=int,
+        resolution_cache_shared_dir=str,
+        lazy_loading=_bool,
+        config_snapshot=_bool,
+        daemon_idle_timeout=int,
+        loader_processes=int,
+        undo_log=_bool,
         available_package_format=Session.PackageFormat,
         loaded_package_format=Session.PackageFormat,
         available_session_format=str,
@@ -148,6 +198,8 @@ class Manager(object):
         enable_relative_packages=_bool,
         restricted_keys=_list,
         resolution_level=int,
+        resolver=Session.Resolver,
+        translation_mode=Session.TranslationMode,
         filter_packages=_expression,
         show_header=_bool,
         show_header_if_empty=_bool,
@@ -179,17 +231,19 @@ class Manager(object):
         if zapper_home_dir and os.path.lexists(zapper_home_dir):
             host_etc_dir = os.path.join(zapper_home_dir, 'etc', 'zapper')
             self.host_package_dir = os.path.join(host_etc_dir, self.PACKAGES_DIR_NAME)
-            host_config_file = os.path.join(host_etc_dir, 'host.config')
-            self.host_config = HostConfig(host_config_file)
+            self.host_config_file = os.path.join(host_etc_dir, 'host.config')
         else:
             self.host_package_dir = None
-            self.host_config = HostConfig()
+            self.host_config_file = None
         #tmpdir = os.environ.get("TMPDIR", "/tmp")
         #self.persistent_sessions_dir = os.path.join(self.USER_RC_DIR, self.SESSIONS_DIR_NAME)
         #self.temporary_sessions_dir = os.path.join(self.tmp_dir, self.SESSIONS_DIR_NAME)
 
-        user_config_file = os.path.join(self.USER_RC_DIR, self.USER_CONFIG_FILE)
-        self.user_config = UserConfig(user_config_file)
+        self.user_config_file = os.path.join(self.USER_RC_DIR, self.USER_CONFIG_FILE)
+        self._host_config = None
+        self._user_config = None
+        self.config = None
+        self.config_from = None
 
         self._dry_run = False
         self._force = False
@@ -216,12 +270,21 @@ class Manager(object):
         self._package_dir_sort_keys = None
         self._set_session_sort_keys = None
 
-        self.load_general()
-
-        self.load_user_config()
-        if not self.host_config['config']['directories']:
-            dirs = filter(lambda x: x is not None, [self.host_package_dir, self.user_package_dir])
-            self.host_config['config']['directories'] = list_to_string(dirs)
+        self.package_options = {}
+        self.package_options_from = {}
+        self._config_snapshot = ConfigSnapshot(os.path.join(self.USER_RC_DIR, self.CONFIG_SNAPSHOT_FILE))
+        self._config_snapshot_data = None
+        # the signature is taken before parsing the config files: if they
+        # are changed meanwhile, the snapshot is simply out of date
+        config_signature = ConfigSnapshot.get_signature((self.host_config_file, self.user_config_file))
+        if not self.load_config_snapshot(config_signature):
+            self.load_general()
+            self.load_user_config()
+            self.load_user_package_option('version_defaults')
+            if self.get_config_key('config_snapshot'):
+                self.store_config_snapshot(config_signature)
+            else:
+                self._config_snapshot.remove()
 
         self.persistent_sessions_dir = self.get_config_key('persistent_sessions_dir')
         self.temporary_sessions_dir = self.get_config_key('temporary_sessions_dir')
@@ -230,10 +293,19 @@ class Manager(object):
             if not os.path.lexists(d):
                 os.makedirs(d)
 
+        if self.get_config_key('catalog_cache'):
+            CATALOG_CACHE.set_cache_dir(os.path.join(self.USER_RC_DIR, self.CACHE_DIR_NAME, self.CATALOG_CACHE_DIR_NAME))
+        if self.get_config_key('resolution_cache'):
+            RESOLUTION_CACHE.set_cache_dir(os.path.join(self.USER_RC_DIR, self.CACHE_DIR_NAME, self.RESOLUTION_CACHE_DIR_NAME))
+            RESOLUTION_CACHE.set_shared_dir(self.get_config_key('resolution_cache_shared_dir'))
+            RESOLUTION_CACHE.set_size(self.get_config_key('resolution_cache_size'))
+        if self.get_config_key('lazy_loading'):
+            PACKAGE_INDEX.set_cache_dir(os.path.join(self.USER_RC_DIR, self.CACHE_DIR_NAME, self.PACKAGE_INDEX_DIR_NAME))
+        Session.set_session_store(self.create_session_store(self.get_config_key('session_store')))
+        Session.set_loader_processes(self.get_config_key('loader_processes'))
+        Session.set_undo_log(self.get_config_key('undo_log'))
+
         self._session = None
-        self.package_options = {}
-        self.package_options_from = {}
-        self.load_user_package_option('version_defaults')
 
         self.load_translator()
         #self.restore_session()
@@ -283,6 +355,40 @@ class Manager(object):
     def sync_session(self):
         self.session.sync()
 
+    def start_daemon(self):
+        status = get_daemon_status(self.DAEMON_SOCKET)
+        if status is not None:
+            PRINT("zapper daemon is already running (pid {})".format(status['pid']))
+            return
+        status = start_daemon(self.DAEMON_SOCKET,
+            idle_timeout=self.get_config_key('daemon_idle_timeout'),
+            log_file=self.DAEMON_LOG_FILE)
+        if status is None:
+            raise DaemonError("cannot start zapper daemon; see {}".format(self.DAEMON_LOG_FILE))
+        PRINT("started zapper daemon (pid {})".format(status['pid']))
+
+    def stop_daemon(self):
+        status = get_daemon_status(self.DAEMON_SOCKET)
+        if status is None or not stop_daemon(self.DAEMON_SOCKET):
+            PRINT("zapper daemon is not running")
+        else:
+            PRINT("stopped zapper daemon (pid {})".format(status['pid']))
+
+    def show_daemon_status(self):
+        status = get_daemon_status(self.DAEMON_SOCKET)
+        if status is None:
+            PRINT("zapper daemon is not running")
+            return
+        PRINT("zapper daemon is running (pid {})".format(status['pid']))
+        PRINT("  socket:       {}".format(status['socket']))
+        PRINT("  version:      {}".format(status['version']))
+        PRINT("  uptime:       {:.0f}s".format(time.time() - status['start_time']))
+        PRINT("  idle timeout: {}".format(status['idle_timeout']))
+        PRINT("  requests:     {}".format(status['requests']))
+        PRINT("  running:      {}".format(status.get('running', 0)))
+        for package_dir in status['package_dirs']:
+            PRINT("  package dir:  {}".format(package_dir))
+
     def set_dry_run(self, dry_run):
         self._dry_run = bool(dry_run)
 
@@ -329,6 +435,86 @@ class Manager(object):
     def set_package_dir_format(self, value):
         self._package_dir_format = Session.PackageDirFormat(value)
 
+    @property
+    def host_config(self):
+        if self._host_config is None:
+            self._host_config = HostConfig(self.host_config_file)
+            if self.config is not None:
+                self._set_default_directories(self._host_config)
+        return self._host_config
+
+    @property
+    def user_config(self):
+        if self._user_config is None:
+            self._user_config = UserConfig(self.user_config_file)
+        return self._user_config
+
+    def _set_default_directories(self, host_config):
+        if not host_config['config']['directories']:
+            dirs = filter(lambda x: x is not None, [self.host_package_dir, self.user_package_dir])
+            host_config['config']['directories'] = list_to_string(dirs)
+
+    def get_last_session(self):
+        if self._user_config is None and self._config_snapshot_data is not None:
+            return self._config_snapshot_data['last_session']
+        return self.user_config['sessions']['last_session']
+
+    def load_config_snapshot(self, config_signature):
+        """load_config_snapshot(config_signature) -> True if loaded
+Loads the merged host/user config from the config snapshot, without
+parsing the config files"""
+        data = self._config_snapshot.load(config_signature)
+        if data is None:
+            return False
+        try:
+            for categories_s in data['categories']:
+                if categories_s:
+                    Category.add_category(*categories_s.split(':'))
+            for label in 'host', 'user':
+                self._restricted_keys[label] = set(data['restricted_keys'][label])
+            # only the keys set by the host/user configs are stored
+            label_configs = {'host': {}, 'user': {}}
+            for key, from_label in data['config_from'].items():
+                label_configs[from_label][key] = data['config'][key]
+            self.config = {}
+            self.config_from = {}
+            for from_label, from_config in (self.DEFAULT_LABEL, self.DEFAULT_CONFIG), ('host', label_configs['host']), ('user', label_configs['user']):
+                self._update_config(from_label, from_config, self.config, self.config_from)
+            option = 'version_defaults'
+            self.package_options[option] = dict(data[option])
+            self.package_options_from[option] = dict(data[option + '_from'])
+        except Exception as e:
+            trace()
+            LOGGER.debug("cannot apply config snapshot {}: {}: {}".format(self._config_snapshot.snapshot_file, e.__class__.__name__, e))
+            self.config = None
+            self.config_from = None
+            return False
+        LOGGER.debug("config loaded from snapshot {}".format(self._config_snapshot.snapshot_file))
+        self._config_snapshot_data = data
+        return True
+
+    def store_config_snapshot(self, config_signature):
+        """store_config_snapshot(config_signature)
+Stores the merged host/user config in the config snapshot"""
+        configs = {'host': self.host_config['config'], 'user': self.user_config['config']}
+        config = {}
+        config_from = {}
+        for key, from_label in self.config_from.items():
+            if from_label in configs:
+                config[key] = configs[from_label][key]
+                config_from[key] = from_label
+        option = 'version_defaults'
+        data = {
+            'categories': [self.host_config['general']['categories'], self.user_config['general']['categories']],
+            'restricted_keys': {label: sorted(self._restricted_keys[label]) for label in ('host', 'user')},
+            'config': config,
+            'config_from': config_from,
+            option: self.package_options[option],
+            option + '_from': self.package_options_from[option],
+            'last_session': self.user_config['sessions']['last_session'],
+        }
+        self._config_snapshot.store(config_signature, data)
+
     def load_general(self):
         # host categories:
         categories_s = self.host_config['general']['categories']
@@ -787,6 +973,7 @@ class Manager(object):
         self.config_from = {}
         for from_label, from_config in (self.DEFAULT_LABEL, self.DEFAULT_CONFIG), ('host', host_config), ('user', user_config):
             self._update_config(from_label, from_config, self.config, self.config_from)
+        self._set_default_directories(self.host_config)
 
     def load_session_config(self):
         session_config = self.session_config['config']
@@ -797,8 +984,7 @@ class Manager(object):
         def _verify_session_root(session_type, session_root):
             if session_root:
                 LOGGER.debug("trying to load {} session {}".format(session_type, session_root))
-                session_config_file = Session.get_session_config_file(session_root)
-                if not os.path.lexists(session_config_file):
+                if not Session.session_exists(session_root):
                     LOGGER.warning("cannot restore {} session {} since it does not exist".format(session_type, session_root))
                     session_root = None
             return session_root
@@ -812,7 +998,7 @@ class Manager(object):
             if default_session == self.DEFAULT_SESSION_LAST:
                 session_root = _verify_session_root(
                     'last used',
-                    self.user_config['sessions']['last_session'])
+                    self.get_last_session())
             elif default_session == self.DEFAULT_SESSION_NEW:
                 session_root = None
             else:
@@ -838,8 +1024,7 @@ class Manager(object):
     def load_session(self, session_name):
         for sessions_dir in self.persistent_sessions_dir, self.temporary_sessions_dir:
             session_root = os.path.join(sessions_dir, session_name)
-            session_config_file = Session.get_session_config_file(session_root)
-            if os.path.lexists(session_config_file):
+            if Session.session_exists(session_root):
                 self._load_session_root(session_root)
                 break
         else:
@@ -879,6 +1064,8 @@ class Manager(object):
         session_type = None
         if session_name is None:
             session_type = Session.SESSION_TYPE_TEMPORARY
+            if self.get_config_key('session_gc'):
+                self._lazy_gc_sessions()
             session_root = Session.create_unique_session_root(self.temporary_sessions_dir)
             session_name = os.path.basename(session_root)
         else:
@@ -931,6 +1118,91 @@ class Manager(object):
             else:
                 Session.copy(source_session_name, source_session_root, target_session_root)
 
+    def create_session_store(self, session_store_name):
+        if session_store_name == Session.SESSION_STORE_SQLITE:
+            return SqliteSessionStore(os.path.join(self.USER_RC_DIR, self.SESSION_DB_FILE),
+                                      journal_mode=self.get_config_key('session_db_journal_mode'))
+        else:
+            return FileSessionStore()
+
+    def migrate_sessions(self, session_store, remove=False):
+        source_session_store = Session.SESSION_STORE
+        if session_store == source_session_store.STORE_NAME:
+            LOGGER.info("sessions are already stored in {}".format(session_store))
+            return
+        target_session_store = self.create_session_store(session_store)
+        count = 0
+        for sessions_dir in self.persistent_sessions_dir, self.temporary_sessions_dir:
+            for session_root in source_session_store.get_session_roots(sessions_dir):
+                session_name = os.path.basename(session_root)
+                if target_session_store.exists(session_root) and not self._force:
+                    LOGGER.warning("session {!r} already exists in {} - not migrated".format(session_name, session_store))
+                    continue
+                LOGGER.info("migrating session {!r}...".format(session_name))
+                if self._dry_run:
+                    continue
+                target_session_config = target_session_store.get_session_config(session_root)
+                target_session_config.copy_config(source_session_store.get_session_config(session_root))
+                target_session_config.store()
+                if remove:
+                    source_session_store.delete(session_root)
+                count += 1
+        PRINT("migrated {} to {}".format(plural_string('session', count), session_store))
+        self.set_user_config(['session_store={}'.format(session_store)])
+
+    def _lazy_gc_sessions(self):
+        # at most one collection every session_gc_interval seconds
+        stamp_file = os.path.join(self.temporary_sessions_dir, self.SESSION_GC_STAMP_FILE)
+        try:
+            last_gc_time = os.stat(stamp_file).st_mtime
+        except OSError:
+            last_gc_time = None
+        if last_gc_time is not None and time.time() - last_gc_time < self.get_config_key('session_gc_interval'):
+            return
+        try:
+            # touched before collecting, so that concurrent shells do not collect too
+            with open(stamp_file, "a"):
+                os.utime(stamp_file)
+        except OSError as e:
+            LOGGER.debug("cannot touch {}: {}: {}".format(stamp_file, e.__class__.__name__, e))
+            return
+        count = self._collect_stale_sessions()
+        LOGGER.debug("session gc: deleted {}".format(plural_string('stale temporary session', count)))
+
+    def _collect_stale_sessions(self, simulate=False):
+        min_age = self.get_config_key('session_gc_min_age')
+        max_age = self.get_config_key('session_gc_max_age')
+        excluded_session_roots = {self.get_last_session()}
+        if self.session is not None:
+            excluded_session_roots.add(self.session.session_root)
+        count = 0
+        for session_root in Session.get_session_roots(self.temporary_sessions_dir):
+            if session_root in excluded_session_roots:
+                continue
+            try:
+                session_config = Session.get_session_config(session_root)
+                if session_config['session']['type'] != Session.SESSION_TYPE_TEMPORARY:
+                    continue
+                if string_to_bool(session_config['config']['read_only'] or 'False'):
+                    continue
+                if not is_session_stale(session_config, min_age=min_age, max_age=max_age):
+                    continue
+                LOGGER.debug("session gc: deleting stale session {}".format(session_root))
+                if not simulate:
+                    Session.SESSION_STORE.delete(session_root)
+                count += 1
+            except Exception as e:
+                trace()
+                LOGGER.debug("session gc: cannot check session {}: {}: {}".format(session_root, e.__class__.__name__, e))
+        return count
+
+    def gc_sessions(self, simulate=False):
+        count = self._collect_stale_sessions(simulate=simulate or self._dry_run)
+        if simulate or self._dry_run:
+            PRINT("{} would be deleted".format(plural_string('stale temporary session', count)))
+        else:
+            PRINT("deleted {}".format(plural_string('stale temporary session', count)))
+
     def delete_session(self, session_name_pattern):
         if session_name_pattern is None:
             session_name_pattern = self.session.session_name
@@ -963,8 +1235,7 @@ class Manager(object):
             dl.append((Session.SESSION_TYPE_TEMPORARY, self.temporary_sessions_dir))
         for session_type, sessions_dir in dl:
             session_root = os.path.join(sessions_dir, session_name)
-            session_config_file = Session.get_session_config_file(session_root)
-            exists = os.path.lexists(session_config_file)
+            exists = Session.session_exists(session_root)
             if _check == 'must_exist' and not exists:
                 continue
             elif _check == 'mustnt_exist' and exists:
@@ -992,9 +1263,7 @@ class Manager(object):
             sessions_dirs.append(self.persistent_sessions_dir)
         l = []
         for sessions_dir in sessions_dirs:
-            session_root_pattern = os.path.join(sessions_dir, '*')
-            for session_config_file in glob.glob(Session.get_session_config_file(session_root_pattern)):
-                session_root = Session.get_session_root(session_config_file)
+            for session_root in Session.get_session_roots(sessions_dir):
                 session_name = os.path.basename(session_root)
                 l.append(session_name)
         print(' '.join(l))
@@ -1049,6 +1318,8 @@ class Manager(object):
         print(' '.join(self.config.keys()))
 
     def complete_product_names(self, *ignore_p_args, **ignore_n_args):
+        if self.session is not None:
+            self.session.load_all_modules()
         print(' '.join(Product.get_product_names()))
 
     def complete_host_version_defaults(self, *ignore_p_args, **ignore_n_args):
@@ -1074,9 +1345,7 @@ class Manager(object):
             dl.append((Session.SESSION_TYPE_PERSISTENT, self.persistent_sessions_dir))
         rows = []
         for session_type, sessions_dir in dl:
-            session_root_pattern = os.path.join(sessions_dir, '*')
-            for session_config_file in glob.glob(Session.get_session_config_file(session_root_pattern)):
-                session_root = Session.get_session_root(session_config_file)
+            for session_root in Session.get_session_roots(sessions_dir):
                 session_name = os.path.basename(session_root)
                 if session_name == self.session.session_name:
                     mark_current = '*'
@@ -1111,18 +1380,41 @@ class Manager(object):
             session = self.session
         else:
             session_root = self.get_session_root(session_name)
-            if session_root is None or not os.path.lexists(Session.get_session_config_file(session_root)):
+            if session_root is None or not Session.session_exists(session_root):
                 LOGGER.error("session {!r} does not exists".format(session_name))
                 return
             session = self.session.new_session(session_root)
         session.info()
 
-    def load_package_labels(self, package_labels, resolution_level=0, subpackages=False, sticky=False, simulate=False):
+    def load_package_labels(self, package_labels, resolution_level=0, subpackages=False, sticky=False, simulate=False, resolver=None):
+        if resolver is not None:
+            self.session.set_resolver(resolver)
         self.session.load_package_labels(package_labels, resolution_level=resolution_level, subpackages=subpackages, sticky=sticky, simulate=simulate)
 
     def unload_package_labels(self, package_labels, resolution_level=0, subpackages=False, sticky=False, simulate=False):
         self.session.unload_package_labels(package_labels, resolution_level=resolution_level, subpackages=subpackages, sticky=sticky, simulate=simulate)
 
+    def run_command(self, command, package_labels, resolution_level=0, subpackages=False, resolver=None):
+        if command and command[0] == '--':
+            command = command[1:]
+        if not command:
+            raise ValueError("missing command")
+        if package_labels:
+            self.load_package_labels(package_labels, resolution_level=resolution_level, subpackages=subpackages, resolver=resolver)
+        self.session.environment.flush()
+        environment = self.session.environment.copy()
+        environment.update(self.session.get_undo_environment())
+        environment[self.LOADED_PACKAGES_VARNAME] = ':'.join(package.absolute_label for package in self.session.loaded_packages())
+        executable = shutil.which(command[0], path=environment.get('PATH', None))
+        if executable is None:
+            raise ValueError("command {!r} not found".format(command[0]))
+        if self._dry_run:
+            LOGGER.info("running {}...".format(' '.join(command)))
+            return
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os.execve(executable, command, environment)
+
     def clear_packages(self, sticky=False, simulate=False):
         self.session.clear(sticky=sticky, simulate=simulate)
 
@@ -1132,8 +1424,14 @@ class Manager(object):
     def revert(self, translator=None, translation_filename=None):
         pass
 
-    def initialize(self):
-        if not self.session:
+    def initialize(self, *, volatile=False):
+        if volatile:
+            if self.session:
+                self.session.set_volatile()
+            else:
+                self.session = Session.create_volatile(self)
+                self._init_session()
+        elif not self.session:
             if self._dry_run:
                 return
             else:
@@ -1169,14 +1467,18 @@ class Manager(object):
         if isinstance(filter_packages, Expression):
             self.session.filter_packages(self.config['filter_packages'])
         self.session.set_version_defaults(self.package_options['version_defaults'])
+        self.session.set_resolver(self.get_config_key('resolver'))
+        self.session.set_translation_mode(self.get_config_key('translation_mode'))
 
     def finalize(self):
         if self.session:
             self.session.finalize()
-        self.user_config['sessions']['last_session'] = self.session.session_root
-        if not self._dry_run:
-            self.user_config.store()
+        if self.get_last_session() != self.session.session_root:
+            self.user_config['sessions']['last_session'] = self.session.session_root
+            if not self._dry_run:
+                self.user_config.store()
         self.translate()
+        LOGGER.debug("lock stats: {}".format(LOCK_STATS))
 
     def translate(self, translator=None, translation_filename=None):
         if translator is None:
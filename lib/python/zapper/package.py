@@ -26,6 +26,7 @@ from .version import Version
 from .registry import ListRegister
 from .product import Product
 from .package_expressions import NAME, PACKAGE, HAS_TAG
+from .package_collection import PackageCollection
 from .tag import Tag
 from .expression import Expression, ConstExpression
 from .text import fill
@@ -236,18 +237,31 @@ class Package(ListRegister, PPCommonBase):
         return iter(self._tags)
 
     def match_expressions(self, packages, expressions):
-        packages = tuple(packages)
+        if isinstance(packages, PackageCollection):
+            # the expressions are evaluated only on the indexed candidates
+            package_collection = packages
+            packages = None
+        else:
+            package_collection = None
+            packages = tuple(packages)
         unmatched = []
         matched = []
         matched_d = collections.defaultdict(list)
         for expression in expressions:
             found = False
-            for package in packages:
+            function = expression.get_function()
+            candidates = packages
+            if package_collection is not None:
+                candidates = package_collection.get_candidates(expression)
+                if candidates is None:
+                    if packages is None:
+                        packages = tuple(package_collection.values())
+                    candidates = packages
+            for package in candidates:
                 if package is self:
                     # a package cannot require/prefer itself
                     continue
-                expression.bind(package)
-                if expression.get_value():
+                if function(package):
                     #matched.append((self, expression, package))
                     #input("... {0} vs {1} [{2}]".format(self, package, expression))
                     matched_d[(package.product, expression)].append(package)
@@ -255,15 +269,15 @@ class Package(ListRegister, PPCommonBase):
             if not found:
                 unmatched.append((self, expression))
         for (product, expression), matching_packages in matched_d.items():
-            matching_packages.sort(key=lambda package: package._version)
+            matching_packages.sort(key=lambda package: package._version.sort_key)
             matched.append((self, expression, matching_packages))
         return matched, unmatched
 
     @classmethod
     def filter(cls, packages, expression):
+        function = expression.get_function()
         for package in packages:
-            expression.bind(package)
-            if expression.get_value():
+            if function(package):
                 yield package
  
     def register(self):
@@ -17,15 +17,63 @@
 
 __author__ = 'Simone Campagna'
 
+import bisect
+import itertools
 import collections
 
+from .version import Version
+from .version_operators import TrueOperatorVersion, EqVersionOperator, \
+                               LtVersionOperator, LeVersionOperator, GtVersionOperator, GeVersionOperator
+from .package_expressions import cached_index_keys, version_operators
 from .utils.debug import LOGGER
 
 
+class _VersionSortedPackages(object):
+    """_VersionSortedPackages()
+Packages sorted by version; the sort keys are kept parallel to the
+packages, so that they can be bisected without the key argument
+(python >= 3.10)"""
+    __slots__ = ('packages', 'sort_keys')
+
+    def __init__(self):
+        self.packages = []
+        self.sort_keys = []
+
+    def __len__(self):
+        return len(self.packages)
+
+    def add(self, package):
+        sort_key = package.version.sort_key
+        position = bisect.bisect_right(self.sort_keys, sort_key)
+        self.sort_keys.insert(position, sort_key)
+        self.packages.insert(position, package)
+
+    def remove(self, package):
+        position = self.packages.index(package)
+        del self.packages[position]
+        del self.sort_keys[position]
+
+    def lower(self, sort_key, inclusive):
+        """lower(sort_key, inclusive) -> list of packages
+Returns the packages with sort key < sort_key (<= if inclusive)"""
+        bisect_function = bisect.bisect_right if inclusive else bisect.bisect_left
+        return self.packages[:bisect_function(self.sort_keys, sort_key)]
+
+    def upper(self, sort_key, inclusive):
+        """upper(sort_key, inclusive) -> list of packages
+Returns the packages with sort key > sort_key (>= if inclusive)"""
+        bisect_function = bisect.bisect_left if inclusive else bisect.bisect_right
+        return self.packages[bisect_function(self.sort_keys, sort_key):]
+
 class PackageCollection(collections.OrderedDict):
     def __init__(self):
         super().__init__(self)
         self._changed_package_absolute_labels = []
+        self._ordinals = {}
+        self._ordinal_counter = itertools.count()
+        self._name_index = collections.defaultdict(_VersionSortedPackages)
+        self._absolute_name_index = collections.defaultdict(_VersionSortedPackages)
+        self._name_version_index = collections.defaultdict(list)
 
     def is_changed(self):
         return bool(self._changed_package_absolute_labels)
@@ -34,11 +82,18 @@ class PackageCollection(collections.OrderedDict):
         old_package = super().get(package_absolute_label, None)
         if old_package != package:
             self._changed_package_absolute_labels.append(package_absolute_label)
+        if old_package is not None:
+            self._unindex(old_package)
+        else:
+            self._ordinals[package_absolute_label] = next(self._ordinal_counter)
         super().__setitem__(package_absolute_label, package)
+        self._index(package)
        
     def __delitem__(self, package_absolute_label):
         if package_absolute_label in self:
             self._changed_package_absolute_labels.append(package_absolute_label)
+            self._unindex(super().__getitem__(package_absolute_label))
+            del self._ordinals[package_absolute_label]
             super().__delitem__(package_absolute_label)
 
     def add_package(self, package):
@@ -46,7 +101,7 @@ class PackageCollection(collections.OrderedDict):
         if package_absolute_label in self and self[package_absolute_label].source_file != package.source_file:
             #raise SessionError("package {0} hides {1}".format(package.absolute_label, self[package_absolute_label].absolute_label))
             LOGGER.warning("package {} from {}:{} hides {} from {}:{}".format(
-                package.absolute_label, package.source_dir, package.source_file, 
+                package.absolute_label, package.source_dir, package.source_file,
                 self[package_absolute_label].absolute_label, self[package_absolute_label].source_dir, self[package_absolute_label].source_file))
             #assert False
         self[package_absolute_label] = package
@@ -55,3 +110,99 @@ class PackageCollection(collections.OrderedDict):
         package_absolute_label = package.absolute_label
         del self[package_absolute_label]
 
+    def clear(self):
+        super().clear()
+        self._ordinals.clear()
+        self._name_index.clear()
+        self._absolute_name_index.clear()
+        self._name_version_index.clear()
+
+    def pop(self, package_absolute_label, *default):
+        if package_absolute_label in self:
+            package = self[package_absolute_label]
+            del self[package_absolute_label]
+            return package
+        return super().pop(package_absolute_label, *default)
+
+    def popitem(self, last=True):
+        package_absolute_label = next(reversed(self) if last else iter(self))
+        return package_absolute_label, self.pop(package_absolute_label)
+
+    def _index(self, package):
+        self._name_index[package.name].add(package)
+        self._absolute_name_index[package.absolute_name].add(package)
+        self._name_version_index[(package.name, str(package.version))].append(package)
+
+    def _unindex(self, package):
+        for index, key in (self._name_index, package.name), \
+                          (self._absolute_name_index, package.absolute_name), \
+                          (self._name_version_index, (package.name, str(package.version))):
+            packages = index[key]
+            packages.remove(package)
+            if not packages:
+                del index[key]
+
+    def _sorted(self, packages):
+        # collection order, as for a linear scan
+        ordinals = self._ordinals
+        return sorted(packages, key=lambda package: ordinals[package.absolute_label])
+
+    def get_packages_by_name(self, name, version_operator=None):
+        """get_packages_by_name(name, version_operator=None) -> list of packages
+Returns, in collection order, the packages with the given name whose
+version matches version_operator"""
+        return self._sorted(self._find(self._name_index, name, version_operator))
+
+    def get_packages_by_absolute_name(self, absolute_name, version_operator=None):
+        """get_packages_by_absolute_name(absolute_name, version_operator=None) -> list of packages"""
+        return self._sorted(self._find(self._absolute_name_index, absolute_name, version_operator))
+
+    def get_candidates(self, expression):
+        """get_candidates(expression) -> list of packages or None
+Returns, in collection order, a superset of the packages matching
+expression, found through the indexes; returns None if expression
+cannot be indexed"""
+        keys = cached_index_keys(expression)
+        if keys is None:
+            return None
+        operators = version_operators(expression)
+        if operators:
+            # equality narrows more than a range
+            operators.sort(key=lambda version_operator: not isinstance(version_operator, EqVersionOperator))
+            version_operator = operators[0]
+        else:
+            version_operator = None
+        candidates = {}
+        for attribute_name, value in keys:
+            if attribute_name == 'name':
+                packages = self._find(self._name_index, value, version_operator)
+            elif attribute_name == 'absolute_name':
+                packages = self._find(self._absolute_name_index, value, version_operator)
+            else:
+                package = super().get(value, None)
+                packages = () if package is None else (package, )
+            for package in packages:
+                candidates[package.absolute_label] = package
+        return self._sorted(candidates.values())
+
+    def _find(self, index, key, version_operator):
+        sorted_packages = index.get(key, None)
+        if not sorted_packages:
+            return []
+        packages = sorted_packages.packages
+        if version_operator is None or isinstance(version_operator, TrueOperatorVersion):
+            return packages
+        operator_class = type(version_operator)
+        if operator_class is EqVersionOperator and index is self._name_index:
+            return self._name_version_index.get((key, str(version_operator.version)), [])
+        try:
+            version = Version(version_operator.version)
+        except ValueError:
+            version = None
+        if version is not None:
+            # range queries on the version-sorted list
+            if operator_class is LtVersionOperator or operator_class is LeVersionOperator:
+                packages = sorted_packages.lower(version.sort_key, operator_class is LeVersionOperator)
+            elif operator_class is GtVersionOperator or operator_class is GeVersionOperator:
+                packages = sorted_packages.upper(version.sort_key, operator_class is GeVersionOperator)
+        return [package for package in packages if version_operator(package.version)]
@@ -18,9 +18,15 @@
 __author__ = 'Simone Campagna'
 
 import abc
+import ast
+import operator
 import collections
 
-from .expression import Expression, AttributeGetter, InstanceGetter, MethodCaller, ConstExpression
+from .expression import Expression, AttributeGetter, InstanceGetter, MethodCaller, ConstExpression, \
+                        And, Or, Eq, Ne, Lt, Le, Gt, Ge
+from .version import Version
+from .version_operators import EqVersionOperator, NeVersionOperator, \
+                               LtVersionOperator, LeVersionOperator, GtVersionOperator, GeVersionOperator
 
 __all__ = ['Package',
            'NAME',
@@ -32,7 +38,12 @@ __all__ = ['Package',
            'PACKAGE',
            'PRODUCT',
            'HAS_TAG',
-           'ALL_EXPRESSIONS']
+           'ALL_EXPRESSIONS',
+           'parse_expression',
+           'required_names',
+           'index_keys',
+           'cached_index_keys',
+           'version_operators']
 
 NAME = AttributeGetter('name', 'NAME')
 ABSOLUTE_NAME = AttributeGetter('absolute_name', 'ABSOLUTE_NAME')
@@ -58,3 +69,196 @@ ALL_EXPRESSIONS = {
     'HAS_TAG': HAS_TAG,
 }
 
+_BINARY_OPERATORS = {
+    ast.BitAnd:     operator.and_,
+    ast.BitOr:      operator.or_,
+    ast.Add:        operator.add,
+    ast.Sub:        operator.sub,
+    ast.Mult:       operator.mul,
+    ast.Div:        operator.truediv,
+    ast.FloorDiv:   operator.floordiv,
+    ast.Mod:        operator.mod,
+    ast.Pow:        operator.pow,
+}
+
+_UNARY_OPERATORS = {
+    ast.Invert:     operator.invert,
+    ast.UAdd:       operator.pos,
+    ast.USub:       operator.neg,
+}
+
+_COMPARE_OPERATORS = {
+    ast.Eq:         operator.eq,
+    ast.NotEq:      operator.ne,
+    ast.Lt:         operator.lt,
+    ast.LtE:        operator.le,
+    ast.Gt:         operator.gt,
+    ast.GtE:        operator.ge,
+}
+
+def _build_expression(node):
+    if isinstance(node, ast.Constant) and isinstance(node.value, (str, int, float, bool)):
+        return node.value
+    elif isinstance(node, ast.Name):
+        if not node.id in ALL_EXPRESSIONS:
+            raise ValueError("undefined name {!r}".format(node.id))
+        return ALL_EXPRESSIONS[node.id]
+    elif isinstance(node, ast.BinOp) and type(node.op) in _BINARY_OPERATORS:
+        return _BINARY_OPERATORS[type(node.op)](_build_expression(node.left), _build_expression(node.right))
+    elif isinstance(node, ast.UnaryOp) and type(node.op) in _UNARY_OPERATORS:
+        return _UNARY_OPERATORS[type(node.op)](_build_expression(node.operand))
+    elif isinstance(node, ast.Compare) and len(node.ops) == 1 and type(node.ops[0]) in _COMPARE_OPERATORS:
+        return _COMPARE_OPERATORS[type(node.ops[0])](_build_expression(node.left), _build_expression(node.comparators[0]))
+    elif isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id == 'HAS_TAG' \
+         and len(node.args) == 1 and not node.keywords:
+        tag = _build_expression(node.args[0])
+        if not isinstance(tag, str):
+            raise ValueError("HAS_TAG requires a string argument")
+        return HAS_TAG(tag)
+    else:
+        raise ValueError("unsupported {} element".format(node.__class__.__name__))
+
+def parse_expression(source):
+    """parse_expression(source) -> expression, constant or tuple
+Parses an expression without evaluating any code: only the ALL_EXPRESSIONS
+names, constants and operators are accepted. A top level tuple returns a
+tuple of items"""
+    try:
+        tree = ast.parse(source.strip(), mode='eval')
+    except SyntaxError as e:
+        raise ValueError("invalid expression {!r}: {}".format(source, e.msg))
+    try:
+        if isinstance(tree.body, ast.Tuple):
+            return tuple(_build_expression(node) for node in tree.body.elts)
+        else:
+            return _build_expression(tree.body)
+    except ValueError as e:
+        raise ValueError("invalid expression {!r}: {}".format(source, e))
+
+def _split_getter_const(expression):
+    left, right = expression.left_operand, expression.right_operand
+    if isinstance(left, ConstExpression):
+        left, right = right, left
+    if isinstance(left, (AttributeGetter, InstanceGetter)) and isinstance(right, ConstExpression):
+        return left, right.const_value
+    else:
+        return None, None
+
+def required_names(expression):
+    """required_names(expression) -> set of product names or None
+Returns the names of the products whose packages can match expression, or
+None if they cannot be determined without evaluating it"""
+    if isinstance(expression, And):
+        l_names = required_names(expression.left_operand)
+        r_names = required_names(expression.right_operand)
+        if l_names is None:
+            return r_names
+        elif r_names is None:
+            return l_names
+        else:
+            return l_names.intersection(r_names)
+    elif isinstance(expression, Or):
+        l_names = required_names(expression.left_operand)
+        r_names = required_names(expression.right_operand)
+        if l_names is None or r_names is None:
+            return None
+        else:
+            return l_names.union(r_names)
+    elif isinstance(expression, Eq):
+        getter, value = _split_getter_const(expression)
+        if isinstance(getter, InstanceGetter):
+            # PACKAGE == package: the package is already defined
+            return set()
+        elif isinstance(getter, AttributeGetter):
+            if getter.attribute_name == 'name':
+                return {str(value)}
+            elif getter.attribute_name == 'product':
+                return {str(value)}
+    return None
+
+def index_keys(expression, *, tags=False):
+    """index_keys(expression, *, tags=False) -> set of (attribute_name, value) or None
+Returns the index keys of the packages that can match expression: a package
+can match only if getattr(package, attribute_name) == value for one of the
+keys. The attribute names are 'name', 'absolute_name' and 'absolute_label';
+if tags is True, ('tag', tag) keys are returned for HAS_TAG(tag).
+Returns None if expression cannot be indexed"""
+    if isinstance(expression, And):
+        l_keys = index_keys(expression.left_operand, tags=tags)
+        r_keys = index_keys(expression.right_operand, tags=tags)
+        if l_keys is None:
+            return r_keys
+        elif r_keys is None:
+            return l_keys
+        elif len(r_keys) < len(l_keys):
+            return r_keys
+        else:
+            return l_keys
+    elif isinstance(expression, Or):
+        l_keys = index_keys(expression.left_operand, tags=tags)
+        r_keys = index_keys(expression.right_operand, tags=tags)
+        if l_keys is None or r_keys is None:
+            return None
+        else:
+            return l_keys.union(r_keys)
+    elif isinstance(expression, Eq):
+        getter, value = _split_getter_const(expression)
+        if isinstance(getter, InstanceGetter):
+            absolute_label = getattr(value, 'absolute_label', None)
+            if isinstance(absolute_label, str):
+                return {('absolute_label', absolute_label)}
+        elif isinstance(getter, AttributeGetter):
+            attribute_name = getter.attribute_name
+            if attribute_name == 'product':
+                # products have no __eq__: value must be the product itself
+                name = getattr(value, 'name', None)
+                if isinstance(name, str):
+                    return {('name', name)}
+            elif attribute_name in {'name', 'absolute_name', 'absolute_label'} and isinstance(value, str):
+                return {(attribute_name, value)}
+    elif tags and isinstance(expression, MethodCaller):
+        if expression.method_name == 'has_tag' and len(expression.method_p_args) == 1 and not expression.method_n_args:
+            return {('tag', expression.method_p_args[0])}
+    return None
+
+def cached_index_keys(expression, *, tags=False):
+    """cached_index_keys(expression, *, tags=False) -> set of (attribute_name, value) or None
+Same as index_keys(), but the keys are computed only once and stored in
+the expression, as its compiled function; the returned set must not be
+changed"""
+    cached_keys = expression.__dict__.get('_index_keys', None)
+    if cached_keys is None:
+        cached_keys = expression._index_keys = {}
+    if not tags in cached_keys:
+        cached_keys[tags] = index_keys(expression, tags=tags)
+    return cached_keys[tags]
+
+_VERSION_OPERATORS = {
+    Eq:     (EqVersionOperator, EqVersionOperator),
+    Ne:     (NeVersionOperator, NeVersionOperator),
+    Lt:     (LtVersionOperator, GtVersionOperator),
+    Le:     (LeVersionOperator, GeVersionOperator),
+    Gt:     (GtVersionOperator, LtVersionOperator),
+    Ge:     (GeVersionOperator, LeVersionOperator),
+}
+
+def version_operators(expression):
+    """version_operators(expression) -> list of version operators
+Returns the VERSION comparisons that all the packages matching expression
+must satisfy"""
+    if isinstance(expression, And):
+        return version_operators(expression.left_operand) + version_operators(expression.right_operand)
+    operator_classes = _VERSION_OPERATORS.get(type(expression), None)
+    if operator_classes is not None:
+        left, right = expression.left_operand, expression.right_operand
+        if left is VERSION and isinstance(right, ConstExpression):
+            operator_class, value = operator_classes[0], right.const_value
+        elif right is VERSION and isinstance(left, ConstExpression):
+            operator_class, value = operator_classes[1], left.const_value
+        else:
+            return []
+        try:
+            return [operator_class(Version(value))]
+        except (TypeError, ValueError):
+            pass
+    return []
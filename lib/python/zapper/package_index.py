@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+#
+# Copyright 2013 Simone Campagna
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+__author__ = 'Simone Campagna'
+
+__all__ = ['PackageIndex', 'PackageIndexCache', 'PACKAGE_INDEX']
+
+import os
+import json
+import hashlib
+import tempfile
+import collections
+
+from .package import Package
+from .product import Product
+from .utils.debug import LOGGER
+from .utils.trace import trace
+
+
+class PackageIndex(object):
+    """PackageIndex(package_dir, fingerprint, module_entries)
+Maps product names and absolute labels to the package files defining
+them in package_dir. Package files depending on other package files
+(for instance for products or suites defined elsewhere) are tracked, so
+that the set of files to be loaded is always closed."""
+    def __init__(self, package_dir, fingerprint, module_entries):
+        self.package_dir = package_dir
+        self.fingerprint = fingerprint
+        self.module_entries = [tuple(module_entry) for module_entry in module_entries]
+        self._names = collections.defaultdict(set)
+        self._absolute_labels = collections.defaultdict(set)
+        self._module_dependencies = collections.defaultdict(set)
+
+    @classmethod
+    def build(cls, package_dir, fingerprint, package_dirs, module_entries):
+        """build(...) -> PackageIndex for the packages registered in package_dirs"""
+        package_index = cls(package_dir, fingerprint, module_entries)
+        module_paths = {module_path for current_dir, module_path in package_index.module_entries}
+        def _add_dependency(source_file, obj):
+            obj_source_file = obj.source_file
+            if obj_source_file != source_file and obj_source_file in module_paths:
+                package_index._module_dependencies[source_file].add(obj_source_file)
+        for p_dir in package_dirs:
+            for package in Package.registered_entry('package_dir', p_dir):
+                source_file = package.source_file
+                if not source_file in module_paths:
+                    continue
+                package_index._names[package.name].add(source_file)
+                package_index._absolute_labels[package.absolute_label].add(source_file)
+                _add_dependency(source_file, package.product)
+                suite = package.suite
+                while suite is not suite.suite:
+                    _add_dependency(source_file, suite)
+                    suite = suite.suite
+        for product in Product.registry('name').values():
+            if product.source_file in module_paths:
+                # the last definition of a product is the one that counts
+                package_index._names[product.name].add(product.source_file)
+        return package_index
+
+    def get_module_entries(self, *, names=(), absolute_labels=()):
+        """get_module_entries(*, names=(), absolute_labels=()) -> module entries
+Returns the ordered (current_dir, module_path) entries of the package files
+needed to define the given names and absolute labels"""
+        module_paths = set()
+        for name in names:
+            module_paths.update(self._names.get(name, ()))
+        for absolute_label in absolute_labels:
+            module_paths.update(self._absolute_labels.get(absolute_label, ()))
+        stack = list(module_paths)
+        while stack:
+            module_path = stack.pop()
+            for dependency in self._module_dependencies.get(module_path, ()):
+                if not dependency in module_paths:
+                    module_paths.add(dependency)
+                    stack.append(dependency)
+        return [module_entry for module_entry in self.module_entries if module_entry[1] in module_paths]
+
+    def has_absolute_label(self, absolute_label):
+        return absolute_label in self._absolute_labels
+
+    def to_dict(self):
+        return {
+            'package_dir': self.package_dir,
+            'fingerprint': self.fingerprint,
+            'module_entries': self.module_entries,
+            'names': {key: sorted(val) for key, val in self._names.items()},
+            'absolute_labels': {key: sorted(val) for key, val in self._absolute_labels.items()},
+            'module_dependencies': {key: sorted(val) for key, val in self._module_dependencies.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, dct):
+        package_index = cls(dct['package_dir'], dct['fingerprint'], dct['module_entries'])
+        for attr_name, key in ('_names', 'names'), ('_absolute_labels', 'absolute_labels'), ('_module_dependencies', 'module_dependencies'):
+            attr = getattr(package_index, attr_name)
+            for k, v in dct[key].items():
+                attr[k].update(v)
+        return package_index
+
+
+class PackageIndexCache(object):
+    """PackageIndexCache(cache_dir=None)
+Persistent storage for PackageIndex objects; when enabled, package files
+are executed on demand."""
+    INDEX_VERSION = 1
+    INDEX_SUFFIX = '.index'
+    def __init__(self, cache_dir=None):
+        self._cache_dir = cache_dir
+
+    def set_cache_dir(self, cache_dir):
+        self._cache_dir = cache_dir
+
+    @property
+    def cache_dir(self):
+        return self._cache_dir
+
+    @property
+    def enabled(self):
+        return self._cache_dir is not None
+
+    def index_file(self, package_dir):
+        key = hashlib.sha1(package_dir.encode('utf-8', 'surrogateescape')).hexdigest()
+        return os.path.join(self._cache_dir, key + self.INDEX_SUFFIX)
+
+    def load(self, package_dir, fingerprint):
+        """load(package_dir, fingerprint) -> PackageIndex or None"""
+        if not self.enabled:
+            return None
+        index_file = self.index_file(package_dir)
+        try:
+            with open(index_file, "r") as f_in:
+                dct = json.load(f_in)
+            if dct.get('version', None) != self.INDEX_VERSION or \
+               dct['package_dir'] != package_dir or dct['fingerprint'] != fingerprint:
+                LOGGER.debug("package index {} is out of date".format(index_file))
+                return None
+            return PackageIndex.from_dict(dct)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            trace()
+            LOGGER.debug("cannot load package index {}: {}: {}".format(index_file, e.__class__.__name__, e))
+            return None
+
+    def store(self, package_index):
+        """store(package_index)"""
+        if not self.enabled:
+            return
+        dct = package_index.to_dict()
+        dct['version'] = self.INDEX_VERSION
+        if not os.path.lexists(self._cache_dir):
+            os.makedirs(self._cache_dir)
+        index_file = self.index_file(package_index.package_dir)
+        fd, tmp_file = tempfile.mkstemp(dir=self._cache_dir, prefix='.', suffix=self.INDEX_SUFFIX)
+        try:
+            with os.fdopen(fd, "w") as f_out:
+                json.dump(dct, f_out)
+            os.replace(tmp_file, index_file)
+        except Exception as e:
+            trace()
+            LOGGER.warning("cannot store package index {}: {}: {}".format(index_file, e.__class__.__name__, e))
+            if os.path.lexists(tmp_file):
+                os.remove(tmp_file)
+
+PACKAGE_INDEX = PackageIndexCache()
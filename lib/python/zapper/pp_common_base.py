@@ -86,12 +86,12 @@ class PPCommonBase(Transition):
     def _match_conflicts(self, loaded_packages):
         conflicts = []
         for expression in self.get_conflicts():
+            function = expression.get_function()
             for loaded_package in loaded_packages:
                 if loaded_package is self:
                     # a package cannot conflicts with itself
                     continue
-                expression.bind(loaded_package)
-                if expression.get_value():
+                if function(loaded_package):
                     conflicts.append((self, expression, loaded_package))
         return conflicts
 
@@ -150,12 +150,20 @@ class PPCommonBase(Transition):
 
     def apply(self, session):
         LOGGER.debug("{0}[{1}]: applying...".format(self.__class__.__name__, self))
-        for transition in self.get_transitions():
-            transition.apply(session)
+        session.begin_undo(self, revert=False)
+        try:
+            for transition in self.get_transitions():
+                transition.apply(session)
+        finally:
+            session.end_undo()
 
     def revert(self, session):
         LOGGER.debug("{0}[{1}]: reverting...".format(self.__class__.__name__, self))
-        for transition in self.get_transitions():
-            transition.revert(session)
+        session.begin_undo(self, revert=True)
+        try:
+            for transition in self.get_transitions():
+                transition.revert(session)
+        finally:
+            session.end_undo()
 
 
@@ -67,6 +67,9 @@ class Product(UniqueRegister, PPCommonBase):
         super().__init__()
         if self._self_conflict:
             self.conflicts(self)
+
+    def __getnewargs_ex__(self):
+        return (self._name, self._category), {}
     
     @classmethod
     def get_product_names(cls):
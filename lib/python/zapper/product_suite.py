@@ -26,3 +26,6 @@ from .product import Product
 class ProductSuite(Product):
     def __new__(cls, name, *, short_description=None, long_description=None):
         return super().__new__(cls, name, category='', short_description=short_description, long_description=long_description)
+
+    def __getnewargs_ex__(self):
+        return (self._name, ), {}
@@ -37,6 +37,9 @@ class BaseRegistry(object):
     def __setitem__(self, key, val):
         self._registry[key] = val
 
+    def __delitem__(self, key):
+        del self._registry[key]
+
     def get(self, key, default=None):
         return self._registry.get(key, default)
 
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+#
+# Copyright 2013 Simone Campagna
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+__author__ = 'Simone Campagna'
+
+__all__ = ['RequirementGraph']
+
+import collections
+
+
+class RequirementGraph(object):
+    """RequirementGraph()
+Requirement graph of the loaded packages: for each loaded package and
+for each of its requirements, the labels of the loaded packages matching
+the requirement (the providers). The reverse graph (the dependents of
+each provider) is kept too, so that the packages broken by an unload are
+found by walking the edges of the unloaded packages."""
+    def __init__(self):
+        self._providers = {}
+        self._dependents = collections.defaultdict(set)
+
+    def clear(self):
+        self._providers.clear()
+        self._dependents.clear()
+
+    def __contains__(self, package_label):
+        return package_label in self._providers
+
+    def labels(self):
+        return self._providers.keys()
+
+    def providers(self, package_label):
+        """providers(package_label) -> list of sets of provider labels"""
+        return self._providers[package_label]
+
+    def dependents(self, package_label):
+        """dependents(package_label) -> set of dependent labels"""
+        return self._dependents.get(package_label, set())
+
+    def _match(self, package, requirement, loaded_packages):
+        candidates = loaded_packages.get_candidates(requirement)
+        if candidates is None:
+            candidates = loaded_packages.values()
+        function = requirement.get_function()
+        return {pkg.absolute_label for pkg in candidates if pkg is not package and function(pkg)}
+
+    def _set_providers(self, package_label, providers):
+        self._providers[package_label] = providers
+        for label_set in providers:
+            for provider_label in label_set:
+                self._dependents[provider_label].add(package_label)
+
+    def add_package(self, package, loaded_packages):
+        """add_package(package, loaded_packages)
+Adds a loaded package; loaded_packages is the PackageCollection of the
+loaded packages"""
+        package_label = package.absolute_label
+        if package_label in self._providers:
+            self.remove_package(package)
+        self._set_providers(package_label,
+            [self._match(package, requirement, loaded_packages) for requirement in package.get_requirements()])
+        # package can be a provider of the other loaded packages
+        for dependent_label, providers in self._providers.items():
+            if dependent_label == package_label:
+                continue
+            dependent = loaded_packages.get(dependent_label, None)
+            if dependent is None:
+                continue
+            for label_set, requirement in zip(providers, dependent.get_requirements()):
+                if requirement.get_function()(package):
+                    label_set.add(package_label)
+                    self._dependents[package_label].add(dependent_label)
+
+    def remove_package(self, package):
+        """remove_package(package)
+Removes an unloaded package"""
+        package_label = package.absolute_label
+        for label_set in self._providers.pop(package_label, ()):
+            for provider_label in label_set:
+                dependents = self._dependents.get(provider_label, None)
+                if dependents is not None:
+                    dependents.discard(package_label)
+        for dependent_label in self._dependents.pop(package_label, ()):
+            for label_set in self._providers.get(dependent_label, ()):
+                label_set.discard(package_label)
+
+    def rebuild(self, loaded_packages):
+        """rebuild(loaded_packages)
+Rebuilds the graph for the loaded_packages PackageCollection"""
+        self.clear()
+        for package in loaded_packages.values():
+            self._set_providers(package.absolute_label,
+                [self._match(package, requirement, loaded_packages) for requirement in package.get_requirements()])
+
+    def broken_requirements(self, package_labels):
+        """broken_requirements(package_labels) -> list of (dependent_label, requirement_index, providers)
+Returns the requirements of the packages not in package_labels that are
+matched only by packages in package_labels"""
+        package_labels = set(package_labels)
+        broken = []
+        dependent_labels = set()
+        for package_label in package_labels:
+            dependent_labels.update(self._dependents.get(package_label, ()))
+        dependent_labels.difference_update(package_labels)
+        for dependent_label in dependent_labels:
+            for requirement_index, label_set in enumerate(self._providers[dependent_label]):
+                if label_set and label_set.issubset(package_labels):
+                    broken.append((dependent_label, requirement_index, label_set))
+        return broken
+
+    def dump(self):
+        """dump() -> json-serializable object"""
+        return {package_label: [sorted(label_set) for label_set in providers] for package_label, providers in self._providers.items()}
+
+    def load(self, data):
+        """load(data)
+Loads the graph from the dump() output"""
+        self.clear()
+        for package_label, providers in data.items():
+            self._set_providers(package_label, [set(label_set) for label_set in providers])
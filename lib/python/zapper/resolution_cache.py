@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+#
+# Copyright 2013 Simone Campagna
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+__author__ = 'Simone Campagna'
+
+__all__ = ['ResolutionCache', 'RESOLUTION_CACHE']
+
+import os
+import json
+import hashlib
+import tempfile
+import collections
+
+from .utils.debug import LOGGER
+from .utils.trace import trace
+
+
+class ResolutionCache(object):
+    """ResolutionCache(cache_dir=None, *, shared_dir=None, size=None)
+Persistent LRU cache of the resolution results: for each key (catalog
+fingerprint, loaded packages, requested packages, resolution options) the
+ordered labels of the packages to load. The per-user cache in cache_dir
+is searched first, then the host-wide cache in shared_dir; results are
+stored in both, if shared_dir is writable."""
+    CACHE_VERSION = 1
+    CACHE_FILE_NAME = 'resolutions.json'
+    DEFAULT_SIZE = 256
+    def __init__(self, cache_dir=None, *, shared_dir=None, size=None):
+        self._cache_dir = cache_dir
+        self._shared_dir = shared_dir
+        self.set_size(size)
+        self._entries = {}
+
+    def set_cache_dir(self, cache_dir):
+        self._cache_dir = cache_dir
+
+    def set_shared_dir(self, shared_dir):
+        self._shared_dir = shared_dir or None
+
+    def set_size(self, size):
+        if size is None:
+            size = self.DEFAULT_SIZE
+        self._size = max(int(size), 1)
+
+    @property
+    def enabled(self):
+        return self._cache_dir is not None
+
+    @classmethod
+    def make_key(cls, catalog_fingerprint, loaded_labels, requested_labels, resolution_level, version_defaults, resolver):
+        """make_key(catalog_fingerprint, loaded_labels, requested_labels, resolution_level, version_defaults, resolver) -> key string"""
+        data = [
+            cls.CACHE_VERSION,
+            catalog_fingerprint,
+            sorted(loaded_labels),
+            list(requested_labels),
+            resolution_level,
+            sorted((str(key), str(value)) for key, value in version_defaults.items()),
+            resolver,
+        ]
+        return hashlib.sha1(json.dumps(data).encode('utf-8', 'surrogateescape')).hexdigest()
+
+    def _cache_dirs(self):
+        cache_dirs = [self._cache_dir]
+        if self._shared_dir is not None and self._shared_dir != self._cache_dir:
+            cache_dirs.append(self._shared_dir)
+        return cache_dirs
+
+    def _read(self, cache_dir):
+        cache_file = os.path.join(cache_dir, self.CACHE_FILE_NAME)
+        try:
+            mtime = os.stat(cache_file).st_mtime_ns
+        except OSError:
+            mtime = None
+        cached_mtime, entries = self._entries.get(cache_dir, (None, None))
+        if entries is None or (mtime is not None and mtime != cached_mtime):
+            # the cache file can be changed by other processes
+            entries = collections.OrderedDict()
+            if mtime is not None:
+                try:
+                    with open(cache_file, "r") as f_in:
+                        data = json.load(f_in)
+                    if data.get('version', None) == self.CACHE_VERSION:
+                        entries.update((key, value) for key, value in data['entries'])
+                    else:
+                        LOGGER.debug("resolution cache {} is out of date".format(cache_file))
+                except Exception as e:
+                    trace()
+                    LOGGER.debug("cannot load resolution cache {}: {}: {}".format(cache_file, e.__class__.__name__, e))
+            self._entries[cache_dir] = (mtime, entries)
+        return entries
+
+    def _write(self, cache_dir):
+        mtime, entries = self._entries[cache_dir]
+        while len(entries) > self._size:
+            entries.popitem(last=False)
+        cache_file = os.path.join(cache_dir, self.CACHE_FILE_NAME)
+        tmp_file = None
+        try:
+            if not os.path.lexists(cache_dir):
+                os.makedirs(cache_dir)
+            fd, tmp_file = tempfile.mkstemp(dir=cache_dir, prefix='.', suffix='.json')
+            with os.fdopen(fd, "w") as f_out:
+                json.dump({'version': self.CACHE_VERSION, 'entries': list(entries.items())}, f_out)
+            if cache_dir == self._shared_dir:
+                os.chmod(tmp_file, 0o644)
+            os.replace(tmp_file, cache_file)
+            self._entries[cache_dir] = (os.stat(cache_file).st_mtime_ns, entries)
+        except Exception as e:
+            trace()
+            LOGGER.debug("cannot store resolution cache {}: {}: {}".format(cache_file, e.__class__.__name__, e))
+            if tmp_file is not None and os.path.lexists(tmp_file):
+                os.remove(tmp_file)
+
+    def _is_writable(self, cache_dir):
+        if cache_dir == self._cache_dir:
+            return True
+        return os.access(cache_dir, os.W_OK)
+
+    def get(self, key):
+        """get(key) -> list of package label lists or None
+Lookups never write the shared cache. Hits move the entry to the most
+recently used end only in memory; the new order is written with the next
+store, or at once if the entry was in the older half of the cache (and
+therefore close to eviction)."""
+        if not self.enabled:
+            return None
+        for cache_dir in self._cache_dirs():
+            entries = self._read(cache_dir)
+            if key in entries:
+                value = entries[key]
+                if cache_dir == self._cache_dir:
+                    position = list(entries).index(key)
+                    # most recently used entries are the last ones
+                    entries.move_to_end(key)
+                    if position < len(entries) - self._size // 2:
+                        self._write(cache_dir)
+                else:
+                    # copied once into the per-user cache, which is searched first
+                    user_entries = self._read(self._cache_dir)
+                    user_entries[key] = value
+                    self._write(self._cache_dir)
+                LOGGER.debug("resolution cache hit {}".format(key))
+                return value
+        return None
+
+    def store(self, key, value):
+        """store(key, value)
+Stores value (a list of package label lists) for key"""
+        if not self.enabled:
+            return
+        for cache_dir in self._cache_dirs():
+            if self._is_writable(cache_dir):
+                entries = self._read(cache_dir)
+                entries.pop(key, None)
+                entries[key] = value
+                self._write(cache_dir)
+
+RESOLUTION_CACHE = ResolutionCache()
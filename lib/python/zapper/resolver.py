@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+#
+# Copyright 2013 Simone Campagna
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+__author__ = 'Simone Campagna'
+
+__all__ = ['BacktrackingResolver']
+
+import collections
+
+from .package_collection import PackageCollection
+from .version_operators import get_version_operator
+from .errors import LoadPackageError
+from .utils.debug import LOGGER
+from .utils.strings import plural_string
+
+
+class BacktrackingResolver(object):
+    """BacktrackingResolver(loaded_packages, package_collections, *, version_defaults=None, require_expressions=None, max_steps=None)
+Searches a set of packages satisfying all the requirements of the packages
+to load. The candidates for each unmatched requirement are searched in
+package_collections (in order), and tried with backtracking:
+ * candidates conflicting with the loaded or selected packages are pruned;
+ * selections which already failed are memoized, and never tried again;
+ * candidates are ranked by the preferences of the loaded and selected
+   packages, then by the version defaults, then by collection, then by
+   version (higher versions first).
+The first solution found is therefore the best ranked one."""
+    DEFAULT_MAX_STEPS = 100000
+    def __init__(self, loaded_packages, package_collections, *, version_defaults=None, require_expressions=None, max_steps=None):
+        self._loaded_packages = list(loaded_packages)
+        self._loaded_labels = {package.absolute_label for package in self._loaded_packages}
+        self._package_collections = list(package_collections)
+        if version_defaults is None:
+            version_defaults = {}
+        self._version_operators = {}
+        for key, version in version_defaults.items():
+            self._version_operators[key] = get_version_operator(version)
+        self._require_expressions = require_expressions
+        if max_steps is None:
+            max_steps = self.DEFAULT_MAX_STEPS
+        self._max_steps = max_steps
+        self._num_steps = 0
+        self._candidates_cache = {}
+        self._conflicts_cache = {}
+        self._failed_selections = set()
+        self._failure = None
+
+    def _conflicts(self, package_a, package_b):
+        key = (package_a.absolute_label, package_b.absolute_label)
+        conflicts = self._conflicts_cache.get(key, None)
+        if conflicts is None:
+            conflicts = bool(package_a.match_conflicts([package_b]))
+            self._conflicts_cache[key] = conflicts
+            self._conflicts_cache[(key[1], key[0])] = conflicts
+        return conflicts
+
+    def _version_default_level(self, package):
+        for level, key in enumerate((package.absolute_name, package.name)):
+            version_operator = self._version_operators.get(key, None)
+            if version_operator is not None and version_operator(package.version):
+                return level
+        return 2
+
+    def _candidates(self, package, requirement_index, requirement):
+        key = (package.absolute_label, requirement_index)
+        candidates = self._candidates_cache.get(key, None)
+        if candidates is None:
+            if self._require_expressions is not None:
+                self._require_expressions([requirement])
+            function = requirement.get_function()
+            candidates = []
+            labels = set()
+            for collection_index, package_collection in enumerate(self._package_collections):
+                packages = None
+                if isinstance(package_collection, PackageCollection):
+                    packages = package_collection.get_candidates(requirement)
+                    if packages is None:
+                        packages = package_collection.values()
+                else:
+                    packages = package_collection
+                for candidate in packages:
+                    if candidate is package or candidate.absolute_label in labels:
+                        continue
+                    if function(candidate):
+                        labels.add(candidate.absolute_label)
+                        candidates.append((self._version_default_level(candidate), collection_index, candidate))
+            self._candidates_cache[key] = candidates
+        return candidates
+
+    def _preferred(self, candidate, packages):
+        num_preferences = 0
+        for package in packages:
+            for preference in package.get_preferences():
+                if preference.get_function()(candidate):
+                    num_preferences += 1
+        return num_preferences
+
+    def _unmatched_requirements(self, selected):
+        """_unmatched_requirements(selected) -> iterator on (package, requirement_index, requirement)"""
+        packages = self._loaded_packages + selected
+        for package in selected:
+            for requirement_index, requirement in enumerate(package.get_requirements()):
+                function = requirement.get_function()
+                for pkg in packages:
+                    if pkg is not package and function(pkg):
+                        break
+                else:
+                    yield package, requirement_index, requirement
+
+    def _ranked_candidates(self, selection, packages, package, requirement_index, requirement):
+        ranked_candidates = []
+        for default_level, collection_index, candidate in self._candidates(package, requirement_index, requirement):
+            label = candidate.absolute_label
+            if label in selection or label in self._loaded_labels:
+                continue
+            if any(self._conflicts(candidate, pkg) for pkg in packages):
+                # conflict-driven pruning
+                continue
+            rank = (-self._preferred(candidate, packages), default_level, collection_index)
+            ranked_candidates.append((rank, candidate))
+        # stable sort: higher versions first within the same rank
+        ranked_candidates.sort(key=lambda x: x[1].version.sort_key, reverse=True)
+        ranked_candidates.sort(key=lambda x: x[0])
+        return ranked_candidates
+
+    def _fail(self, selected, selection, package, requirement):
+        if self._failure is None or len(selected) < len(self._failure[0]):
+            self._failure = (selected, package, requirement)
+        self._failed_selections.add(selection)
+        return None
+
+    def _search(self, selected):
+        selection = frozenset(package.absolute_label for package in selected)
+        if selection in self._failed_selections:
+            return None
+        self._num_steps += 1
+        if self._num_steps > self._max_steps:
+            raise LoadPackageError("resolution aborted after {0}".format(plural_string('step', self._max_steps)))
+        packages = self._loaded_packages + selected
+        first_unmatched = None
+        for unmatched in self._unmatched_requirements(selected):
+            ranked_candidates = self._ranked_candidates(selection, packages, *unmatched)
+            if not ranked_candidates:
+                # forward checking: a requirement without candidates makes
+                # the whole selection fail, whatever is selected next
+                package, requirement_index, requirement = unmatched
+                return self._fail(selected, selection, package, requirement)
+            if first_unmatched is None:
+                first_unmatched = unmatched, ranked_candidates
+        if first_unmatched is None:
+            return selected
+        (package, requirement_index, requirement), ranked_candidates = first_unmatched
+        for rank, candidate in ranked_candidates:
+            result = self._search(selected + [candidate])
+            if result is not None:
+                return result
+        return self._fail(selected, selection, package, requirement)
+
+    def resolve(self, packages):
+        """resolve(packages) -> (packages_to_load, package_dependencies)
+Returns the packages to be loaded (packages and the automatically
+selected packages), and their dependencies"""
+        packages = list(packages)
+        for package in packages:
+            conflicts = package.match_conflicts(self._loaded_packages + [pkg for pkg in packages if pkg is not package])
+            if conflicts:
+                for pkg0, expression, pkg1 in conflicts:
+                    LOGGER.error("{0}: expression {1} conflicts with {2}".format(pkg0, expression, pkg1))
+                raise LoadPackageError("cannot load package {0}: {1}".format(
+                    package,
+                    plural_string('conflict', len(conflicts))))
+        selected = self._search(packages)
+        LOGGER.debug("resolution: {0} after {1}".format(
+            "solution found" if selected is not None else "no solution",
+            plural_string('step', self._num_steps)))
+        if selected is None:
+            failed_selection, package, requirement = self._failure
+            LOGGER.error("{0}: unmatched requirement {1}".format(package, requirement))
+            raise LoadPackageError("cannot load package {0}: no solution".format(package))
+        for package in selected[len(packages):]:
+            LOGGER.info("package {0} will be automatically loaded".format(package))
+        package_dependencies = collections.defaultdict(set)
+        for package in selected:
+            for requirement in package.get_requirements():
+                function = requirement.get_function()
+                for pkg in selected:
+                    if pkg is not package and function(pkg):
+                        package_dependencies[package].add(pkg)
+        return selected, package_dependencies
@@ -18,11 +18,16 @@
 __author__ = 'Simone Campagna'
 
 import os
+import io
 import sys
 import imp
 import glob
+import json
+import hashlib
 import itertools
+import contextlib
 import collections
+import multiprocessing
 
 from .environment import Environment
 from .category import Category
@@ -30,11 +35,22 @@ from .parameters import PARAMETERS
 from .package import Package
 from .product import Product
 from .suite import Suite, ROOT
+from .transition import EnvVarTransition
 from .version_operators import get_version_operator
 from .errors import *
 from .session_config import SessionConfig
+from .session_store import FileSessionStore, SqliteSessionStore
+from .session_gc import set_session_owner, touch_session, is_session_stale
+from .catalog_cache import CATALOG_CACHE
+from .resolution_cache import RESOLUTION_CACHE
+from .package_index import PackageIndex, PACKAGE_INDEX
+from .package_expressions import required_names
 from .package_collection import PackageCollection
-from .utils.debug import LOGGER, PRINT
+from .requirement_graph import RequirementGraph
+from .conflict_index import ConflictIndex
+from .resolver import BacktrackingResolver
+from .declarative_package_file import DeclarativePackageFile
+from .utils.debug import LOGGER, PRINT, collect_log
 from .utils.trace import trace
 from .utils.table import Table, validate_format
 from .utils.sorted_dependencies import sorted_dependencies
@@ -45,14 +61,26 @@ from .utils import sequences
 
 
 class Session(object):
-    SESSION_SUFFIX = ".session"
+    SESSION_SUFFIX = FileSessionStore.SESSION_SUFFIX
     MODULE_PATTERN = "*.py"
+    DECLARATIVE_PATTERN = "*" + DeclarativePackageFile.SUFFIX
     PACKAGE_PATTERN = os.path.join("*", "__init__.py")
     TEMPORARY_SESSION_NAME_FORMAT = 'zap{name}'
     RANDOM_NAME_SEQUENCE = RandomNameSequence(width=8 - len(TEMPORARY_SESSION_NAME_FORMAT.format(name='')))
     SESSION_TYPE_TEMPORARY = 'temporary'
     SESSION_TYPE_PERSISTENT = 'persistent'
     SESSION_TYPES = [SESSION_TYPE_PERSISTENT, SESSION_TYPE_TEMPORARY]
+    RESOLVER_GREEDY = 'greedy'
+    RESOLVER_BACKTRACKING = 'backtracking'
+    RESOLVERS = [RESOLVER_GREEDY, RESOLVER_BACKTRACKING]
+    TRANSLATION_MODE_FULL = 'full'
+    TRANSLATION_MODE_DELTA = 'delta'
+    TRANSLATION_MODES = [TRANSLATION_MODE_FULL, TRANSLATION_MODE_DELTA]
+    SESSION_STORE_FILE = FileSessionStore.STORE_NAME
+    SESSION_STORE_SQLITE = SqliteSessionStore.STORE_NAME
+    SESSION_STORES = [SESSION_STORE_FILE, SESSION_STORE_SQLITE]
+    SESSION_DB_JOURNAL_MODES = SqliteSessionStore.JOURNAL_MODES
+    SESSION_STORE = FileSessionStore()
     LOADED_PACKAGE_FORMAT =     "{__ordinal__:>3d}) {abbr_type}{is_sticky} {category} {abs_package} {tags}"
     AVAILABLE_PACKAGE_FORMAT =  "{__ordinal__:>3d}) {abbr_type}{is_loaded}{is_conflicting} {category} {abs_package} {tags}"
     PACKAGE_HEADER_DICT = collections.OrderedDict((
@@ -79,6 +107,9 @@ class Session(object):
         ('__ordinal__',      '#'),
         ('package_dir',      'DIRECTORY'),
     ))
+    LOADER_PROCESSES = 0
+    UNDO_LOG = False
+    UNDO_LOG_SIZE = 16
     DEFAULT_PACKAGE_SORT_KEYS = SortKeys("category:product:version", PACKAGE_HEADER_DICT, 'package')
     DEFAULT_PACKAGE_DIR_SORT_KEYS = SortKeys("", PACKAGE_DIR_HEADER_DICT, 'package directory')
     def __init__(self, session_root, *, load=True):
@@ -86,6 +117,14 @@ class Session(object):
         self._orig_environment = self._environment.copy()
         self._loaded_packages = PackageCollection()
         self._loaded_suites = PackageCollection()
+        self._requirement_graph = RequirementGraph()
+        self._conflict_index = None
+        self._undo_log = {}
+        self._other_undo_logs = collections.OrderedDict()
+        self._undo_label = None
+        self._undo_indices = None
+        self._undo_entry = None
+        self._undo_revert = False
         self._package_directories = []
         self._defined_packages = PackageCollection()
         self._available_packages = PackageCollection()
@@ -96,6 +135,10 @@ class Session(object):
         self._orig_sticky_packages = set()
         self._sticky_packages = set()
         self._modules = {}
+        self._failed_modules = set()
+        self._deferred_package_dirs = collections.OrderedDict()
+        self._package_filters = []
+        self._catalog_fingerprint = None
         self._dry_run = False
         self._force = False
         self._package_format = None
@@ -105,9 +148,12 @@ class Session(object):
         self.set_package_sort_keys(None)
         self.set_package_dir_sort_keys(None)
         self._version_defaults = {}
+        self._resolver = self.RESOLVER_GREEDY
+        self._translation_mode = self.TRANSLATION_MODE_FULL
         if load:
             self.load(session_root)
         self._deleted = False # if True, session will be deleted in finalize()
+        self._volatile = False # if True, session will never be stored
 
     def sync(self):
         pass
@@ -122,6 +168,12 @@ class Session(object):
     def set_dry_run(self, dry_run):
         self._dry_run = bool(dry_run)
 
+    def set_volatile(self):
+        """set_volatile()
+Changes are kept in memory only: the session will never be stored"""
+        self.session_read_only = False
+        self._volatile = True
+
     def set_force(self, force):
         self._force = bool(force)
 
@@ -153,6 +205,12 @@ class Session(object):
         self._show_header = show_header
         self._show_header_if_empty = show_header_if_empty
 
+    def set_resolver(self, resolver):
+        self._resolver = self.Resolver(resolver)
+
+    def set_translation_mode(self, translation_mode):
+        self._translation_mode = self.TranslationMode(translation_mode)
+
     def set_version_defaults(self, version_defaults):
         assert isinstance(version_defaults, collections.Mapping), "version_defaults is not a Mapping: {}".format(version_defaults)
         self._version_defaults = version_defaults.copy()
@@ -168,11 +226,13 @@ class Session(object):
         self._package_dir_format = package_dir_format
 
     def filter_packages(self, expression):
+        self._package_filters.append(expression)
+        self._catalog_fingerprint = None
+        function = expression.get_function()
         for package_collection in self._defined_packages, self._available_packages:
             to_unload = set()
             for package_label, package in package_collection.items():
-                expression.bind(package)
-                if not expression.get_value():
+                if not function(package):
                     to_unload.add(package_label)
             for package_label in to_unload:
                 package = package_collection.pop(package_label)
@@ -182,22 +242,127 @@ class Session(object):
     def _normpath(cls, path):
         return os.path.normpath(os.path.abspath(os.path.expanduser(os.path.expandvars(path))))
 
-    def _load_package_dir(self, package_dir):
+    def _scan_package_dir(self, package_dir):
+        """_scan_package_dir(package_dir) -> (package_dirs, module_entries)
+Returns the package directories found in package_dir and the ordered list
+of (current_dir, module_path) entries to be loaded"""
         package_dirs = []
-        LOGGER.info("loading modules from {}".format(package_dir))
-        module_files = []
-        for module_path in glob.glob(os.path.join(package_dir, self.MODULE_PATTERN)):
-            module_path = self._normpath(module_path)
-            module_files.append(module_path)
-        self._load_modules(package_dir, module_files)
+        module_entries = []
+        for module_pattern in self.MODULE_PATTERN, self.DECLARATIVE_PATTERN:
+            for module_path in glob.glob(os.path.join(package_dir, module_pattern)):
+                module_entries.append((package_dir, self._normpath(module_path)))
         package_dirs.append(package_dir)
         for package_init in glob.glob(os.path.join(package_dir, self.PACKAGE_PATTERN)):
             package_init = self._normpath(package_init)
-            self._load_modules(package_dir, [package_init])
-            package_dirs.extend(self._load_package_dir(os.path.dirname(package_init)))
+            module_entries.append((package_dir, package_init))
+            sub_package_dirs, sub_module_entries = self._scan_package_dir(os.path.dirname(package_init))
+            package_dirs.extend(sub_package_dirs)
+            module_entries.extend(sub_module_entries)
+        return package_dirs, module_entries
+
+    def _load_package_dir(self, package_dir):
+        LOGGER.info("loading modules from {}".format(package_dir))
+        package_dirs, module_entries = self._scan_package_dir(package_dir)
+        fingerprint = None
+        if (CATALOG_CACHE.enabled or CATALOG_CACHE.resident or PACKAGE_INDEX.enabled) and not any(module_path in self._modules for current_dir, module_path in module_entries):
+            fingerprint = CATALOG_CACHE.fingerprint(package_dir, [module_path for current_dir, module_path in module_entries])
+        if fingerprint is not None and CATALOG_CACHE.resident:
+            if CATALOG_CACHE.get_resident(package_dir, fingerprint) is not None:
+                LOGGER.info("using resident packages from {}".format(package_dir))
+                for current_dir, module_path in module_entries:
+                    self._modules[module_path] = None
+                return package_dirs
+            # packages partially registered by a previous failed load
+            CATALOG_CACHE.forget(package_dirs)
+        if fingerprint is not None and not CATALOG_CACHE.resident:
+            package_index = PACKAGE_INDEX.load(package_dir, fingerprint)
+            if package_index is not None:
+                LOGGER.info("deferring load of modules from {}".format(package_dir))
+                self._deferred_package_dirs[package_dir] = package_index
+                return package_dirs
+        if fingerprint is not None:
+            if CATALOG_CACHE.load(package_dir, fingerprint) is not None:
+                for current_dir, module_path in module_entries:
+                    self._modules[module_path] = None
+                CATALOG_CACHE.add_resident(package_dir, fingerprint, package_dirs)
+                PACKAGE_INDEX.store(PackageIndex.build(package_dir, fingerprint, package_dirs, module_entries))
+                return package_dirs
+        loaded = True
+        for current_dir, module_path in module_entries:
+            loaded = self._load_modules(current_dir, [module_path]) and loaded
+        if fingerprint is not None and loaded:
+            CATALOG_CACHE.store(package_dir, fingerprint, package_dirs)
+            CATALOG_CACHE.add_resident(package_dir, fingerprint, package_dirs)
+            PACKAGE_INDEX.store(PackageIndex.build(package_dir, fingerprint, package_dirs, module_entries))
         return package_dirs
 
+    def _load_deferred_modules(self, module_entries):
+        module_entries = [(current_dir, module_path) for current_dir, module_path in module_entries if not module_path in self._modules]
+        if not module_entries:
+            return
+        current_dirs = list(sequences.unique(current_dir for current_dir, module_path in module_entries))
+        num_registered = {current_dir: len(Package.registered_entry('package_dir', current_dir)) for current_dir in current_dirs}
+        for current_dir, module_path in module_entries:
+            self._load_modules(current_dir, [module_path])
+        for current_dir in current_dirs:
+            for package in Package.registered_entry('package_dir', current_dir)[num_registered[current_dir]:]:
+                self._add_deferred_package(package)
+
+    def _add_deferred_package(self, package):
+        for expression in self._package_filters:
+            if not expression.get_function()(package):
+                LOGGER.debug("discarding package {0} not matching expression {1}".format(package, expression))
+                return
+        self._defined_packages.add_package(package)
+        if package.source_dir in self._package_directories:
+            suite = package.suite
+            if self._loaded_suites.get(suite.absolute_label, None) is suite:
+                self._available_packages.add_package(package)
+
+    def _require_labels(self, package_labels):
+        """_require_labels(package_labels)
+Loads the deferred package files needed to resolve package_labels"""
+        if not self._deferred_package_dirs:
+            return
+        names = set()
+        absolute_labels = set()
+        for package_label in package_labels:
+            if any(package_index.has_absolute_label(package_label) for package_index in self._deferred_package_dirs.values()):
+                absolute_labels.add(package_label)
+            else:
+                for label in package_label.split(Package.SUITE_SEPARATOR):
+                    if label:
+                        names.add(label.split(Package.VERSION_SEPARATOR, 1)[0])
+        self._require(names=names, absolute_labels=absolute_labels)
+
+    def _require_expressions(self, expressions):
+        """_require_expressions(expressions)
+Loads the deferred package files needed to match expressions"""
+        if not self._deferred_package_dirs:
+            return
+        names = set()
+        for expression in expressions:
+            expression_names = required_names(expression)
+            if expression_names is None:
+                LOGGER.debug("expression {} cannot be indexed: loading all modules".format(expression))
+                self.load_all_modules()
+                return
+            names.update(expression_names)
+        self._require(names=names)
+
+    def _require(self, *, names=(), absolute_labels=()):
+        for package_index in self._deferred_package_dirs.values():
+            self._load_deferred_modules(package_index.get_module_entries(names=names, absolute_labels=absolute_labels))
+
+    def load_all_modules(self):
+        """load_all_modules()
+Loads all the deferred package files"""
+        while self._deferred_package_dirs:
+            package_dir, package_index = self._deferred_package_dirs.popitem(last=False)
+            self._load_deferred_modules(package_index.module_entries)
+
     def _load_modules(self, package_dir, module_files):
+        loaded = True
         PARAMETERS.set_current_dir(package_dir)
         try:
             for module_path in module_files:
@@ -208,12 +373,17 @@ class Session(object):
                     except Exception as e:
                         trace(True)
                         LOGGER.warning("cannot impot package file {!r}: {}: {}".format(module_path, e.__class__.__name__, e))
+                        self._failed_modules.add(module_path)
+                        loaded = False
                         continue
-                self._modules[module_path] = module
+                    self._modules[module_path] = module
         finally:
             PARAMETERS.unset_current_dir()
+        return loaded
 
     def _load_module(self, module_path):
+        if module_path.endswith(DeclarativePackageFile.SUFFIX):
+            return self._load_declarative_file(module_path)
         package_dirname, module_basename = os.path.split(module_path)
         module_name = module_basename[:-3]
         sys_path = [package_dirname]
@@ -227,16 +397,95 @@ class Session(object):
                 PARAMETERS.unset_current_module_file()
         return module
 
+    def _load_declarative_file(self, module_path):
+        module_name = os.path.basename(module_path)[:-len(DeclarativePackageFile.SUFFIX)]
+        LOGGER.info("loading declarative package file {}".format(module_path))
+        PARAMETERS.set_current_module_file(module_name, module_path)
+        try:
+            return DeclarativePackageFile(module_path).load()
+        finally:
+            PARAMETERS.unset_current_module_file()
+
     def get_package_directories(self):
         return tuple(self._package_directories)
 
+    @classmethod
+    def set_loader_processes(cls, loader_processes):
+        cls.LOADER_PROCESSES = loader_processes
+
+    @classmethod
+    def set_undo_log(cls, undo_log):
+        cls.UNDO_LOG = bool(undo_log)
+
+    def _evaluate_package_dirs(self, package_dirs):
+        """_evaluate_package_dirs(package_dirs) -> {package_dir: evaluation}
+If LOADER_PROCESSES > 1, package directories are scanned and evaluated in
+parallel by worker processes forked from the current state. This is meant
+for independent directories: a worker does not see the products defined
+by the previous directories, so directories using them, and directories
+with package files that cannot be loaded, are then loaded serially"""
+        package_dirs = list(sequences.unique(package_dirs))
+        if self.LOADER_PROCESSES <= 1 or len(package_dirs) <= 1 or CATALOG_CACHE.resident:
+            return {}
+        try:
+            mp_context = multiprocessing.get_context('fork')
+        except ValueError:
+            return {}
+        sys.stdout.flush()
+        sys.stderr.flush()
+        try:
+            # maxtasksperchild=1: each directory is evaluated by a worker
+            # forked from the same state, as in serial mode
+            with mp_context.Pool(min(self.LOADER_PROCESSES, len(package_dirs)), maxtasksperchild=1) as pool:
+                evaluations = pool.map(_evaluate_package_dir, package_dirs, chunksize=1)
+        except Exception as e:
+            trace()
+            LOGGER.warning("cannot evaluate package directories in parallel: {}: {}".format(e.__class__.__name__, e))
+            return {}
+        return {package_dir: evaluation for package_dir, evaluation in zip(package_dirs, evaluations) if evaluation is not None}
+
+    def _restore_package_dir(self, package_dir, evaluation):
+        """_restore_package_dir(package_dir, evaluation) -> package_dirs or None
+Merges the packages evaluated by a worker process"""
+        if evaluation[0] == 'deferred':
+            kind, package_dirs, package_index_dict, output = evaluation
+            self._deferred_package_dirs[package_dir] = PackageIndex.from_dict(package_index_dict)
+        else:
+            kind, package_dirs, module_paths, catalog_data, product_names, output = evaluation
+            defined_product_names = [product_name for product_name in product_names if Product.has_product(product_name)]
+            if defined_product_names:
+                # in serial mode the existing products would have been used
+                LOGGER.info("package directory {} uses products defined by previous directories ({}): loading it serially".format(package_dir, ', '.join(defined_product_names)))
+                return None
+            try:
+                CATALOG_CACHE.loads(catalog_data)
+            except Exception as e:
+                trace()
+                LOGGER.warning("cannot restore package directory {}: {}: {}".format(package_dir, e.__class__.__name__, e))
+                CATALOG_CACHE.forget(package_dirs)
+                return None
+            for module_path in module_paths:
+                self._modules[module_path] = None
+        error_output, log_records = output
+        sys.stderr.write(error_output)
+        for level, message in log_records:
+            LOGGER.log(level, message)
+        return package_dirs
+
     def set_defined_packages(self, *, loaded_package_directories):
         self._defined_packages.clear()
         all_package_directories = []
+        evaluations = self._evaluate_package_dirs(
+            package_dir for package_dir in self._package_directories \
+                if not (loaded_package_directories and package_dir in loaded_package_directories))
         for package_dir in self._package_directories:
             if loaded_package_directories and package_dir in loaded_package_directories:
                 continue
-            p_dirs = self._load_package_dir(package_dir)
+            p_dirs = None
+            if package_dir in evaluations:
+                p_dirs = self._restore_package_dir(package_dir, evaluations.pop(package_dir))
+            if p_dirs is None:
+                p_dirs = self._load_package_dir(package_dir)
             for p_dir in p_dirs:
                 #LOGGER.info("### ---> {}".format(p_dir))
                 for package in Package.registered_entry('package_dir', p_dir):
@@ -254,6 +503,14 @@ class Session(object):
                     continue
                 self._available_packages.add_package(package)
 
+    @classmethod
+    def set_session_store(cls, session_store):
+        cls.SESSION_STORE = session_store
+
+    @classmethod
+    def session_exists(cls, session_root):
+        return cls.SESSION_STORE.exists(session_root)
+
     @classmethod
     def get_session_config_file(cls, session_root):
         return session_root + cls.SESSION_SUFFIX
@@ -268,18 +525,12 @@ class Session(object):
         return session_root
 
     @classmethod
-    def get_session_config(cls, session_config_file):
-        return SessionConfig(session_config_file)
-
-    @classmethod
-    def write_session_config(cls, session_config, session_config_file):
-        with open(session_config_file, "w") as f_out:
-            session_config.write(f_out)
+    def get_session_config(cls, session_root):
+        return cls.SESSION_STORE.get_session_config(session_root)
 
     @classmethod
     def copy(cls, source_session_name, source_session_root, target_session_root):
-        source_session_config_file = cls.get_session_config_file(source_session_root)
-        source_session_config = cls.get_session_config(source_session_config_file)
+        source_session_config = cls.get_session_config(source_session_root)
         source_session_config['session']['name'] = os.path.basename(target_session_root)
         source_session_config['session']['type'] = cls.SESSION_TYPE_PERSISTENT
         source_session_config['session']['creation_time'] = SessionConfig.current_time()
@@ -289,15 +540,19 @@ class Session(object):
         else:
             source_session_description_s = ''
         source_session_config['config']['description'] = "Copied from session {}{}".format(source_session_name, source_session_description_s)
-        target_session_config_file = cls.get_session_config_file(target_session_root)
-        cls.write_session_config(source_session_config, target_session_config_file)
-
-    def load(self, session_root, *, load_packages=True, loaded_package_directories=None):
-        self.session_root = os.path.abspath(session_root)
-        session_config_file = self.get_session_config_file(self.session_root)
-        if not os.path.lexists(session_config_file):
-            LOGGER.warning("cannot load session config file {0}".format(session_config_file))
-        self.session_config = self.get_session_config(session_config_file)
+        target_session_config = cls.get_session_config(target_session_root)
+        target_session_config.copy_config(source_session_config)
+        target_session_config.store()
+
+    def load(self, session_root, *, load_packages=True, loaded_package_directories=None, session_config=None):
+        if session_config is None:
+            self.session_root = os.path.abspath(session_root)
+            if not self.session_exists(self.session_root):
+                LOGGER.warning("cannot load session {0}".format(self.session_root))
+            session_config = self.get_session_config(self.session_root)
+        else:
+            self.session_root = session_root
+        self.session_config = session_config
         self.session_name = self.session_config['session']['name']
         self.session_type = self.session_config['session']['type']
         self.session_description = self.session_config['config']['description']
@@ -321,6 +576,7 @@ class Session(object):
         self.set_defined_packages(loaded_package_directories=loaded_package_directories)
         self.set_available_packages()
         if load_packages:
+            self._load_undo_log()
             # loaded packages
             packages_list = string_to_list(self.session_config['packages']['loaded_packages'])
             #packages_list_string = self.session_config['packages']['loaded_packages']
@@ -346,44 +602,54 @@ class Session(object):
         for name in cls.RANDOM_NAME_SEQUENCE:
             session_name = cls.TEMPORARY_SESSION_NAME_FORMAT.format(name=name)
             session_root = os.path.join(sessions_dir, session_name)
-            session_config_file = cls.get_session_config_file(session_root)
-            if os.path.lexists(session_config_file):
+            if cls.session_exists(session_root):
                 # name already in use
                 LOGGER.warning("name {0} already in use - discarded".format(session_name))
                 continue
-            try:
-                os.open(session_config_file, os.O_CREAT | os.O_EXCL)
-            except OSError as e:
-                # file already exists
-                LOGGER.warning("cannot create config file {}: {}: {}".format(session_config_file, e.__class__.__name__, e))
-                LOGGER.warning("file {} already exists - {} discarded".format(session_config_file, session_name))
+            if not cls.SESSION_STORE.reserve(session_root):
+                LOGGER.warning("session {} already exists - {} discarded".format(session_root, session_name))
                 continue
             return session_root
             
     @classmethod
     def create_session_config(cls, manager, session_root, session_name, session_type, session_description, session_packages=None):
-        session_config_file = cls.get_session_config_file(session_root)
-        session_config = cls.get_session_config(session_config_file)
+        session_config = cls.get_session_config(session_root)
+        cls._init_session_config(manager, session_config, session_name, session_type, session_description, session_packages)
+        session_config.store()
+
+    @classmethod
+    def _init_session_config(cls, manager, session_config, session_name, session_type, session_description, session_packages=None):
         session_config['session']['name'] = session_name
         session_config['session']['type'] = session_type
         session_config['session']['creation_time'] = SessionConfig.current_time()
+        if session_type == cls.SESSION_TYPE_TEMPORARY:
+            set_session_owner(session_config)
         session_config['config']['description'] = session_description
         package_directories = string_to_list(manager.get_user_config_key('directories'))
         package_directories = [cls._normpath(d) for d in package_directories]
         session_config['config']['directories'] = list_to_string(package_directories)
         if session_packages:
             session_config['packages']['loaded_packages'] = list_to_string(session_packages)
-        session_config.store()
+
+    @classmethod
+    def create_volatile(cls, manager):
+        """create_volatile(manager) -> volatile session
+Creates an in-memory session, which is never stored"""
+        session_config = SessionConfig(None)
+        cls._init_session_config(manager, session_config, '', cls.SESSION_TYPE_TEMPORARY, '')
+        session = cls(None, load=False)
+        session.load(None, session_config=session_config)
+        session.set_volatile()
+        return session
     
     @classmethod
     def delete_session_root(cls, session_root, session_name=None, *, force=False):
         if session_name is None:
             session_name = os.path.basename(session_root)
         LOGGER.info("deleting session {!r}...".format(session_name))
-        session_config_file = cls.get_session_config_file(session_root)
-        if not os.path.lexists(session_config_file):
+        if not cls.session_exists(session_root):
             LOGGER.error("cannot delete session {!r}: it does not exists".format(session_name))
-        session_config = cls.get_session_config(session_config_file)
+        session_config = cls.get_session_config(session_root)
         session_read_only = string_to_bool(session_config['config']['read_only'])
         if session_read_only:
             if force:
@@ -391,15 +657,11 @@ class Session(object):
             else:
                 LOGGER.error("cannot delete read-only session {!r}".format(session_name))
                 return
-        os.remove(session_config_file)
+        cls.SESSION_STORE.delete(session_root)
 
     @classmethod
     def get_session_roots(cls, sessions_dir, session_name_pattern='*'):
-        session_roots = []
-        for session_config_file in glob.glob(os.path.join(sessions_dir, session_name_pattern + cls.SESSION_SUFFIX)):
-            session_root = session_config_file[:-len(cls.SESSION_SUFFIX)]
-            session_roots.append(session_root)
-        return session_roots
+        return cls.SESSION_STORE.get_session_roots(sessions_dir, session_name_pattern)
 
     @classmethod
     def create(cls, manager, session_root, session_name, session_type):
@@ -454,10 +716,13 @@ class Session(object):
 
         #print("### package_label={!r} package_name={!r} package_version={!r}".format(package_label, package_name, package_version))
         match_operator = get_version_operator(package_version)
-        packages = []
-        for package in package_list:
-            if package.name == package_name and match_operator(package.version):
-                packages.append(package)
+        if isinstance(package_list, PackageCollection):
+            packages = package_list.get_packages_by_name(package_name, match_operator)
+        else:
+            packages = []
+            for package in package_list:
+                if package.name == package_name and match_operator(package.version):
+                    packages.append(package)
         LOGGER.debug("get_package({!r}) : packages={}".format(package_label, [str(p) for p in packages]))
         return packages
 
@@ -508,7 +773,7 @@ class Session(object):
         matches.sort(key=keyfunc)
         it = itertools.groupby(matches, keyfunc)
         level, level_matches = next(it)
-        level_packages = sorted((package for l, package in level_matches), key=lambda package: package.version)
+        level_packages = sorted((package for l, package in level_matches), key=lambda package: package.version.sort_key)
         return level_packages[-1]
 
         
@@ -517,26 +782,129 @@ class Session(object):
 #        return self.get_package(package_label, self._defined_packages.values())
 
     def get_available_package(self, package_label):
-        return self.get_package(package_label, self._available_packages.values())
+        self._require_labels([package_label])
+        return self.get_package(package_label, self._available_packages)
 
     def get_loaded_package(self, package_label):
-        return self.get_package(package_label, self._loaded_packages.values())
+        return self.get_package(package_label, self._loaded_packages)
 
     def loaded_packages(self):
         return self._loaded_packages.values()
 
     def defined_packages(self):
+        self.load_all_modules()
         return self._defined_packages.values()
 
     def available_packages(self):
+        self.load_all_modules()
         return self._available_packages.values()
 
+    def begin_undo(self, package, *, revert):
+        """begin_undo(package, *, revert)
+Selects the undo log entry of package for the transitions being applied
+or reverted. If UNDO_LOG is False, or a package to be reverted has no
+entry, the previous values are kept in the _ZAP_ environment variables.
+Only one entry can be selected: end_undo() must be called before the
+next begin_undo()"""
+        if self._undo_label is not None:
+            raise SessionInternalError("cannot select the undo log entry of {}: the entry of {} is selected".format(package.absolute_label, self._undo_label))
+        self._undo_label = package.absolute_label
+        self._undo_indices = {id(transition): str(transition_index) for transition_index, transition in enumerate(package.get_transitions())}
+        if revert:
+            self._undo_entry = self._undo_log.get(self._undo_label, None)
+        else:
+            self._undo_log.pop(self._undo_label, None)
+            if self.UNDO_LOG:
+                self._undo_entry = self._undo_log[self._undo_label] = {}
+            else:
+                self._undo_entry = None
+        self._undo_revert = revert
+
+    def end_undo(self):
+        if self._undo_revert:
+            self._undo_log.pop(self._undo_label, None)
+        self._undo_label = None
+        self._undo_indices = None
+        self._undo_entry = None
+
+    def get_undo_value(self, transition):
+        if self._undo_entry is not None:
+            return self._undo_entry.get(self._undo_indices[id(transition)], None)
+        return self._environment.var_get(transition._cache_var_name())
+
+    def set_undo_value(self, transition, var_value):
+        if self._undo_entry is not None:
+            self._undo_entry[self._undo_indices[id(transition)]] = var_value
+        else:
+            self._environment.var_set(transition._cache_var_name(), var_value)
+
+    def unset_undo_value(self, transition):
+        if self._undo_entry is not None:
+            self._undo_entry.pop(self._undo_indices[id(transition)], None)
+        else:
+            self._environment.var_unset(transition._cache_var_name())
+
+    def _load_undo_log(self):
+        """_load_undo_log()
+Loads the undo log of the packages in the environment. An undo log is
+stored for each list of loaded packages, since the session can be shared
+by shells with different environments; the UNDO_LOG_SIZE most recent
+ones are kept"""
+        self._undo_log.clear()
+        self._other_undo_logs.clear()
+        undo_log_string = self.session_config['state']['undo_log']
+        if not undo_log_string:
+            return
+        try:
+            undo_logs = collections.OrderedDict(json.loads(undo_log_string)['logs'])
+        except (ValueError, TypeError, KeyError):
+            LOGGER.debug("session state: invalid undo log")
+            return
+        entries = undo_logs.get(self._environment.var_get('ZAPPER_LOADED_PACKAGES') or '', None)
+        if entries is None:
+            LOGGER.debug("session state: no undo log for the loaded packages")
+        else:
+            # the entries are changed by the transitions, the stored log is kept
+            self._undo_log.update((package_label, dict(entry)) for package_label, entry in entries.items())
+        self._other_undo_logs.update(undo_logs)
+
+    def _store_undo_log(self):
+        state = self.session_config['state']
+        undo_logs = self._other_undo_logs.copy()
+        loaded_packages = ':'.join(self._loaded_packages.keys())
+        undo_logs.pop(loaded_packages, None)
+        undo_log = {package_label: entry for package_label, entry in self._undo_log.items() if package_label in self._loaded_packages}
+        if undo_log:
+            undo_logs[loaded_packages] = undo_log
+        if undo_logs:
+            # values are interpolated by the config parser
+            state['undo_log'] = json.dumps({
+                'logs': list(undo_logs.items())[-self.UNDO_LOG_SIZE:],
+            }, sort_keys=True).replace('%', '%%')
+        else:
+            state['undo_log'] = ''
+
+    def get_undo_environment(self):
+        """get_undo_environment() -> dict
+Returns the _ZAP_ variables with the values kept in the undo log of the
+loaded packages, for processes that cannot find the undo log in the
+session (as the commands run by 'zapper run', whose packages differ)"""
+        undo_environment = {}
+        for package in self._loaded_packages.values():
+            entry = self._undo_log.get(package.absolute_label, None)
+            if entry:
+                for transition_index, transition in enumerate(package.get_transitions()):
+                    var_value = entry.get(str(transition_index), None)
+                    if var_value is not None:
+                        undo_environment[transition._cache_var_name()] = var_value
+        return undo_environment
+
     def unload_environment_packages(self, *, ignore_errors=True):
         """unload_environment_packages() -> list of previously loaded packages
 Remove all the previously loaded packages (from environment variable
 $ZAPPER_LOADED_PACKAGES) and returns the list of unloaded packages""" 
         env_loaded_packages = []
-        loaded_package_labels_string = self._environment.get('ZAPPER_LOADED_PACKAGES', None)
+        loaded_package_labels_string = self._environment.var_get('ZAPPER_LOADED_PACKAGES')
         if not loaded_package_labels_string:
             return env_loaded_packages
         loaded_package_labels = loaded_package_labels_string.split(':')
@@ -556,6 +924,10 @@ $ZAPPER_LOADED_PACKAGES) and returns the list of unloaded packages"""
             loaded_package.unload(self, info=False)
             env_loaded_packages.append(loaded_package)
         del self._environment['ZAPPER_LOADED_PACKAGES']
+        if self.UNDO_LOG:
+            # leftovers of the transitions applied without undo log
+            for var_name in [var_name for var_name in self._environment if var_name.startswith('_ZAP_') and var_name.endswith('_')]:
+                del self._environment[var_name]
         return env_loaded_packages
 
     def unload_all_loaded_packages(self):
@@ -563,9 +935,12 @@ $ZAPPER_LOADED_PACKAGES) and returns the list of unloaded packages"""
             LOGGER.info("unloading package {0}...".format(package_label))
             package.unload(self)
         self._loaded_packages.clear()
+        self._requirement_graph.clear()
 
     def initialize_loaded_packages(self, packages_list):
         self._add_suite(ROOT)
+        if self.restore_loaded_packages(packages_list):
+            return
         env_loaded_packages = set(self.unload_environment_packages(ignore_errors=True))
         self.unload_all_loaded_packages()
         self.load_package_labels(packages_list, ignore_errors=True, info=False)
@@ -576,11 +951,98 @@ $ZAPPER_LOADED_PACKAGES) and returns the list of unloaded packages"""
             LOGGER.info("package {} has been unloaded".format(package))
         
                 
+    def restore_loaded_packages(self, packages_list):
+        """restore_loaded_packages(packages_list) -> True if restored
+Restores the loaded packages from the session state, without applying
+their transitions; this is possible only if the environment still contains
+the state stored by the last command (the current environment has been
+obtained by the translation of this state)"""
+        state = self.session_config['state']
+        state_package_labels = string_to_list(state['loaded_packages'])
+        if not state_package_labels or state_package_labels != list(packages_list):
+            return False
+        if self._environment.var_get('ZAPPER_LOADED_PACKAGES') != ':'.join(state_package_labels):
+            return False
+        for packages in self.iterdep(state_package_labels, ignore_errors=True):
+            for package in packages:
+                if isinstance(package, Suite):
+                    self._add_suite(package)
+        packages = []
+        for package_label in state_package_labels:
+            package = self.get_available_package(package_label)
+            if package is None or package.absolute_label != package_label:
+                return False
+            packages.append(package)
+        if state['digest'] != self._get_state_digest(packages):
+            # package files have been changed
+            return False
+        try:
+            state_environment = json.loads(state['environment'])
+        except ValueError:
+            return False
+        for var_name, var_value in state_environment.items():
+            if self._environment.var_get(var_name) != var_value:
+                LOGGER.debug("session state: variable {} has been changed".format(var_name))
+                return False
+        for package in packages:
+            self._loaded_packages[package.absolute_label] = package
+            if isinstance(package, Suite):
+                self._add_suite(package)
+        try:
+            self._requirement_graph.load(json.loads(state['requirements']))
+        except (ValueError, TypeError, AttributeError):
+            self._requirement_graph.clear()
+        if set(self._requirement_graph.labels()) != set(self._loaded_packages.keys()):
+            self._requirement_graph.rebuild(self._loaded_packages)
+        LOGGER.debug("session state: restored {}".format(plural_string('loaded package', len(packages))))
+        return True
+
+    def _get_state_digest(self, packages):
+        h = hashlib.sha1()
+        for package in packages:
+            h.update("{}\0".format(package.absolute_label).encode('utf-8', 'surrogateescape'))
+            for transition in package.get_transitions():
+                h.update("{}\0{!r}\0".format(transition, getattr(transition, 'separator', None)).encode('utf-8', 'surrogateescape'))
+            for requirement in package.get_requirements():
+                h.update("{}\0".format(requirement).encode('utf-8', 'surrogateescape'))
+        return h.hexdigest()
+
+    def _get_state_environment(self, packages):
+        """_get_state_environment(packages) -> dict or None
+Returns the current value of all the variables changed by the transitions
+of packages, or None if a transition is not an environment transition"""
+        state_environment = {}
+        for package in packages:
+            for transition in package.get_transitions():
+                if not isinstance(transition, EnvVarTransition):
+                    return None
+                for var_name in transition.var_name, transition._cache_var_name():
+                    state_environment[var_name] = self._environment.var_get(var_name)
+        return state_environment
+
+    def _store_state(self):
+        packages = list(self._loaded_packages.values())
+        state_environment = self._get_state_environment(packages)
+        state = self.session_config['state']
+        if packages and state_environment is not None:
+            state['loaded_packages'] = ':'.join(self._loaded_packages.keys())
+            state['digest'] = self._get_state_digest(packages)
+            # values are interpolated by the config parser
+            state['environment'] = json.dumps(state_environment, sort_keys=True).replace('%', '%%')
+            state['requirements'] = json.dumps(self._requirement_graph.dump(), sort_keys=True).replace('%', '%%')
+        else:
+            for key in 'loaded_packages', 'digest', 'environment', 'requirements':
+                state[key] = ''
+
     def store(self):
+        if self._volatile:
+            return
         self.check_read_only()
         sticky_packages = self._sticky_packages.intersection(self._loaded_packages.keys())
         self.session_config['packages']['loaded_packages'] = ':'.join(self._loaded_packages.keys())
         self.session_config['packages']['sticky_packages'] = ':'.join(sticky_packages)
+        self._store_state()
+        self._store_undo_log()
         if not self._dry_run:
             self.session_config.store()
         
@@ -649,11 +1111,91 @@ $ZAPPER_LOADED_PACKAGES) and returns the list of unloaded packages"""
                 self._sticky_packages.update(package.absolute_label for package in all_packages)
         
     def load_packages(self, packages, resolution_level=0, simulate=False, info=True):
+        cache_key = None
+        sorted_package_lists = None
+        if RESOLUTION_CACHE.enabled:
+            catalog_fingerprint = self._get_catalog_fingerprint()
+            if catalog_fingerprint is not None:
+                cache_key = RESOLUTION_CACHE.make_key(catalog_fingerprint,
+                    self._loaded_packages.keys(),
+                    [package.absolute_label for package in packages],
+                    resolution_level, self._version_defaults, self._resolver)
+                sorted_package_lists = self._get_cached_resolution(cache_key)
+                if sorted_package_lists is not None:
+                    for sorted_packages in sorted_package_lists:
+                        for package in sorted_packages:
+                            if not package in packages:
+                                LOGGER.info("package {0} will be automatically loaded".format(package))
+        if sorted_package_lists is None:
+            if resolution_level > 0 and self._resolver == self.RESOLVER_BACKTRACKING:
+                packages_to_load, package_dependencies = self._resolve_backtracking(packages, resolution_level)
+            else:
+                packages_to_load, package_dependencies = self._resolve_greedy(packages, resolution_level)
+            sorted_package_lists = [sorted_dependencies(package_dependencies, packages) for packages in self._separate_suites(packages_to_load)]
+            if cache_key is not None:
+                RESOLUTION_CACHE.store(cache_key,
+                    [[package.absolute_label for package in sorted_packages] for sorted_packages in sorted_package_lists])
+        loaded_packages = []
+        for sorted_packages in sorted_package_lists:
+            self._load_packages(sorted_packages, simulate=simulate, info=info)
+            loaded_packages.extend(sorted_packages)
+        return loaded_packages
+
+    def _get_cached_resolution(self, cache_key):
+        """_get_cached_resolution(cache_key) -> list of sorted package lists or None"""
+        label_lists = RESOLUTION_CACHE.get(cache_key)
+        if label_lists is None:
+            return None
+        self._require_labels(label for labels in label_lists for label in labels)
+        sorted_package_lists = []
+        for labels in label_lists:
+            sorted_packages = []
+            for label in labels:
+                package = self._available_packages.get(label, None)
+                if package is None:
+                    package = self._defined_packages.get(label, None)
+                if package is None:
+                    LOGGER.debug("resolution cache: package {} not found".format(label))
+                    return None
+                sorted_packages.append(package)
+            sorted_package_lists.append(sorted_packages)
+        LOGGER.debug("resolution cache: using cached resolution")
+        return sorted_package_lists
+
+    def _get_catalog_fingerprint(self):
+        """_get_catalog_fingerprint() -> fingerprint string or None
+Fingerprint of the package files in the package directories, nested
+package directories included, and of the package filters"""
+        if self._catalog_fingerprint is None:
+            h = hashlib.sha1()
+            for expression in self._package_filters:
+                h.update("{}\0".format(expression).encode('utf-8', 'surrogateescape'))
+            try:
+                scanned_package_dirs = set()
+                for package_dir in self._package_directories:
+                    if package_dir in scanned_package_dirs:
+                        # nested package directory, already scanned
+                        continue
+                    package_dirs, module_entries = self._scan_package_dir(package_dir)
+                    scanned_package_dirs.update(package_dirs)
+                    module_paths = sorted(module_path for current_dir, module_path in module_entries)
+                    h.update("{}\0".format(CATALOG_CACHE.fingerprint(package_dir, module_paths)).encode('utf-8'))
+            except OSError as e:
+                LOGGER.debug("cannot compute catalog fingerprint: {}: {}".format(e.__class__.__name__, e))
+                return None
+            self._catalog_fingerprint = h.hexdigest()
+        return self._catalog_fingerprint
+
+    def _resolve_greedy(self, packages, resolution_level):
+        """_resolve_greedy(packages, resolution_level) -> (packages_to_load, package_dependencies)
+For each unmatched requirement, the highest version of the matching
+packages is selected"""
         package_dependencies = collections.defaultdict(set)
-        available_packages = self.available_packages()
-        defined_packages = self.defined_packages()
+        # live collections: deferred packages are added on demand, and
+        # requirements are matched through the collection indexes
+        available_packages = self._available_packages
+        defined_packages = self._defined_packages
         packages_to_load = set()
-        loaded_packages = []
         while packages:
             simulated_loaded_packages = list(sequences.unique(list(self._loaded_packages.values()) + packages))
             automatically_loaded_packages = []
@@ -661,6 +1203,7 @@ $ZAPPER_LOADED_PACKAGES) and returns the list of unloaded packages"""
                 package_label = package.absolute_label
                 matched_requirements, unmatched_requirements = package.match_requirements(simulated_loaded_packages)
                 if unmatched_requirements and resolution_level > 0:
+                    self._require_expressions(expression for pkg, expression in unmatched_requirements)
                     # search in available_packages:
                     LOGGER.debug("resolution[1]: package {0}: searching {1} <{2}> in available packages...".format(
                         package,
@@ -699,7 +1242,10 @@ $ZAPPER_LOADED_PACKAGES) and returns the list of unloaded packages"""
                 for pkg0, expression, pkg_lst in matched_requirements:
                     package_dependencies[pkg0].add(pkg_lst[-1])
 
-                conflicts = package.match_conflicts(simulated_loaded_packages)
+                # loaded packages conflicts through the index
+                conflicts = self._get_conflict_index().match_conflicts(package)
+                conflicts.extend(package.match_conflicts(
+                    [pkg for pkg in simulated_loaded_packages if not pkg.absolute_label in self._loaded_packages]))
                 if conflicts:
                     for pkg0, expression, pkg1 in conflicts:
                         LOGGER.error("{0}: expression {1} conflicts with {2}".format(pkg0, expression, pkg1))
@@ -711,12 +1257,17 @@ $ZAPPER_LOADED_PACKAGES) and returns the list of unloaded packages"""
                 #packages = list(sequences.difference(packages, simulated_loaded_packages))
                 LOGGER.debug("automatically_loaded_packages={0}".format([str(p) for p in automatically_loaded_packages]))
                 packages = list(sequences.unique(automatically_loaded_packages))
-        suites_to_load, packages_to_load = self._separate_suites(packages_to_load)
-        for packages in suites_to_load, packages_to_load:
-            sorted_packages = sorted_dependencies(package_dependencies, packages)
-            self._load_packages(sorted_packages, simulate=simulate, info=info)
-            loaded_packages.extend(packages)
-        return loaded_packages
+        return packages_to_load, package_dependencies
+
+    def _resolve_backtracking(self, packages, resolution_level):
+        """_resolve_backtracking(packages, resolution_level) -> (packages_to_load, package_dependencies)"""
+        package_collections = [self._available_packages]
+        if resolution_level > 1:
+            package_collections.append(self._defined_packages)
+        resolver = BacktrackingResolver(self._loaded_packages.values(), package_collections,
+            version_defaults=self._version_defaults,
+            require_expressions=self._require_expressions)
+        return resolver.resolve(packages)
 
     def _separate_suites(self, packages):
         suites = []
@@ -740,6 +1291,7 @@ $ZAPPER_LOADED_PACKAGES) and returns the list of unloaded packages"""
                 continue
             package.load(self, info=info)
             self._loaded_packages[package.absolute_label] = package
+            self._requirement_graph.add_package(package, self._loaded_packages)
             if isinstance(package, Suite):
                 self._add_suite(package)
 
@@ -748,6 +1300,13 @@ $ZAPPER_LOADED_PACKAGES) and returns the list of unloaded packages"""
             if self._loaded_packages.is_changed() or self._orig_sticky_packages != self._sticky_packages:
                 if not self._dry_run:
                     self.store()
+            if self.session_type == self.SESSION_TYPE_TEMPORARY and not (self._deleted or self._volatile or self._dry_run):
+                changed = touch_session(self.session_config)
+                # sessions whose owner is dead are adopted by the current shell
+                if not self.session_config['session']['owner_pid'] or is_session_stale(self.session_config):
+                    changed = set_session_owner(self.session_config) or changed
+                if changed:
+                    self.session_config.store()
         if self._deleted:
             self.delete_session_root(self.session_root, self.session_name, force=self._force)
         
@@ -783,40 +1342,49 @@ $ZAPPER_LOADED_PACKAGES) and returns the list of unloaded packages"""
             packages = self._get_subpackages(packages)
 
         packages_to_unload = set()
-
+        loaded_package_labels = list(self._loaded_packages.keys())
         while packages:
             automatically_unloaded_packages = []
-            # check missing dependencies:
-            for package in packages:
-                new_loaded_packages = [pkg for pkg in self._loaded_packages.values() if not pkg in packages]
-                for pkg in new_loaded_packages:
-                    matched_requirements, unmatched_requirements = pkg.match_requirements(filter(lambda pkg0: pkg0 is not pkg, new_loaded_packages))
-                    if unmatched_requirements:
-                        if resolution_level > 0:
-                            LOGGER.debug("resolution[1]: automatically unloading {0} <{1}>...".format(
-                                plural_string('depending package', len(unmatched_requirements)),
-                                ', '.join(str(e[0]) for e in unmatched_requirements)
-                            ))
-                            for pkg0, expression in unmatched_requirements:
-                                if not pkg in automatically_unloaded_packages:
-                                    LOGGER.info("package {0} will be automatically unloaded".format(pkg))
-                                    automatically_unloaded_packages.append(pkg)
-                        else:
-                            for pkg0, expression in unmatched_requirements:
-                                LOGGER.error("after unload of {0}: {1}: unmatched requirement {2}".format(package, pkg0, expression))
-                            raise UnloadPackageError("cannot unload package {0}: would leave {1}".format(
-                                package,
-                                plural_string('unmatched requirement', len(unmatched_requirements))))
             packages_to_unload.update(packages)
+            # check missing dependencies:
+            unload_labels = {package.absolute_label for package in packages_to_unload}
+            broken_requirements = collections.defaultdict(list)
+            for pkg_label, requirement_index, provider_labels in self._requirement_graph.broken_requirements(unload_labels):
+                broken_requirements[pkg_label].append((requirement_index, provider_labels))
+            for pkg_label in loaded_package_labels:
+                if not pkg_label in broken_requirements:
+                    continue
+                pkg = self._loaded_packages[pkg_label]
+                requirements = tuple(pkg.get_requirements())
+                unmatched_requirements = [(pkg, requirements[requirement_index]) for requirement_index, provider_labels in broken_requirements[pkg_label]]
+                if resolution_level > 0:
+                    LOGGER.debug("resolution[1]: automatically unloading {0} <{1}>...".format(
+                        plural_string('depending package', len(unmatched_requirements)),
+                        ', '.join(str(e[0]) for e in unmatched_requirements)
+                    ))
+                    LOGGER.info("package {0} will be automatically unloaded".format(pkg))
+                    automatically_unloaded_packages.append(pkg)
+                else:
+                    for (requirement_index, provider_labels), (pkg0, expression) in zip(broken_requirements[pkg_label], unmatched_requirements):
+                        package = next(package for package in packages if package.absolute_label in provider_labels)
+                        LOGGER.error("after unload of {0}: {1}: unmatched requirement {2}".format(package, pkg0, expression))
+                    raise UnloadPackageError("cannot unload package {0}: would leave {1}".format(
+                        package,
+                        plural_string('unmatched requirement', len(unmatched_requirements))))
             packages = list(sequences.unique(automatically_unloaded_packages))
 
         # compute dependencies between packages to unload:
         # it is used to unload packages in the correct order
         package_dependencies = collections.defaultdict(set)
+        unload_labels = {package.absolute_label for package in packages_to_unload}
         for package in packages_to_unload:
-            matched_requirements, unmatched_requirements = package.match_requirements(filter(lambda pkg0: pkg0 is not package, packages_to_unload))
-            for pkg0, expression, pkg_lst in matched_requirements:
-                package_dependencies[pkg0].add(pkg_lst[-1])
+            package_label = package.absolute_label
+            if not package_label in self._requirement_graph:
+                continue
+            for provider_labels in self._requirement_graph.providers(package_label):
+                for provider_label in provider_labels:
+                    if provider_label in unload_labels:
+                        package_dependencies[package].add(self._loaded_packages[provider_label])
 
         suites_to_unload, packages_to_unload = self._separate_suites(packages_to_unload)
         for packages in packages_to_unload, suites_to_unload:
@@ -834,6 +1402,7 @@ $ZAPPER_LOADED_PACKAGES) and returns the list of unloaded packages"""
                 continue
             package.unload(self)
             del self._loaded_packages[package.absolute_label]
+            self._requirement_graph.remove_package(package)
             if isinstance(package, Suite):
                 self._remove_suite(package)
             self._sticky_packages.discard(package.absolute_label)
@@ -875,11 +1444,14 @@ $ZAPPER_LOADED_PACKAGES) and returns the list of unloaded packages"""
     def is_loaded(self, package):
         return package.absolute_label in self._loaded_packages
 
+    def _get_conflict_index(self):
+        """_get_conflict_index() -> ConflictIndex of the loaded packages"""
+        if self._conflict_index is None or self._conflict_index.labels != tuple(self._loaded_packages.keys()):
+            self._conflict_index = ConflictIndex(self._loaded_packages.values())
+        return self._conflict_index
+
     def is_conflicting(self, package):
-        if package.match_conflicts(self._loaded_packages.values()):
-            return True
-        else:
-            return False
+        return self._get_conflict_index().is_conflicting(package)
 
     def _mark(self, b, symbol_True='*', symbol_False=''):
         if b:
@@ -946,6 +1518,30 @@ $ZAPPER_LOADED_PACKAGES) and returns the list of unloaded packages"""
             validate_format(package_dir_format, **cls.PACKAGE_DIR_HEADER_DICT)
         return package_dir_format
 
+    @classmethod
+    def Resolver(cls, resolver):
+        if not resolver in cls.RESOLVERS:
+            raise ValueError("invalid resolver {!r}: valid resolvers are {}".format(resolver, ', '.join(cls.RESOLVERS)))
+        return resolver
+
+    @classmethod
+    def SessionStoreName(cls, session_store):
+        if not session_store in cls.SESSION_STORES:
+            raise ValueError("invalid session store {!r}: valid session stores are {}".format(session_store, ', '.join(cls.SESSION_STORES)))
+        return session_store
+
+    @classmethod
+    def SessionDbJournalMode(cls, journal_mode):
+        if not journal_mode in cls.SESSION_DB_JOURNAL_MODES:
+            raise ValueError("invalid session db journal mode {!r}: valid journal modes are {}".format(journal_mode, ', '.join(cls.SESSION_DB_JOURNAL_MODES)))
+        return journal_mode
+
+    @classmethod
+    def TranslationMode(cls, translation_mode):
+        if not translation_mode in cls.TRANSLATION_MODES:
+            raise ValueError("invalid translation mode {!r}: valid translation modes are {}".format(translation_mode, ', '.join(cls.TRANSLATION_MODES)))
+        return translation_mode
+
     @classmethod
     def PackageSortKeys(cls, package_sort_keys):
         return SortKeys(package_sort_keys, cls.PACKAGE_HEADER_DICT, 'package')
@@ -978,8 +1574,9 @@ $ZAPPER_LOADED_PACKAGES) and returns the list of unloaded packages"""
     def show_available_packages(self, package_labels, *, show_title=False):
         if package_labels:
             packages = []
+            self._require_labels(package_labels)
             for package_label in package_labels:
-                for package in self.get_packages(package_label, self.available_packages()):
+                for package in self.get_packages(package_label, self._available_packages):
                     if not package in packages:
                         packages.append(package)
         else:
@@ -1032,6 +1629,9 @@ $ZAPPER_LOADED_PACKAGES) and returns the list of unloaded packages"""
         self.show_loaded_packages(show_title=True)
 
     def translate(self, translator):
+        if self._translation_mode == self.TRANSLATION_MODE_DELTA:
+            self._translate_delta(translator)
+            return
         for var_name, var_value in self._environment.changeditems():
             orig_var_value = self._orig_environment.get(var_name, None)
             if var_value is None and orig_var_value is not None:
@@ -1047,12 +1647,32 @@ $ZAPPER_LOADED_PACKAGES) and returns the list of unloaded packages"""
         else:
             translator.var_set("ZAPPER_SESSION", self.session_root)
 
+    def _translate_delta(self, translator):
+        """_translate_delta(translator)
+Translates only the net delta between the original and the final
+environment, including the zapper variables"""
+        final_values = dict(self._environment.changeditems())
+        final_values["ZAPPER_LOADED_PACKAGES"] = ':'.join(self._loaded_packages.keys())
+        if self._deleted:
+            final_values["ZAPPER_SESSION"] = None
+        else:
+            final_values["ZAPPER_SESSION"] = self.session_root
+        for var_name in sorted(final_values):
+            var_value = final_values[var_name]
+            orig_var_value = self._orig_environment.get(var_name, None)
+            if var_value == orig_var_value:
+                translator.var_discard(var_name)
+            elif var_value is None:
+                translator.var_unset(var_name)
+            else:
+                translator.var_set(var_name, var_value)
+
     def translate_stream(self, translator, stream=None, translation_filename=None, *, dry_run=None):
         if dry_run is None:
             dry_run = self._dry_run
         self.translate(translator)
         if not dry_run:
-            translator.translate(stream)
+            translator.translate(stream, transaction=self._translation_mode == self.TRANSLATION_MODE_DELTA)
         if translation_filename:
             translator.translate_remove_filename(stream, translation_filename)
 
@@ -1076,3 +1696,30 @@ $ZAPPER_LOADED_PACKAGES) and returns the list of unloaded packages"""
             return False
         else:
             return True
+
+def _evaluate_package_dir(package_dir):
+    """_evaluate_package_dir(package_dir) -> evaluation or None
+Loads package_dir in a loader worker process"""
+    try:
+        existing_product_names = set(Product.get_product_names())
+        session = Session(None, load=False)
+        # the output is written by the parent process only if the
+        # evaluation is used, otherwise the directory is loaded serially
+        with collect_log() as log_records, contextlib.redirect_stderr(io.StringIO()) as error_stream:
+            package_dirs = session._load_package_dir(package_dir)
+        if session._failed_modules:
+            return None
+        output = (error_stream.getvalue(), log_records)
+        package_index = session._deferred_package_dirs.get(package_dir, None)
+        if package_index is not None:
+            return ('deferred', package_dirs, package_index.to_dict(), output)
+        else:
+            product_names = [product_name for product_name in Product.get_product_names() if not product_name in existing_product_names]
+            return ('loaded', package_dirs, list(session._modules), CATALOG_CACHE.dumps(package_dirs), product_names, output)
+    except Exception as e:
+        trace()
+        LOGGER.info("package directory {} cannot be loaded by a worker process: {}: {}".format(package_dir, e.__class__.__name__, e))
+        return None
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
@@ -30,11 +30,22 @@ class SessionConfig(Config):
             'name': '',
             'type': '',
             'creation_time': '',
+            'use_time': '',
+            'owner_pid': '',
+            'owner_host': '',
+            'owner_start_time': '',
         },
         'packages': {
             'loaded_packages': '',
             'sticky_packages': '',
         },
+        'state': {
+            'loaded_packages': '',
+            'digest': '',
+            'environment': '',
+            'requirements': '',
+            'undo_log': '',
+        },
         'config': SESSION_CONFIG,
         'version_defaults': VERSION_DEFAULTS,
     }
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+#
+# Copyright 2013 Simone Campagna
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+__author__ = 'Simone Campagna'
+
+__all__ = ['set_shell_pid', 'get_shell_pid', 'get_process_start_time',
+           'set_session_owner', 'touch_session', 'get_session_age',
+           'is_session_stale']
+
+import os
+import time
+import socket
+import datetime
+
+_SHELL_PID = None
+_TIME_FORMAT = "%Y%m%d %H:%M:%S"
+# the use time of a session is updated at most once every USE_TIME_RESOLUTION seconds
+USE_TIME_RESOLUTION = 60
+
+def set_shell_pid(pid):
+    """set_shell_pid(pid)
+Sets the pid of the process running the current command (None: parent process)"""
+    global _SHELL_PID
+    _SHELL_PID = pid
+
+def get_shell_pid():
+    """get_shell_pid() -> pid of the shell running the current command
+The pid is taken from $ZAPPER_SHELL_PID (set by the shell profile, so that
+subshells are not taken as owners), or is the pid of the parent process"""
+    shell_pid = os.environ.get("ZAPPER_SHELL_PID", "")
+    if shell_pid.isdigit():
+        return int(shell_pid)
+    if _SHELL_PID is None:
+        return os.getppid()
+    return _SHELL_PID
+
+def get_process_start_time(pid):
+    """get_process_start_time(pid) -> start time string, or '' if not available"""
+    try:
+        with open("/proc/{}/stat".format(pid), "r") as f_in:
+            stat = f_in.read()
+    except (OSError, ValueError):
+        return ''
+    # the command name can contain spaces and parentheses
+    fields = stat[stat.rfind(')') + 2:].split()
+    if len(fields) > 19:
+        return fields[19]
+    return ''
+
+def _get_owner():
+    pid = get_shell_pid()
+    return (
+        ('owner_pid', str(pid)),
+        ('owner_host', socket.gethostname()),
+        ('owner_start_time', get_process_start_time(pid)),
+    )
+
+def set_session_owner(session_config):
+    """set_session_owner(session_config) -> True if changed
+Records the shell running the current command as the owner of the session"""
+    session = session_config['session']
+    changed = False
+    for key, value in _get_owner():
+        if session.get(key, '') != value:
+            session[key] = value
+            changed = True
+    return changed
+
+def _parse_time(time_string):
+    try:
+        return datetime.datetime.strptime(time_string, _TIME_FORMAT).timestamp()
+    except ValueError:
+        return None
+
+def touch_session(session_config, now=None):
+    """touch_session(session_config, now=None) -> True if changed
+Records the current time as the last use time of the session"""
+    session = session_config['session']
+    if now is None:
+        now = time.time()
+    use_time = _parse_time(session.get('use_time', ''))
+    if use_time is not None and 0 <= now - use_time < USE_TIME_RESOLUTION:
+        return False
+    session['use_time'] = datetime.datetime.fromtimestamp(now).strftime(_TIME_FORMAT)
+    return True
+
+def get_session_age(session_config, now=None):
+    """get_session_age(session_config, now=None) -> seconds since the last use
+The creation time is used for sessions which have never been used; None
+if neither time is available"""
+    session = session_config['session']
+    if now is None:
+        now = time.time()
+    for key in 'use_time', 'creation_time':
+        session_time = _parse_time(session.get(key, ''))
+        if session_time is not None:
+            return now - session_time
+    return None
+
+def is_session_stale(session_config, hostname=None, min_age=0, max_age=0):
+    """is_session_stale(session_config, hostname=None, min_age=0, max_age=0) -> bool
+Returns True if the owner of the session is a dead process on this host;
+sessions owned by processes on other hosts are never stale.
+Sessions used in the last min_age seconds are never stale, since shells
+started by the owner (for instance in screen or tmux) can still use them.
+Sessions without owner are stale if unused for max_age seconds (never,
+if max_age is 0)"""
+    session = session_config['session']
+    if min_age or max_age:
+        age = get_session_age(session_config)
+    else:
+        age = None
+    if min_age and (age is None or age < min_age):
+        return False
+    owner_pid = session.get('owner_pid', '')
+    if not owner_pid:
+        return bool(max_age) and age is not None and age >= max_age
+    if hostname is None:
+        hostname = socket.gethostname()
+    if session.get('owner_host', '') != hostname:
+        return False
+    try:
+        pid = int(owner_pid)
+        if pid <= 0:
+            return False
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        # the process exists
+        pass
+    except (ValueError, OverflowError, OSError):
+        return False
+    owner_start_time = session.get('owner_start_time', '')
+    if owner_start_time:
+        start_time = get_process_start_time(pid)
+        if start_time and start_time != owner_start_time:
+            # the pid has been reused
+            return True
+    return False
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+#
+# Copyright 2013 Simone Campagna
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+__author__ = 'Simone Campagna'
+
+__all__ = ['FileSessionStore', 'SqliteSessionStore']
+
+import os
+import glob
+import sqlite3
+
+from .session_config import SessionConfig
+from .errors import SessionError
+from .utils.debug import LOGGER
+
+
+class FileSessionStore(object):
+    """FileSessionStore()
+Each session is stored in the config file <session_root>.session"""
+    STORE_NAME = 'file'
+    SESSION_SUFFIX = ".session"
+
+    def get_session_config_file(self, session_root):
+        return session_root + self.SESSION_SUFFIX
+
+    def exists(self, session_root):
+        """exists(session_root) -> True if the session exists"""
+        return os.path.lexists(self.get_session_config_file(session_root))
+
+    def reserve(self, session_root):
+        """reserve(session_root) -> True if the session has been reserved
+Atomically creates an empty session, if it does not exist"""
+        session_config_file = self.get_session_config_file(session_root)
+        try:
+            fd = os.open(session_config_file, os.O_CREAT | os.O_EXCL)
+        except OSError as e:
+            # file already exists
+            LOGGER.warning("cannot create config file {}: {}: {}".format(session_config_file, e.__class__.__name__, e))
+            return False
+        os.close(fd)
+        return True
+
+    def delete(self, session_root):
+        session_config_file = self.get_session_config_file(session_root)
+        lock_filename = SessionConfig.get_lock_filename(session_config_file)
+        os.remove(session_config_file)
+        if os.path.lexists(lock_filename):
+            os.remove(lock_filename)
+
+    def get_session_roots(self, sessions_dir, session_name_pattern='*'):
+        """get_session_roots(sessions_dir, session_name_pattern='*') -> list of session roots"""
+        session_roots = []
+        for session_config_file in glob.glob(os.path.join(sessions_dir, session_name_pattern + self.SESSION_SUFFIX)):
+            session_roots.append(session_config_file[:-len(self.SESSION_SUFFIX)])
+        return session_roots
+
+    def get_session_config(self, session_root):
+        """get_session_config(session_root) -> SessionConfig"""
+        return SessionConfig(self.get_session_config_file(session_root))
+
+    def __repr__(self):
+        return "{c}()".format(c=self.__class__.__name__)
+
+
+class SqliteSessionConfig(SessionConfig):
+    """SqliteSessionConfig(session_store, session_root)
+A SessionConfig stored in a SqliteSessionStore"""
+    def __init__(self, session_store, session_root):
+        self.session_store = session_store
+        self.session_root = session_root
+        super().__init__(None)
+
+    def exists(self):
+        return self.session_store.exists(self.session_root)
+
+    def _load_data(self):
+        data = self.session_store.load_data(self.session_root)
+        if data is None:
+            raise SessionError("session {} does not exist".format(self.session_root))
+        return data
+
+    def _store_data(self, data):
+        self.session_store.store_data(self.session_root, self, data)
+
+
+class SqliteSessionStore(object):
+    """SqliteSessionStore(db_file, journal_mode='delete')
+All the sessions are stored in a single SQLite database. The table rows
+contain the session metadata and package lists, used to list the
+sessions, and the whole session config.
+The 'wal' journal mode is faster with concurrent shells, but it needs
+shared memory between the processes using the database: it must not be
+used if the database is on a network filesystem, as NFS."""
+    STORE_NAME = 'sqlite'
+    DB_VERSION = 1
+    JOURNAL_MODE_DELETE = 'delete'
+    JOURNAL_MODE_WAL = 'wal'
+    JOURNAL_MODES = [JOURNAL_MODE_DELETE, JOURNAL_MODE_WAL]
+    TIMEOUT = 10.0
+    COLUMNS = ('session_root', 'sessions_dir', 'name', 'type', 'creation_time',
+               'description', 'read_only', 'loaded_packages', 'sticky_packages', 'data')
+
+    def __init__(self, db_file, journal_mode=JOURNAL_MODE_DELETE):
+        self.db_file = db_file
+        self.journal_mode = journal_mode
+        self._connection = None
+        self._pid = None
+
+    def _connect(self):
+        # connections cannot be shared with forked processes
+        if self._connection is None or self._pid != os.getpid():
+            db_dir = os.path.dirname(self.db_file)
+            if db_dir and not os.path.lexists(db_dir):
+                os.makedirs(db_dir)
+            connection = sqlite3.connect(self.db_file, timeout=self.TIMEOUT, isolation_level=None)
+            connection.execute("PRAGMA journal_mode={}".format(self.journal_mode.upper()))
+            if self.journal_mode == self.JOURNAL_MODE_WAL:
+                connection.execute("PRAGMA synchronous=NORMAL")
+            db_version = connection.execute("PRAGMA user_version").fetchone()[0]
+            if db_version == 0:
+                connection.execute("""CREATE TABLE IF NOT EXISTS sessions (
+    session_root TEXT PRIMARY KEY,
+    sessions_dir TEXT NOT NULL,
+    name TEXT NOT NULL,
+    type TEXT NOT NULL DEFAULT '',
+    creation_time TEXT NOT NULL DEFAULT '',
+    description TEXT NOT NULL DEFAULT '',
+    read_only TEXT NOT NULL DEFAULT '',
+    loaded_packages TEXT NOT NULL DEFAULT '',
+    sticky_packages TEXT NOT NULL DEFAULT '',
+    data TEXT NOT NULL DEFAULT ''
+)""")
+                connection.execute("CREATE INDEX IF NOT EXISTS sessions_dir_index ON sessions (sessions_dir, name)")
+                connection.execute("PRAGMA user_version={}".format(self.DB_VERSION))
+            elif db_version != self.DB_VERSION:
+                raise SessionError("session database {}: unsupported version {}".format(self.db_file, db_version))
+            self._connection = connection
+            self._pid = os.getpid()
+        return self._connection
+
+    def exists(self, session_root):
+        """exists(session_root) -> True if the session exists"""
+        row = self._connect().execute("SELECT 1 FROM sessions WHERE session_root = ?", (session_root,)).fetchone()
+        return row is not None
+
+    def reserve(self, session_root):
+        """reserve(session_root) -> True if the session has been reserved
+Atomically creates an empty session, if it does not exist"""
+        cursor = self._connect().execute("INSERT OR IGNORE INTO sessions (session_root, sessions_dir, name) VALUES (?, ?, ?)",
+            (session_root, os.path.dirname(session_root), os.path.basename(session_root)))
+        if cursor.rowcount != 1:
+            LOGGER.warning("session {} already exists".format(session_root))
+            return False
+        return True
+
+    def delete(self, session_root):
+        self._connect().execute("DELETE FROM sessions WHERE session_root = ?", (session_root,))
+
+    def get_session_roots(self, sessions_dir, session_name_pattern='*'):
+        """get_session_roots(sessions_dir, session_name_pattern='*') -> list of session roots"""
+        cursor = self._connect().execute("SELECT session_root FROM sessions WHERE sessions_dir = ? AND name GLOB ? ORDER BY name",
+            (sessions_dir, session_name_pattern))
+        return [row[0] for row in cursor]
+
+    def get_session_config(self, session_root):
+        """get_session_config(session_root) -> SessionConfig"""
+        return SqliteSessionConfig(self, session_root)
+
+    def load_data(self, session_root):
+        """load_data(session_root) -> session config data or None"""
+        row = self._connect().execute("SELECT data FROM sessions WHERE session_root = ?", (session_root,)).fetchone()
+        if row is None:
+            return None
+        return row[0]
+
+    def store_data(self, session_root, session_config, data):
+        """store_data(session_root, session_config, data)
+Stores the session config data and the session metadata"""
+        session = session_config['session']
+        config = session_config['config']
+        packages = session_config['packages']
+        values = (session_root, os.path.dirname(session_root), os.path.basename(session_root),
+                  session.get('type', raw=True), session.get('creation_time', raw=True),
+                  config.get('description', raw=True), config.get('read_only', raw=True),
+                  packages.get('loaded_packages', raw=True), packages.get('sticky_packages', raw=True),
+                  data)
+        self._connect().execute("INSERT OR REPLACE INTO sessions ({}) VALUES ({})".format(
+            ', '.join(self.COLUMNS), ', '.join('?' for column in self.COLUMNS)), values)
+
+    def __repr__(self):
+        return "{c}({f!r}, journal_mode={j!r})".format(c=self.__class__.__name__, f=self.db_file, j=self.journal_mode)
@@ -44,6 +44,9 @@ class Suite(Package):
             self._packages.append(package)
             self.add_package_requirement(package)
 
+    def remove_package(self, package):
+        self._packages.remove(package)
+
     def add_package_requirement(self, package):
         package.requires(self)
 
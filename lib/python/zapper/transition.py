@@ -57,6 +57,15 @@ class EnvVarTransition(Transition):
     def _cache_var_name(self):
         return "_ZAP_{0}_".format(self.var_name)
 
+    def _get_cache(self, session):
+        return session.get_undo_value(self)
+
+    def _set_cache(self, session, cache_var_value):
+        session.set_undo_value(self, cache_var_value)
+
+    def _unset_cache(self, session):
+        session.unset_undo_value(self)
+
     @classmethod
     def label(cls):
         if cls.__label__ is None:
@@ -94,17 +103,14 @@ class SetEnv(EnvVarValueTransition):
     def apply(self, session):
         cache_var_value = session.environment.var_get(self.var_name)
         if cache_var_value is not None:
-            cache_var_name = self._cache_var_name()
-            session.environment.var_set(cache_var_name, cache_var_value)
+            self._set_cache(session, cache_var_value)
         session.environment.var_set(self.var_name, self.var_value)
         
     def revert(self, session):
-        cache_var_name = self._cache_var_name()
-        cache_var_value = session.environment.var_get(cache_var_name)
+        cache_var_value = self._get_cache(session)
         if cache_var_value is not None:
-            cache_var_name = self._cache_var_name()
             session.environment.var_set(self.var_name, cache_var_value)
-            session.environment.var_unset(cache_var_name)
+            self._unset_cache(session)
         else:
             session.environment.var_unset(self.var_name)
 
@@ -113,15 +119,13 @@ class UnsetEnv(EnvVarTransition):
     def apply(self, session):
         cache_var_value = session.environment.var_get(self.var_name)
         if cache_var_value is not None:
-            cache_var_name = self._cache_var_name()
-            session.environment.var_set(cache_var_name, cache_var_value)
+            self._set_cache(session, cache_var_value)
         session.environment.var_unset(self.var_name)
         
     def revert(self, session):
-        cache_var_name = self._cache_var_name()
-        cache_var_value = session.environment.var_get(cache_var_name)
+        cache_var_value = self._get_cache(session)
         if cache_var_value is not None:
-            session.environment.var_unset(cache_var_name)
+            self._unset_cache(session)
             session.environment.var_set(self.var_name, cache_var_value)
 
 class _AddToList(EnvListTransition):
@@ -136,8 +140,7 @@ class _AddToList(EnvListTransition):
     def apply(self, session):
         cache_var_value = session.environment.var_get(self.var_name)
         if cache_var_value is not None:
-            cache_var_name = self._cache_var_name()
-            session.environment.var_set(cache_var_name, cache_var_value)
+            self._set_cache(session, cache_var_value)
         self.function_apply(session)
 
     def revert(self, session):
@@ -145,8 +148,7 @@ class _AddToList(EnvListTransition):
         current_value = session.environment.var_get(self.var_name)
         #print("DBG: <{}>".format(current_value))
         if not current_value:
-            cache_var_name = self._cache_var_name()
-            cache_var_value = session.environment.var_get(cache_var_name)
+            cache_var_value = self._get_cache(session)
             if not cache_var_value:
                 session.environment.var_unset(self.var_name)
         
@@ -197,14 +199,12 @@ class _RemoveFromList(EnvListTransition):
 
     def apply(self, session):
         if self.function_contains(session):
-            cache_var_name = self._cache_var_name()
             cache_var_value = session.environment.var_get(self.var_name)
-            session.environment.var_set(cache_var_name, cache_var_value)
+            self._set_cache(session, cache_var_value)
             self.function_apply(session)
 
     def revert(self, session):
-        cache_var_name = self._cache_var_name()
-        cache_var_value = session.environment.var_get(cache_var_name)
+        cache_var_value = self._get_cache(session)
         if cache_var_value is not None:
             self.function_revert(session, cache_var_value)
 
@@ -56,9 +56,18 @@ class Translator(object, metaclass=MetaTranslator):
         #self._vars.append((var_name, None))
         self._vars[var_name] = None
 
-    def translate(self, stream=None):
+    def var_discard(self, var_name):
+        self._vars.pop(var_name, None)
+
+    def translate(self, stream=None, *, transaction=False):
         if stream is None:
             stream = sys.stdout
+        if transaction:
+            var_unset_names = [var_name for var_name, var_value in self._vars.items() if var_value is None]
+            var_set_items = [(var_name, var_value) for var_name, var_value in self._vars.items() if var_value is not None]
+            self.translate_transaction(stream, var_set_items, var_unset_names)
+            self.clear()
+            return
         for var_name, var_value in self._vars.items():
             if var_value is None:
                 #print("TRANSLATION: unset({0!r})".format(var_name))
@@ -68,6 +77,15 @@ class Translator(object, metaclass=MetaTranslator):
                 self.translate_var_set(stream, var_name, var_value)
         self.clear()
 
+    def translate_transaction(self, stream, var_set_items, var_unset_names):
+        """translate_transaction(stream, var_set_items, var_unset_names)
+Translates all the changes at once; translators can override it to emit
+fewer statements"""
+        for var_name in var_unset_names:
+            self.translate_var_unset(stream, var_name)
+        for var_name, var_value in var_set_items:
+            self.translate_var_set(stream, var_name, var_value)
+
     def clear(self):
         #del self._vars[:]
         self._vars.clear()
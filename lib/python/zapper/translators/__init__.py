@@ -17,4 +17,4 @@
 
 __author__ = 'Simone Campagna'
 
-__all__ = ['bash']
+__all__ = ['bash', 'data']
@@ -28,6 +28,13 @@ class bash(Translator):
 
     def translate_var_unset(self, stream, var_name):
         stream.write("export -n {0}\nunset {0}\n".format(var_name))
+
+    def translate_transaction(self, stream, var_set_items, var_unset_names):
+        if var_unset_names:
+            var_names = ' '.join(var_unset_names)
+            stream.write("export -n {0}\nunset {0}\n".format(var_names))
+        if var_set_items:
+            stream.write("export {0}\n".format(' '.join("{0}={1!r}".format(var_name, var_value) for var_name, var_value in var_set_items)))
         
     def translate_remove_filename(self, stream, filename):
         stream.write("rm -f {0}\n".format(filename))
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+#
+# Copyright 2013 Simone Campagna
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+__author__ = 'Simone Campagna'
+
+__all__ = ['DataTranslator', 'JsonTranslator', 'Env0Translator', 'MarshalTranslator']
+
+import os
+import sys
+import abc
+import json
+import marshal
+import collections
+from ..translator import Translator
+
+class DataTranslator(Translator):
+    """DataTranslator()
+Base class of the translators for programs reading the environment
+changes: all the changes are written at once as a single document, where
+unset variables have value None. Since the document is not executed, the
+translation file is not removed by the translation itself."""
+    def translate(self, stream=None, *, transaction=False):
+        if stream is None:
+            stream = sys.stdout
+        self._write(stream, self.encode(self._vars))
+        self.clear()
+
+    def _write(self, stream, data):
+        if isinstance(data, bytes):
+            stream.flush()
+            stream = getattr(stream, 'buffer', stream)
+        stream.write(data)
+        stream.flush()
+
+    @classmethod
+    @abc.abstractmethod
+    def encode(cls, var_dict):
+        """encode(var_dict) -> str or bytes"""
+        pass
+
+    @classmethod
+    @abc.abstractmethod
+    def decode(cls, data):
+        """decode(data) -> var_dict"""
+        pass
+
+    def translate_var_set(self, stream, var_name, var_value):
+        self._write(stream, self.encode({var_name: var_value}))
+
+    def translate_var_unset(self, stream, var_name):
+        self._write(stream, self.encode({var_name: None}))
+
+    def translate_remove_filename(self, stream, filename):
+        pass
+
+    def translate_remove_directory(self, stream, directory):
+        pass
+
+    def translate_remove_empty_directory(self, stream, directory):
+        pass
+
+class JsonTranslator(DataTranslator):
+    """JsonTranslator()
+A JSON object"""
+    __registry_name__ = 'json'
+
+    @classmethod
+    def encode(cls, var_dict):
+        return json.dumps(var_dict) + '\n'
+
+    @classmethod
+    def decode(cls, data):
+        return json.loads(data, object_pairs_hook=collections.OrderedDict)
+
+class Env0Translator(DataTranslator):
+    """Env0Translator()
+NUL-terminated records, as in 'env -0': 'name=value' for set variables,
+'name' for unset variables"""
+    __registry_name__ = 'env0'
+
+    @classmethod
+    def encode(cls, var_dict):
+        records = []
+        for var_name, var_value in var_dict.items():
+            if var_value is None:
+                records.append(var_name)
+            else:
+                records.append("{0}={1}".format(var_name, var_value))
+        return b''.join(os.fsencode(record) + b'\0' for record in records)
+
+    @classmethod
+    def decode(cls, data):
+        var_dict = collections.OrderedDict()
+        for record in data.split(b'\0')[:-1]:
+            var_name, sep, var_value = os.fsdecode(record).partition('=')
+            if sep:
+                var_dict[var_name] = var_value
+            else:
+                var_dict[var_name] = None
+        return var_dict
+
+class MarshalTranslator(DataTranslator):
+    """MarshalTranslator()
+A marshalled python dict"""
+    __registry_name__ = 'marshal'
+
+    @classmethod
+    def encode(cls, var_dict):
+        return marshal.dumps(dict(var_dict))
+
+    @classmethod
+    def decode(cls, data):
+        return marshal.loads(data)
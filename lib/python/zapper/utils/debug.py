@@ -19,6 +19,7 @@
 __author__ = 'Simone Campagna'
 
 import logging
+import contextlib
 import sys
 import os
 
@@ -41,6 +42,32 @@ LOGGER = _create_logger('ZAPPER')
 PRINT_LOGGER = _create_logger('PRINT', level=logging.INFO, formatter=logging.Formatter("%(message)s"))
 PRINT = PRINT_LOGGER.critical
 
+class _CollectingHandler(logging.Handler):
+    def __init__(self, records):
+        super().__init__()
+        self.records = records
+
+    def emit(self, record):
+        self.records.append((record.levelno, record.getMessage()))
+
+@contextlib.contextmanager
+def collect_log(logger=LOGGER):
+    """collect_log(logger=LOGGER) -> context manager returning a list of (level, message)
+The messages of logger are collected in the list instead of being written;
+they can be written later with logger.log(level, message)"""
+    records = []
+    handlers = logger.handlers[:]
+    for handler in handlers:
+        logger.removeHandler(handler)
+    collecting_handler = _CollectingHandler(records)
+    logger.addHandler(collecting_handler)
+    try:
+        yield records
+    finally:
+        logger.removeHandler(collecting_handler)
+        for handler in handlers:
+            logger.addHandler(handler)
+
 def set_verbose(enable):
     global VERBOSE, LOGGER
     VERBOSE = enable
@@ -20,100 +20,127 @@ __author__ = 'Simone Campagna'
 
 import collections
 
-#def _print(d):
-#    print("-" * 80)
-#    for obj0, obj0_set in d.items():
-#        print("{0} : {1}".format(obj0, ' '.join(str(obj1) for obj1 in obj0_set)))
-#    print("-" * 80)
+def _strongly_connected_components(graph):
+    """_strongly_connected_components(graph) -> list of components
+Tarjan's algorithm (iterative); graph is a dict with nodes as keys, and
+lists of successors as values. Components are returned in reverse
+topological order: each component comes after all the components it
+depends on."""
+    index_counter = 0
+    indices = {}
+    lowlinks = {}
+    stack = []
+    on_stack = set()
+    components = []
+    for root in graph:
+        if root in indices:
+            continue
+        indices[root] = lowlinks[root] = index_counter
+        index_counter += 1
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(graph[root]))]
+        while work:
+            node, successors = work[-1]
+            for successor in successors:
+                if not successor in indices:
+                    indices[successor] = lowlinks[successor] = index_counter
+                    index_counter += 1
+                    stack.append(successor)
+                    on_stack.add(successor)
+                    work.append((successor, iter(graph[successor])))
+                    break
+                elif successor in on_stack:
+                    lowlinks[node] = min(lowlinks[node], indices[successor])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlinks[parent] = min(lowlinks[parent], lowlinks[node])
+                if lowlinks[node] == indices[node]:
+                    component = []
+                    while True:
+                        obj = stack.pop()
+                        on_stack.discard(obj)
+                        component.append(obj)
+                        if obj is node:
+                            break
+                    components.append(component)
+    return components
 
 def sorted_dependencies(dependencies, objects=None, reverse=False):
     """sort_dependencies(dependencies, objects=None) -> list of sorted objects
-dependencies: a dict with objects as keys, and sets of objects as values"""
-    set_dependencies = collections.defaultdict(set)
+dependencies: a dict with objects as keys, and sets of objects as values.
+Objects are sorted by dependency level: objects without dependencies have
+level 0, an object not depending on a cycle has a level greater than the
+level of all its dependencies. Objects in a cycle, or depending on a cycle,
+follow the non cycling objects they depend on."""
+    graph = collections.OrderedDict()
     for obj, lst in dependencies.items():
-        set_dependencies[obj] = set(lst)
-    dependencies = set_dependencies
+        graph[obj] = list(lst)
+    for lst in dependencies.values():
+        for obj in lst:
+            if not obj in graph:
+                graph[obj] = []
     if objects:
         for obj in objects:
-            if not obj in dependencies:
-                dependencies[obj] = set()
-    all_objects = set()
-    all_objects.update(dependencies.keys())
-    for obj_set in dependencies.values():
-        all_objects.update(obj_set)
+            if not obj in graph:
+                graph[obj] = []
     if objects is None:
-        objects = all_objects
-#    print("objects: ", objects)
-#    print("all_objects: ", all_objects)
-#    print("=== original:")
-#    _print(dependencies)
+        objects = list(graph.keys())
 
-    # complete dependencies:
-#    i = -1
-    while True:
-#        i += 1
-        changed = False
-        for obj0 in list(dependencies.keys()):
-            obj0_deps = dependencies[obj0]
-            obj0_add_deps = set()
-            for obj1 in obj0_deps:
-                obj1_deps = dependencies[obj1]
-                s = obj1_deps.difference(obj0_deps)
-#                print(".", i, obj0, obj1, obj1_deps, s)
-                if s:
-                    obj0_add_deps.update(s)
-            if obj0_add_deps:
-#                print(">", i, obj0, obj0_add_deps, obj0_deps.union(obj0_add_deps))
-                obj0_deps.update(obj0_add_deps)
-                changed = True
-        if not changed:
-            break
+    components = _strongly_connected_components(graph)
+    component_index = {}
+    for c_index, component in enumerate(components):
+        for obj in component:
+            component_index[obj] = c_index
 
-#    print("=== after complete_dependencies:")
-#    _print(dependencies)
-#    input("...")
-
-    # objects withot cycling dependencies:
-    fixed_objects = set()
-    cycling_objects = set()
-    for obj in all_objects:
-        if obj in dependencies[obj]:
-            cycling_objects.add(obj)
-        else:
-            fixed_objects.add(obj)
-
-#    print("=== fixed_objects:", fixed_objects)
-#    print("=== cycling_objects:", cycling_objects)
-#    input("...")
-    
+    # components are visited after the components they depend on. An object
+    # is 'fixed' if it is not in a cycle, and 'free' if it is fixed and
+    # does not depend on any cycle. For each component:
+    #   level[c]        dependency level of the component objects
+    #   free[c]         True if the component is a free object
+    #   max_free[c]     max level of the free objects c depends on, or -1
+    #   max_fixed[c]    max level of the fixed objects c depends on (c
+    #                   included), or -1
+    # Free objects are sorted by the longest dependency chain; objects in a
+    # cycle follow all the fixed objects they depend on; fixed objects
+    # depending on a cycle follow all the free objects they depend on.
     dependency_level = {}
-    # generating fixed dependencies:
-    rem_objects = set(fixed_objects)
-    while rem_objects:
-        del_objects = set()
-        for obj in rem_objects:
-            if not dependencies[obj]:
-                dependency_level.setdefault(obj, 0)
-                del_objects.add(obj)
-                for obj0 in rem_objects:
-                    if obj in dependencies[obj0]:
-                        dependencies[obj0].discard(obj)
-                        dependency_level[obj0] = max(dependency_level.get(obj0, 0), dependency_level[obj] + 1)
-        if del_objects:
-            rem_objects.difference_update(del_objects)
+    level = []
+    free = []
+    max_free = []
+    max_fixed = []
+    for c_index, component in enumerate(components):
+        c_free = True
+        c_max_free = -1
+        c_max_fixed = -1
+        cycling = len(component) > 1
+        for obj in component:
+            for dep in graph[obj]:
+                d_index = component_index[dep]
+                if d_index == c_index:
+                    cycling = True
+                    continue
+                if free[d_index]:
+                    c_max_free = max(c_max_free, level[d_index])
+                else:
+                    c_free = False
+                    c_max_free = max(c_max_free, max_free[d_index])
+                c_max_fixed = max(c_max_fixed, max_fixed[d_index])
+        if cycling:
+            c_level = c_max_fixed + 1
         else:
-            break
-
-#    print("=== dependency_level:")
-#    print("-" * 80)
-#    for obj, level in dependency_level.items():
-#        print("{0} : {1}".format(obj, level))
-#    print("-" * 80)
-#    input("---")
-    
-    for obj0 in cycling_objects:
-        obj0_fixed_set = dependencies[obj0].intersection(fixed_objects)
-        dependency_level[obj0] = max(dependency_level[obj1] for obj1 in obj0_fixed_set) + 1
+            c_level = c_max_free + 1
+        level.append(c_level)
+        free.append(c_free and not cycling)
+        max_free.append(c_max_free)
+        if cycling:
+            max_fixed.append(c_max_fixed)
+        else:
+            max_fixed.append(max(c_max_fixed, c_level))
+        for obj in component:
+            dependency_level[obj] = c_level
 
     return sorted(objects, key=lambda obj: dependency_level[obj], reverse=reverse)
 
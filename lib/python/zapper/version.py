@@ -23,72 +23,71 @@ __all__ = ['Version',
 import re
 
 class Version(str):
+    """Version(version)
+Versions are interned: equal version strings share the same instance.
+Each version has a precomputed tuple sort_key; tokens are compared
+numerically by their leading digits, then as strings, so that the
+ordering is total. A version is lower than its extensions ('1.2' < '1.2.1')."""
     RE_SPLIT = re.compile(r"[\.\-_]")
-    RE_INTEGER = re.compile(r"^[1-9]\d*")
+    RE_DIGITS = re.compile(r"^\d+")
     RE_VALID_VERSION = re.compile("|[a-zA-Z_][a-zA-z_0-9\.-]*")
+    _INTERNED = {}
     def __new__(cls, version):
+        instance = cls._INTERNED.get(version, None)
+        if instance is not None:
+            return instance
         if not cls.RE_VALID_VERSION.match(version):
             raise ValueError("invalid version {!r}".format(version))
         instance = super().__new__(cls, version)
-        instance._tokens = []
-        for token in cls.RE_SPLIT.split(instance):
-            if cls.RE_INTEGER.match(token):
-                try:
-                    token = int(token)
-                except ValueError:
-                    pass
-            instance._tokens.append(token)
+        instance._tokens = tuple(cls.RE_SPLIT.split(instance))
+        instance.sort_key = tuple(cls._token_key(token) for token in instance._tokens)
+        cls._INTERNED[str(instance)] = instance
         return instance
-        
-    def comparable(self, token_a, token_b):
-        if isinstance(token_a, str):
-            if not isinstance(token_b, str):
-                token_b = str(token_b)
-        elif isinstance(token_b, str):
-            if not isinstance(token_a, str):
-                token_a = str(token_a)
-        return token_a, token_b
 
-    def __COMPARE(self, other, t_compare, l_compare):
-        if not isinstance(other, Version):
-            other = Version(other)
-        s_tokens = self._tokens
-        o_tokens = other._tokens
-        for s_token, o_token in zip(s_tokens, o_tokens):
-            s_token, o_token = self.comparable(s_token, o_token)
-            if t_compare(s_token, o_token):
-                return True
-            elif t_compare(o_token, s_token):
-                return False
-        return l_compare(len(s_tokens), len(o_tokens))
-
-    @staticmethod
-    def __LT(x, y):
-        return x < y
-
-    @staticmethod
-    def __LE(x, y):
-        return x <= y
-
-    @staticmethod
-    def __GT(x, y):
-        return x > y
-
-    @staticmethod
-    def __GE(x, y):
-        return x >= y
+    @classmethod
+    def _token_key(cls, token):
+        if not token:
+            return (-1, 0, '', token)
+        m_digits = cls.RE_DIGITS.match(token)
+        if m_digits:
+            return (0, int(m_digits.group()), token[m_digits.end():], token)
+        else:
+            return (1, 0, token, token)
+
+    def __reduce__(self):
+        return (self.__class__, (str(self), ))
+
+    def _other_key(self, other):
+        if isinstance(other, Version):
+            return other.sort_key
+        elif isinstance(other, str):
+            return Version(other).sort_key
+        else:
+            return None
 
     def __lt__(self, other):
-        return self.__COMPARE(other, self.__LT, self.__LT)
+        other_key = self._other_key(other)
+        if other_key is None:
+            return NotImplemented
+        return self.sort_key < other_key
 
     def __le__(self, other):
-        return self.__COMPARE(other, self.__LT, self.__LE)
+        other_key = self._other_key(other)
+        if other_key is None:
+            return NotImplemented
+        return self.sort_key <= other_key
 
     def __gt__(self, other):
-        return self.__COMPARE(other, self.__GT, self.__GT)
+        other_key = self._other_key(other)
+        if other_key is None:
+            return NotImplemented
+        return self.sort_key > other_key
 
     def __ge__(self, other):
-        return self.__COMPARE(other, self.__GT, self.__GE)
+        other_key = self._other_key(other)
+        if other_key is None:
+            return NotImplemented
+        return self.sort_key >= other_key
 
 NULL_VERSION = Version('')
 
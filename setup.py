@@ -180,7 +180,8 @@ setup(
         ('shared/zapper/examples/wiki_suites/packages', glob.glob('examples/wiki_suites/packages/*.py')),
         ('shared/zapper/examples/wiki_subsuites/packages', glob.glob('examples/wiki_subsuites/packages/*.py')),
         ('shared/zapper/examples/wiki_models/packages', glob.glob('examples/wiki_models/packages/*.py')),
-        ('shared/zapper/examples/test_commands/packages', glob.glob('examples/test_commands/packages/*.py')),
+        ('shared/zapper/examples/test_commands/packages', glob.glob('examples/test_commands/packages/*.py') + glob.glob('examples/test_commands/packages/*.zap')),
+        ('shared/zapper/examples/declarative/packages', glob.glob('examples/declarative/packages/*.zap')),
 	('shared/zapper/tests', ['tests/test_commands']),
     ],
     cmdclass = {
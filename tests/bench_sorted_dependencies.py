@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+#
+# Copyright 2013 Simone Campagna
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+__author__ = 'Simone Campagna'
+
+"""Timing of sorted_dependencies on large random graphs; the original
+fixed-point implementation is timed too with --compare (on smaller
+graphs, since it is quadratic or worse)."""
+
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from test_sorted_dependencies import sorted_dependencies, fixed_point_dependency_levels, random_graph, random_dag
+
+
+def _time(function, *args, repeat=3):
+    t_min = None
+    for i in range(repeat):
+        t_start = time.perf_counter()
+        function(*args)
+        t_elapsed = time.perf_counter() - t_start
+        if t_min is None or t_elapsed < t_min:
+            t_min = t_elapsed
+    return t_min
+
+
+def main():
+    parser = argparse.ArgumentParser(description="sorted_dependencies benchmark")
+    parser.add_argument("--objects", "-n", type=int, default=10000, help="number of objects")
+    parser.add_argument("--edges-per-object", "-e", type=float, default=3.0, help="number of dependencies per object")
+    parser.add_argument("--seed", type=int, default=1, help="random seed")
+    parser.add_argument("--compare", action="store_true", default=False, help="time the fixed-point implementation too")
+    parser.add_argument("--max-time", type=float, default=None, help="fail if sorted_dependencies is slower (seconds)")
+    args = parser.parse_args()
+
+    rnd = random.Random(args.seed)
+    num_edges = int(args.objects * args.edges_per_object)
+    failed = False
+    for graph_name, make_graph in ('dag', random_dag), ('cyclic', random_graph):
+        objects, dependencies = make_graph(rnd, args.objects, num_edges)
+        t_new = _time(sorted_dependencies, dependencies, objects)
+        line = "{:8s} objects={} edges={}: sorted_dependencies {:.3f}s".format(graph_name, args.objects, num_edges, t_new)
+        if args.compare:
+            try:
+                t_old = _time(fixed_point_dependency_levels, dependencies, objects, repeat=1)
+                line += ", fixed point {:.3f}s".format(t_old)
+            except (KeyError, ValueError) as e:
+                line += ", fixed point failed ({})".format(e.__class__.__name__)
+        print(line)
+        if args.max_time is not None and t_new > args.max_time:
+            failed = True
+    if failed:
+        print("ERR: sorted_dependencies slower than {}s".format(args.max_time))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
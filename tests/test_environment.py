@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+#
+# Copyright 2013 Simone Campagna
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+__author__ = 'Simone Campagna'
+
+"""The items changed by the list/path operations are joined by var_get(),
+changeditems() and flush(); changes made through the dict interface drop
+them."""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'lib', 'python'))
+
+from zapper.environment import Environment
+
+
+class TestEnvironment(unittest.TestCase):
+    ORIG_VALUE = '/c:/a:/b'
+    VALUE = '/d:/c:/a:/b'
+
+    def _environment(self):
+        environment = Environment({'P': self.ORIG_VALUE, 'X': 'x'})
+        environment.path_prepend('P', '/d')
+        return environment
+
+    def test_var_get(self):
+        environment = self._environment()
+        self.assertEqual(environment.var_get('P'), self.VALUE)
+        self.assertEqual(environment['P'], self.VALUE)
+
+    def test_changeditems(self):
+        environment = self._environment()
+        self.assertEqual(dict(environment.changeditems()), {'P': self.VALUE})
+        self.assertEqual(environment['P'], self.VALUE)
+
+    def test_flush(self):
+        environment = self._environment()
+        self.assertEqual(environment['P'], self.ORIG_VALUE)
+        environment.flush()
+        self.assertEqual(environment['P'], self.VALUE)
+        self.assertEqual(dict(environment), {'P': self.VALUE, 'X': 'x'})
+
+    def test_list_operations(self):
+        environment = self._environment()
+        environment.path_append('P', '/e')
+        environment.path_remove('P', '/c')
+        self.assertEqual(environment.var_get('P'), '/d:/a:/b:/e')
+        environment.path_remove('P', '/d')
+        environment.path_remove('P', '/e')
+        environment.path_prepend('P', '/c')
+        self.assertEqual(environment.var_get('P'), self.ORIG_VALUE)
+        self.assertEqual(set(environment.changedkeys()), {'P'})
+
+    def test_duplicates(self):
+        environment = Environment({'P': '/a:/b:/a'})
+        environment.path_prepend('P', '/c')
+        self.assertEqual(environment.var_get('P'), '/c:/a:/b:/a')
+        environment.path_remove('P', '/c')
+        self.assertEqual(environment.var_get('P'), '/a:/b:/a')
+        environment.path_append('P', '/a')
+        self.assertEqual(environment.var_get('P'), '/b:/a')
+
+    def test_setitem(self):
+        environment = self._environment()
+        environment['P'] = '/f'
+        self.assertEqual(environment.var_get('P'), '/f')
+        environment.path_append('P', '/g')
+        self.assertEqual(environment.var_get('P'), '/f:/g')
+
+    def test_del(self):
+        environment = self._environment()
+        del environment['P']
+        self.assertEqual(environment.var_get('P'), None)
+        self.assertTrue('P' in set(environment.changedkeys()))
+
+    def test_pop(self):
+        environment = self._environment()
+        self.assertEqual(environment.pop('P'), self.ORIG_VALUE)
+        self.assertEqual(environment.var_get('P'), None)
+        environment['P'] = '/a'
+        environment.path_prepend('P', '/e')
+        self.assertEqual(environment.var_get('P'), '/e:/a')
+
+    def test_update(self):
+        environment = self._environment()
+        environment.update({'P': '/f'})
+        self.assertEqual(environment.var_get('P'), '/f')
+        environment.path_append('P', '/g')
+        self.assertEqual(environment.var_get('P'), '/f:/g')
+
+    def test_clear(self):
+        environment = self._environment()
+        environment.clear()
+        self.assertEqual(environment.var_get('P'), None)
+        self.assertEqual(len(environment), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+#
+# Copyright 2013 Simone Campagna
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+__author__ = 'Simone Campagna'
+
+"""Shared and exclusive locks, timeouts and lock counters. Each Lock opens
+the file again, so locks taken by the same process contend as the locks
+of different processes."""
+
+import os
+import sys
+import time
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'lib', 'python'))
+
+from zapper.lock_file import Lock, LOCK_STATS
+from zapper.errors import LockTimeoutError
+
+
+class TestLock(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.tmpdir.name, 'test.lock')
+        with open(self.filename, 'w'):
+            pass
+        LOCK_STATS.clear()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _release_later(self, lock, delay):
+        lock.__enter__()
+        def release():
+            time.sleep(delay)
+            lock.__exit__(None, None, None)
+        thread = threading.Thread(target=release)
+        thread.start()
+        return thread
+
+    def test_shared(self):
+        with Lock(self.filename, 'r'):
+            with Lock(self.filename, 'r', blocking=False):
+                pass
+        self.assertEqual(LOCK_STATS.shared, 2)
+        self.assertEqual(LOCK_STATS.exclusive, 0)
+        self.assertEqual(LOCK_STATS.contended, 0)
+
+    def test_exclusive(self):
+        with Lock(self.filename, 'r'):
+            with self.assertRaises(LockTimeoutError):
+                with Lock(self.filename, 'a', blocking=False):
+                    pass
+        with Lock(self.filename, 'a'):
+            with self.assertRaises(LockTimeoutError):
+                with Lock(self.filename, 'r', blocking=False):
+                    pass
+        self.assertEqual(LOCK_STATS.shared, 1)
+        self.assertEqual(LOCK_STATS.exclusive, 1)
+        self.assertEqual(LOCK_STATS.timeouts, 2)
+
+    def test_timeout(self):
+        with Lock(self.filename, 'a'):
+            t_start = time.monotonic()
+            with self.assertRaises(LockTimeoutError):
+                with Lock(self.filename, 'a', timeout=0.2):
+                    pass
+            self.assertGreaterEqual(time.monotonic() - t_start, 0.2)
+        self.assertEqual(LOCK_STATS.timeouts, 1)
+
+    def test_timeout_thread(self):
+        # signals are delivered to the main thread only: other threads poll
+        errors = []
+        def lock():
+            try:
+                with Lock(self.filename, 'a', timeout=0.2):
+                    pass
+            except LockTimeoutError as e:
+                errors.append(e)
+        with Lock(self.filename, 'a'):
+            thread = threading.Thread(target=lock)
+            thread.start()
+            thread.join()
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(LOCK_STATS.timeouts, 1)
+
+    def test_wait(self):
+        thread = self._release_later(Lock(self.filename, 'a'), 0.2)
+        try:
+            with Lock(self.filename, 'r', timeout=5):
+                pass
+        finally:
+            thread.join()
+        self.assertEqual(LOCK_STATS.contended, 1)
+        self.assertEqual(LOCK_STATS.timeouts, 0)
+        self.assertGreater(LOCK_STATS.wait_time, 0.1)
+        self.assertEqual(LOCK_STATS.max_wait_time, LOCK_STATS.wait_time)
+
+    def test_truncate(self):
+        with Lock(self.filename, 'w') as f:
+            f.write('abc')
+        thread = self._release_later(Lock(self.filename, 'r'), 0.2)
+        try:
+            # the file is truncated once the shared lock is released
+            with Lock(self.filename, 'w', timeout=5):
+                self.assertEqual(os.path.getsize(self.filename), 0)
+        finally:
+            thread.join()
+
+
+if __name__ == "__main__":
+    unittest.main()
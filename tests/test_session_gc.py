@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+#
+# Copyright 2013 Simone Campagna
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+__author__ = 'Simone Campagna'
+
+"""Session ages and stale sessions, with sessions owned by the current
+process (alive) or by no process."""
+
+import os
+import sys
+import time
+import socket
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'lib', 'python'))
+
+from zapper.session_gc import touch_session, get_session_age, is_session_stale, USE_TIME_RESOLUTION
+
+
+class TestSessionGc(unittest.TestCase):
+    OLD_TIME = '20000101 00:00:00'
+
+    def _session_config(self, owner_pid='', **session):
+        session.setdefault('creation_time', '')
+        session.setdefault('use_time', '')
+        session['owner_pid'] = owner_pid
+        session['owner_host'] = socket.gethostname()
+        return {'session': session}
+
+    def test_touch(self):
+        session_config = self._session_config()
+        now = time.time()
+        self.assertTrue(touch_session(session_config, now=now))
+        self.assertFalse(touch_session(session_config, now=now + USE_TIME_RESOLUTION / 2))
+        self.assertTrue(touch_session(session_config, now=now + USE_TIME_RESOLUTION + 1))
+
+    def test_age(self):
+        self.assertIsNone(get_session_age(self._session_config()))
+        session_config = self._session_config(creation_time=self.OLD_TIME)
+        self.assertGreater(get_session_age(session_config), 86400)
+        # the use time takes precedence over the creation time
+        touch_session(session_config)
+        self.assertLess(get_session_age(session_config), USE_TIME_RESOLUTION)
+
+    def test_owner_less(self):
+        session_config = self._session_config(creation_time=self.OLD_TIME)
+        self.assertFalse(is_session_stale(session_config))
+        self.assertTrue(is_session_stale(session_config, max_age=86400))
+        touch_session(session_config)
+        self.assertFalse(is_session_stale(session_config, max_age=86400))
+        # sessions without times are never collected
+        self.assertFalse(is_session_stale(self._session_config(), max_age=86400))
+
+    def test_min_age(self):
+        # no process has pid 0x7fffffff
+        session_config = self._session_config(owner_pid=str(0x7fffffff))
+        touch_session(session_config)
+        self.assertTrue(is_session_stale(session_config))
+        self.assertFalse(is_session_stale(session_config, min_age=3600))
+        session_config['session']['use_time'] = self.OLD_TIME
+        self.assertTrue(is_session_stale(session_config, min_age=3600))
+
+    def test_alive_owner(self):
+        session_config = self._session_config(owner_pid=str(os.getpid()), use_time=self.OLD_TIME)
+        self.assertFalse(is_session_stale(session_config, min_age=3600, max_age=3600))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+#
+# Copyright 2013 Simone Campagna
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+__author__ = 'Simone Campagna'
+
+"""Equivalence test of sorted_dependencies against the original fixed-point
+implementation, on random graphs with and without cycles."""
+
+import os
+import sys
+import random
+import unittest
+import collections
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'lib', 'python'))
+
+from zapper.utils.sorted_dependencies import sorted_dependencies
+
+
+def fixed_point_dependency_levels(dependencies, objects):
+    """fixed_point_dependency_levels(dependencies, objects) -> dict of levels
+The original implementation of sorted_dependencies, returning the levels;
+raises KeyError/ValueError for objects depending only on cycles"""
+    set_dependencies = collections.defaultdict(set)
+    for obj, lst in dependencies.items():
+        set_dependencies[obj] = set(lst)
+    dependencies = set_dependencies
+    for obj in objects:
+        if not obj in dependencies:
+            dependencies[obj] = set()
+    all_objects = set()
+    all_objects.update(dependencies.keys())
+    for obj_set in dependencies.values():
+        all_objects.update(obj_set)
+
+    # complete dependencies:
+    while True:
+        changed = False
+        for obj0 in list(dependencies.keys()):
+            obj0_deps = dependencies[obj0]
+            obj0_add_deps = set()
+            for obj1 in obj0_deps:
+                s = dependencies[obj1].difference(obj0_deps)
+                if s:
+                    obj0_add_deps.update(s)
+            if obj0_add_deps:
+                obj0_deps.update(obj0_add_deps)
+                changed = True
+        if not changed:
+            break
+
+    fixed_objects = set()
+    cycling_objects = set()
+    for obj in all_objects:
+        if obj in dependencies[obj]:
+            cycling_objects.add(obj)
+        else:
+            fixed_objects.add(obj)
+
+    dependency_level = {}
+    rem_objects = set(fixed_objects)
+    while rem_objects:
+        del_objects = set()
+        for obj in rem_objects:
+            if not dependencies[obj]:
+                dependency_level.setdefault(obj, 0)
+                del_objects.add(obj)
+                for obj0 in rem_objects:
+                    if obj in dependencies[obj0]:
+                        dependencies[obj0].discard(obj)
+                        dependency_level[obj0] = max(dependency_level.get(obj0, 0), dependency_level[obj] + 1)
+        if del_objects:
+            rem_objects.difference_update(del_objects)
+        else:
+            break
+
+    for obj0 in cycling_objects:
+        obj0_fixed_set = dependencies[obj0].intersection(fixed_objects)
+        dependency_level[obj0] = max(dependency_level[obj1] for obj1 in obj0_fixed_set) + 1
+
+    return {obj: dependency_level[obj] for obj in objects}
+
+
+def random_graph(rnd, num_objects, num_edges):
+    objects = list(range(num_objects))
+    dependencies = collections.OrderedDict()
+    for obj in objects:
+        if rnd.random() < 0.8:
+            dependencies[obj] = set()
+    for i in range(num_edges):
+        obj0 = rnd.choice(objects)
+        obj1 = rnd.choice(objects)
+        dependencies.setdefault(obj0, set()).add(obj1)
+    return objects, dependencies
+
+
+def has_cycle(dependencies):
+    visiting = set()
+    visited = set()
+    def visit(obj):
+        if obj in visiting:
+            return True
+        if obj in visited:
+            return False
+        visiting.add(obj)
+        for dep in dependencies.get(obj, ()):
+            if visit(dep):
+                return True
+        visiting.discard(obj)
+        visited.add(obj)
+        return False
+    return any(visit(obj) for obj in list(dependencies))
+
+
+def random_dag(rnd, num_objects, num_edges):
+    objects = list(range(num_objects))
+    dependencies = collections.OrderedDict((obj, set()) for obj in objects)
+    for i in range(num_edges):
+        obj0, obj1 = sorted(rnd.sample(objects, 2))
+        dependencies[obj1].add(obj0)
+    return objects, dependencies
+
+
+class TestSortedDependencies(unittest.TestCase):
+    NUM_GRAPHS = 2000
+
+    def _check(self, objects, dependencies):
+        try:
+            expected_levels = fixed_point_dependency_levels(dependencies, objects)
+        except (KeyError, ValueError):
+            # the original implementation fails on objects depending only
+            # on cycles
+            return False
+        sorted_objects = sorted_dependencies(dependencies, objects)
+        self.assertEqual(sorted_objects, sorted(objects, key=lambda obj: expected_levels[obj]))
+        self.assertEqual(sorted_dependencies(dependencies, objects, reverse=True),
+                         sorted(objects, key=lambda obj: expected_levels[obj], reverse=True))
+        return True
+
+    def test_examples(self):
+        self.assertEqual(sorted_dependencies({'a': ['b'], 'b': ['c']}), ['c', 'b', 'a'])
+        self.assertEqual(sorted_dependencies({'a': ['b', 'c'], 'b': ['c']}, ['a', 'b', 'c', 'd']), ['c', 'd', 'b', 'a'])
+        # a <-> b is a cycle depending on c
+        self.assertEqual(sorted_dependencies({'a': ['b', 'c'], 'b': ['a'], 'd': ['a']}, ['d', 'a', 'b', 'c']), ['c', 'd', 'a', 'b'])
+
+    def test_random_dags(self):
+        rnd = random.Random(1)
+        for i in range(self.NUM_GRAPHS):
+            num_objects = rnd.randint(2, 30)
+            objects, dependencies = random_dag(rnd, num_objects, rnd.randint(0, 2 * num_objects))
+            self.assertTrue(self._check(objects, dependencies))
+
+    def test_random_graphs(self):
+        rnd = random.Random(2)
+        num_checked = 0
+        num_cyclic = 0
+        for i in range(self.NUM_GRAPHS):
+            num_objects = rnd.randint(1, 30)
+            objects, dependencies = random_graph(rnd, num_objects, rnd.randint(0, 2 * num_objects))
+            if self._check(objects, dependencies):
+                num_checked += 1
+                if has_cycle(dependencies):
+                    num_cyclic += 1
+        # the comparison must cover graphs with cycles
+        self.assertGreater(num_checked, self.NUM_GRAPHS // 4)
+        self.assertGreater(num_cyclic, self.NUM_GRAPHS // 10)
+
+    def test_cycles_only(self):
+        # the original implementation fails here: all the objects get a
+        # level, and the result is deterministic
+        dependencies = {'a': ['b'], 'b': ['a'], 'c': ['a']}
+        self.assertEqual(sorted(sorted_dependencies(dependencies)), ['a', 'b', 'c'])
+        self.assertEqual(sorted_dependencies(dependencies), sorted_dependencies(dependencies))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+#
+# Copyright 2013 Simone Campagna
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+__author__ = 'Simone Campagna'
+
+"""The data translators write documents that their decode() reads back."""
+
+import io
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'lib', 'python'))
+
+from zapper.translators.data import JsonTranslator, Env0Translator, MarshalTranslator
+
+
+class TestDataTranslators(unittest.TestCase):
+    TRANSLATOR_CLASSES = (JsonTranslator, Env0Translator, MarshalTranslator)
+    VAR_DICT = {
+        'A': 'a',
+        'B': 'x=y:z w',
+        'C': 'è',
+        'D': None,
+        'E': '',
+    }
+
+    def _translator(self, translator_class):
+        translator = translator_class()
+        for var_name, var_value in self.VAR_DICT.items():
+            if var_value is None:
+                translator.var_unset(var_name)
+            else:
+                translator.var_set(var_name, var_value)
+        return translator
+
+    def test_encode_decode(self):
+        for translator_class in self.TRANSLATOR_CLASSES:
+            with self.subTest(translator=translator_class.__name__):
+                data = translator_class.encode(self.VAR_DICT)
+                self.assertEqual(dict(translator_class.decode(data)), self.VAR_DICT)
+
+    def test_unset(self):
+        for translator_class in self.TRANSLATOR_CLASSES:
+            with self.subTest(translator=translator_class.__name__):
+                data = translator_class.encode({'D': None})
+                self.assertEqual(dict(translator_class.decode(data)), {'D': None})
+
+    def test_text_stream(self):
+        # bytes are written to the buffer of a text stream
+        for translator_class in self.TRANSLATOR_CLASSES:
+            with self.subTest(translator=translator_class.__name__):
+                buffer = io.BytesIO()
+                stream = io.TextIOWrapper(buffer, encoding='utf-8')
+                self._translator(translator_class).translate(stream)
+                self.assertEqual(dict(translator_class.decode(buffer.getvalue())), self.VAR_DICT)
+
+    def test_binary_stream(self):
+        for translator_class in Env0Translator, MarshalTranslator:
+            with self.subTest(translator=translator_class.__name__):
+                stream = io.BytesIO()
+                self._translator(translator_class).translate(stream)
+                self.assertEqual(dict(translator_class.decode(stream.getvalue())), self.VAR_DICT)
+
+
+if __name__ == "__main__":
+    unittest.main()